@@ -1,26 +1,30 @@
 import os
 import sys
 import click
+import importlib.util
 import pathlib
-import subprocess
 import webbrowser
 
-from ..core.formatting import AnsiFormatter, HtmlFormatter, PostScriptFormatter
-from .util import do_typeset
+from ..core import cache
+from ..core.formatting import (
+    AnsiFormatter, HtmlFormatter, PdfFormatter, PostScriptFormatter
+)
+from ..core.formatting.formatter import compressed_extensions
+from .util import do_typeset, ps2pdf
 
 
 formatters = {
     "ansi": AnsiFormatter,
     "html": HtmlFormatter,
     "ps": PostScriptFormatter,
-    "pdf": PostScriptFormatter,
+    "pdf": PdfFormatter,
 }
 
 
 @click.command()
 @click.argument(
-    "markdown_file",
-    type=click.Path(exists=True), required=True)
+    "markdown_files",
+    type=click.Path(exists=True), required=True, nargs=-1)
 @click.option(
     "-t", "--to",
     type=click.Choice(formatters.keys()), required=True,
@@ -40,26 +44,98 @@ formatters = {
     is_flag=True, default=False,
     help="Produce only one long page."
 )
-def typeset(markdown_file, to, preview, do_open, linear):
-    """Typeset a markdown file into a book.
+@click.option(
+    "--no-cache", "no_cache",
+    is_flag=True, default=False,
+    help="Do not read or write cached intermediate results."
+)
+@click.option(
+    "--parser",
+    type=click.Choice(["pandoc", "python"]), default="pandoc",
+    help="Markdown parser, \"python\" does not need Pandoc "
+         "but only supports common syntax."
+)
+@click.option(
+    "-j", "--jobs",
+    type=click.IntRange(min=1), default=1,
+    help="Number of processes rendering chapters in parallel."
+)
+@click.option(
+    "--compress", "compression",
+    type=click.Choice(compressed_extensions.keys()), default=None,
+    help="Compress the output, with \"zstd\" needing the zstandard package."
+)
+@click.option(
+    "--ps2pdf", "use_ps2pdf",
+    is_flag=True, default=False,
+    help="Convert PostScript files to PDF with Ghostscript's ps2pdf, "
+         "instead of writing PDF files directly."
+)
+@click.option(
+    "--ps2pdf-jobs", "ps2pdf_jobs",
+    type=click.IntRange(min=1), default=None,
+    help="Number of ps2pdf processes converting ranges of pages "
+         "in parallel. Each range embeds its own copy of the fonts, "
+         "which makes the PDF file larger."
+)
+def typeset(
+    markdown_files, to, preview, do_open, linear, no_cache, parser, jobs,
+    compression, use_ps2pdf, ps2pdf_jobs
+):
+    """Typeset markdown files into books.
 
-    Saves the formatted book in the same directory as the input file.
+    Saves each formatted book in the same directory as its input file.
     """
-    filename = markdown_file.rsplit(".md", 1)[0]
+    if no_cache:
+        cache.configure(enable=False)
+
+    if preview and to == "pdf":
+        raise click.UsageError(
+            "Option --preview is not available with format 'pdf'")
+
+    if compression and to == "pdf":
+        raise click.UsageError(
+            "Option --compress is not available with format 'pdf'")
+
+    if compression == "zstd" and importlib.util.find_spec("zstandard") is None:
+        raise click.UsageError(
+            "Option --compress zstd needs the zstandard package")
+
+    if use_ps2pdf and to != "pdf":
+        raise click.UsageError("Option --ps2pdf is only for format 'pdf'")
+
+    if ps2pdf_jobs is not None and not use_ps2pdf:
+        raise click.UsageError("Option --ps2pdf-jobs needs --ps2pdf")
+
     formatter = formatters[to]
+    if use_ps2pdf:
+        formatter = PostScriptFormatter
 
-    if preview:
-        if to == "pdf":
-            raise click.UsageError(
-                "Option --preview is not available with format 'pdf'")
-        filename = sys.stdout
+    # All files are parsed by the same pandoc process
+    for markdown_file in markdown_files:
+        filename = markdown_file.rsplit(".md", 1)[0]
+        if preview:
+            filename = sys.stdout
 
-    do_typeset(markdown_file, formatter, filename, linear=linear)
+        written = do_typeset(
+            markdown_file, formatter, filename,
+            linear=linear, parser=parser, jobs=jobs, compression=compression
+        )
+        click.echo(
+            "%s: %.1f MB typeset and written in %.2fs (%.1f MB/s)" % (
+                markdown_file, written.size / 1024 / 1024, written.seconds,
+                written.speed / 1024 / 1024
+            ),
+            err=True
+        )
 
-    if to == "pdf":
-        subprocess.check_call(["ps2pdf", filename + ".ps", filename + ".pdf"])
+        if use_ps2pdf:
+            ps2pdf(filename, jobs=ps2pdf_jobs or 1)
 
-    if do_open and not preview:
-        path = os.path.abspath("%s.%s" % (filename, to))
-        uri = pathlib.Path(path).as_uri()
-        webbrowser.open(uri)
+        if do_open and not preview:
+            extension = to
+            if compression:
+                extension += "." + compressed_extensions[compression]
+            path = os.path.abspath("%s.%s" % (filename, extension))
+            uri = pathlib.Path(path).as_uri()
+            webbrowser.open(uri)
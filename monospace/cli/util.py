@@ -1,22 +1,85 @@
+import os
+import time
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
 from .. import core
-from ..core.formatting import PostScriptFormatter
+from ..core.formatting import PdfFormatter, PostScriptFormatter
+from ..core.formatting.pdf import merge_files
+from ..core.formatting.postscript import split_file
+from ..core.rendering import hyphenation
 from dataclasses import replace
+from typing import Set
 
 
-def do_typeset(markdown_file, formatter, output, linear=False):
-    if formatter == PostScriptFormatter:
+def do_typeset(
+    markdown_file, formatter, output, linear=False, parser="pandoc", jobs=1,
+    compression=None
+):
+    if formatter in (PdfFormatter, PostScriptFormatter):
         from ..core.symbols import characters
         characters.small_caps["Q"] = characters.small_cap_q
 
-    ast = core.parse(markdown_file)
-    settings, references, elements = core.process(ast, markdown_file)
-    blocks = core.render(elements, settings, references, formatter=formatter)
+    # The book flows through the whole pipeline one chapter, element,
+    # block or page at a time, and pages are written as soon as laid out
+    vocabulary: Set[str] = set()
+
+    def chunks():
+        for chunk in core.parse_chunks(markdown_file, parser=parser):
+            vocabulary.update(hyphenation.vocabulary(chunk))
+            yield chunk
+
+    settings, references, elements = core.process_chunks(
+        chunks(), markdown_file
+    )
+    hyphenation.get(settings.language).preload(vocabulary)
+    blocks = core.render(
+        elements, settings, references, formatter=formatter, jobs=jobs
+    )
     pages = core.layout(blocks, settings, formatter, linear=linear)
 
+    # Pages are laid out while they are written, except for linear books:
+    # time both from the layout, so that they report the same thing
+    start = time.perf_counter()
     if linear:
+        # The only page has to be laid out to know its height
+        pages = list(pages)
         settings = replace(
             settings,
             page_height=len(pages[0]) + settings.margin_bottom
         )
 
-    formatter.write_file(output, pages, settings)
+    written = formatter.write_file(
+        output, pages, settings, compression=compression
+    )
+    written.seconds = time.perf_counter() - start
+    hyphenation.save()
+    return written
+
+
+def ps2pdf(filename, jobs=1):
+    """Converts a PostScript file to PDF with Ghostscript's ps2pdf.
+
+    With more than one job, ranges of pages are converted in parallel
+    by as many processes, then merged.
+    """
+    if jobs == 1:
+        subprocess.check_call(["ps2pdf", filename + ".ps", filename + ".pdf"])
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        parts = split_file(filename + ".ps", jobs, directory)
+
+        # The merge needs tables of offsets, from PDF 1.4
+        def convert(part):
+            pdf = os.path.splitext(part)[0] + ".pdf"
+            subprocess.check_call(
+                ["ps2pdf", "-dCompatibilityLevel=1.4", part, pdf]
+            )
+            return pdf
+
+        with ThreadPoolExecutor(jobs) as executor:
+            pdfs = list(executor.map(convert, parts))
+        with open(filename + ".pdf", "wb") as f:
+            merge_files(pdfs, f)
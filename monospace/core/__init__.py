@@ -1,9 +1,11 @@
-from .parse import parse
-from .process import process
+from .parse import parse, parse_chunks
+from .process import process, process_chunks
 from .render import render
 from .layout import layout
 
-__all__ = ["parse", "process", "render", "layout"]
+__all__ = [
+    "parse", "parse_chunks", "process", "process_chunks", "render", "layout"
+]
 
 """Rendering pipeline for books
 
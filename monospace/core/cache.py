@@ -0,0 +1,164 @@
+"""Content-addressed on-disk caches
+
+Each cache is a directory of files named after the hash of everything
+that went into producing their content, so a stale entry can never be
+returned: changing any input changes the key.
+
+    ~/.cache/monospace/
+    ├── ast/
+    │   ├── 3f1c…e2
+    │   └── 9a07…41
+    └── …
+
+Caches are bounded in size. Reading an entry refreshes its modification
+time, and when a cache grows over its limit, the least recently used
+entries are deleted until it fits again.
+
+Entries are written to a temporary file and atomically moved in place,
+so concurrent builds can safely share a cache directory.
+"""
+
+import os
+import pickle
+import hashlib
+import tempfile
+from typing import Any, Optional
+
+enabled = True
+directory = os.environ.get(
+    "MONOSPACE_CACHE_DIR",
+    os.path.join(
+        os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")),
+        "monospace"
+    )
+)
+
+MB = 1024 * 1024
+
+
+def configure(enable: Optional[bool] = None, root: Optional[str] = None):
+    """Globally enable or disable caches, or move their root directory."""
+    global enabled, directory
+    if enable is not None:
+        enabled = enable
+    if root is not None:
+        directory = root
+
+
+def make_key(*parts: Any) -> str:
+    """Hashes all given parts into a single hexadecimal key.
+
+    Strings and bytes are hashed as is, anything else by its `repr`.
+    Parts are length-prefixed so that ("ab", "c") and ("a", "bc")
+    produce different keys.
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode("UTF-8")
+        elif not isinstance(part, bytes):
+            part = repr(part).encode("UTF-8")
+        digest.update(len(part).to_bytes(8, "little"))
+        digest.update(part)
+    return digest.hexdigest()
+
+
+class Cache(object):
+    """A named cache, stored in its own directory under the cache root.
+
+    Entries over `max_size` bytes in total get evicted. The serializer
+    is any module with `dumps` and `loads` functions: `pickle` by default,
+    `marshal` is faster for plain data such as Pandoc's AST.
+    """
+
+    def __init__(self, name: str, max_size: int, serializer=pickle) -> None:
+        self.name = name
+        self.max_size = max_size
+        self.serializer = serializer
+        self.size: Optional[int] = None
+
+    @property
+    def path(self) -> str:
+        return os.path.join(directory, self.name)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if not enabled:
+            return default
+
+        entry = os.path.join(self.path, key)
+        try:
+            with open(entry, "rb") as f:
+                value = self.serializer.loads(f.read())
+        except Exception:
+            # Unreadable or corrupt, or pickled by other versions of the
+            # code or libraries: the entry is missing, and gets rebuilt
+            return default
+
+        try:
+            # Mark entry as recently used
+            os.utime(entry)
+        except OSError:
+            pass
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        if not enabled:
+            return
+
+        data = self.serializer.dumps(value)
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=self.path, prefix=".")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, os.path.join(self.path, key))
+        except OSError:
+            # A cache that can't be written to is just a slower build
+            return
+
+        if self.size is None:
+            self.size = sum(size for _, size, _ in self.entries())
+        else:
+            self.size += len(data)
+
+        if self.size > self.max_size:
+            self.evict()
+
+    def evict(self) -> None:
+        """Deletes least recently used entries until the cache fits."""
+        entries = sorted(self.entries(), key=lambda entry: entry[2])
+        size = sum(size for _, size, _ in entries)
+        # Leave some room so that we don't evict on every write
+        target = self.max_size * 3 // 4
+        for path, entry_size, _ in entries:
+            if size <= target:
+                break
+            try:
+                os.remove(path)
+                size -= entry_size
+            except OSError:
+                pass
+        self.size = size
+
+    def clear(self) -> None:
+        for path, _, _ in self.entries():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self.size = 0
+
+    def entries(self):
+        """Yields (path, size, last use) for every entry of the cache."""
+        try:
+            scanned = list(os.scandir(self.path))
+        except OSError:
+            return
+        for entry in scanned:
+            if entry.name.startswith("."):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            yield entry.path, stat.st_size, stat.st_mtime
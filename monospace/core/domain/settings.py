@@ -17,6 +17,10 @@ class Settings:
     source_file: str
     light: bool
     github_anchors: bool
+    # Language of the hyphenation dictionary
+    language: str
+    # Colors of the terminal for ANSI output: 16, 256 or 2 ** 24
+    ansi_colors: int
 
     @property
     def page_width(self):
@@ -42,7 +46,9 @@ class Settings:
             margin_bottom=get(meta, "dimensions.margins.bottom", 5),
             source_file=source_file,
             light=get(meta, "light-theme", False),
-            github_anchors=get(meta, "github-anchors", False)
+            github_anchors=get(meta, "github-anchors", False),
+            language=get(meta, "lang", "en_US"),
+            ansi_colors=get(meta, "ansi-colors", 2 ** 24),
         )
 
 
@@ -1,6 +1,7 @@
-from .formatter import Formatter, FormatTag, Format
+from .formatter import Formatter, FormatTag, Format, Written, coalesce
 from .ansi import AnsiFormatter
 from .html import HtmlFormatter
+from .pdf import PdfFormatter
 from .postscript import PostScriptFormatter
 
 __all__ = [
@@ -9,5 +10,8 @@ __all__ = [
     "FormatTag",
     "Formatter",
     "HtmlFormatter",
+    "PdfFormatter",
     "PostScriptFormatter",
+    "Written",
+    "coalesce",
 ]
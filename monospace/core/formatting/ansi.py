@@ -1,8 +1,21 @@
-from typing import List, Union
+from functools import lru_cache
+from typing import Dict, List, Union
+
 from ..domain import Settings
 from .formatter import Formatter, FormatTag, Format as F
 
 
+@lru_cache(maxsize=None)
+def quantizer(colors: int):
+    """Finds the closest of the colors of terminals without truecolor,
+    in the xterm palette or its first 16 colors."""
+    from cursebox.palette import generate_xterm_256  # type: ignore
+    from ..rendering.quantize import Quantizer
+
+    xterm_256 = list(generate_xterm_256().values())
+    return Quantizer(xterm_256[:colors])
+
+
 def csi(params, end):
     return "\033[%s%s" % (";".join(str(p) for p in params), end)
 
@@ -13,8 +26,18 @@ def rgb(hexa):
     return int(hexa[:2], 16), int(hexa[2:4], 16), int(hexa[4:6], 16)
 
 
-def tag_color(tag, fg):
-    return csi([38 if fg else 48, 2, *rgb(tag.data["color"])], "m")
+def tag_color(tag, fg, settings):
+    color = rgb(tag.data["color"])
+    if settings.ansi_colors not in (16, 256):
+        return csi([38 if fg else 48, 2, *color], "m")
+
+    index = quantizer(settings.ansi_colors).closest_index(color)
+    if settings.ansi_colors == 256:
+        return csi([38 if fg else 48, 5, index], "m")
+    # Normal colors, then bright colors
+    if index < 8:
+        return csi([(30 if fg else 40) + index], "m")
+    return csi([(90 if fg else 100) + index - 8], "m")
 
 
 def reset_fg(settings):
@@ -30,11 +53,11 @@ def reset_bg(settings):
 
 
 def fg_sequence(tag, settings):
-    return tag_color(tag, fg=True) if tag.open else reset_fg(settings)
+    return tag_color(tag, True, settings) if tag.open else reset_fg(settings)
 
 
 def bg_sequence(tag, settings):
-    return tag_color(tag, fg=False) if tag.open else reset_bg(settings)
+    return tag_color(tag, False, settings) if tag.open else reset_bg(settings)
 
 
 codes = {
@@ -52,19 +75,34 @@ def get_code(tag, settings):
     return code[not tag.open]
 
 
+# Escape sequences of tags, by kind, opening, color and colors
+# of the terminal, and theme (for resetting colors)
+sequences: Dict[tuple, str] = {}
+# Photos have many colors, forget them all past this many
+max_sequences = 1 << 16
+
+
 class AnsiFormatter(Formatter):
     file_extension = "ansi"
 
     @staticmethod
     def format_tags(line: List[Union[FormatTag, str]], settings) -> str:
-        result = ""
+        light = settings.light
+        colors = settings.ansi_colors
+        result = []
         for elem in line:
             if isinstance(elem, str):
-                result += elem
-            else:
-                result += get_code(elem, settings)
-
-        return result
+                result.append(elem)
+                continue
+            key = (elem.kind, elem.open, elem.data.get("color"), colors, light)
+            code = sequences.get(key)
+            if code is None:
+                if len(sequences) > max_sequences:
+                    sequences.clear()
+                code = sequences[key] = get_code(elem, settings)
+            result.append(code)
+
+        return "".join(result)
 
     @staticmethod
     def begin_file(settings: Settings) -> str:
@@ -76,7 +114,11 @@ class AnsiFormatter(Formatter):
 
     @staticmethod
     def format_line(line: str, settings) -> str:
-        return reset_fg(settings) + reset_bg(settings) + line + csi([0], "m")
+        key = ("line", settings.light)
+        start = sequences.get(key)
+        if start is None:
+            start = sequences[key] = reset_fg(settings) + reset_bg(settings)
+        return start + line + "\033[0m"
 
     @staticmethod
     def end_page(settings: Settings) -> str:
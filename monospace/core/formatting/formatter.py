@@ -1,7 +1,10 @@
 import io
+import gzip
+import time
 from enum import Enum
+from contextlib import contextmanager
 from dataclasses import dataclass, field
-from typing import List, Union, Any, Dict
+from typing import List, Union, Any, Dict, IO, Iterable, Iterator, Optional
 from abc import ABCMeta, abstractmethod, abstractproperty
 
 from ..domain import Settings
@@ -25,29 +28,205 @@ class FormatTag:
         return FormatTag(kind=self.kind, open=False)
 
 
+def coalesce(
+    line: List[Union[FormatTag, str]]
+) -> List[Union[FormatTag, str]]:
+    """Returns the line without the tags that do not change its style.
+
+    Between two strings, tags that close and reopen the same styles, like
+    two neighbouring cells of an image with the same color, are replaced
+    by only the tags needed to go from the first style to the second.
+    """
+    result: List[Union[FormatTag, str]] = []
+    # Open tags, outermost first
+    opened: List[FormatTag] = []
+    run: List[FormatTag] = []
+
+    # The end of the line is marked with `None`
+    for elem in [*line, None]:
+        if isinstance(elem, FormatTag):
+            run.append(elem)
+            continue
+        if elem == "":
+            continue
+        if not run:
+            if elem is not None:
+                result.append(elem)
+            continue
+
+        styles = opened[:]
+        matched = True
+        for tag in run:
+            if tag.open:
+                styles.append(tag)
+                continue
+            for i in range(len(styles) - 1, -1, -1):
+                if styles[i].kind == tag.kind:
+                    del styles[i]
+                    break
+            else:
+                matched = False
+
+        if not matched:
+            # Closes a tag opened on another line, keep the tags as they are
+            result.extend(run)
+        else:
+            common = 0
+            for before, after in zip(opened, styles):
+                if before.kind != after.kind or before.data != after.data:
+                    break
+                common += 1
+            result.extend(tag.close_tag for tag in reversed(opened[common:]))
+            result.extend(styles[common:])
+
+        opened = styles
+        run = []
+        if elem is not None:
+            result.append(elem)
+
+    return result
+
+
+@dataclass
+class Written:
+    """How much was written by `Formatter.write_file`, before compression
+    (in characters for text streams), and how long writing took: from
+    formatting the first page to closing or flushing the output."""
+    size: int = 0
+    seconds: float = 0
+
+    @property
+    def speed(self) -> float:
+        """Bytes per second."""
+        return self.size / self.seconds if self.seconds else 0
+
+
+# Large enough for a few pages of images
+buffer_size = 1024 * 1024
+
+compressed_extensions = {"gzip": "gz", "zstd": "zst"}
+
+
+def is_binary(stream) -> bool:
+    """Tells whether a writable object takes bytes rather than text.
+
+    Objects that don't derive from the `io` classes nor have a `mode`
+    are written text to, like `print` does.
+    """
+    if isinstance(stream, (io.RawIOBase, io.BufferedIOBase)):
+        return True
+    if isinstance(stream, io.TextIOBase):
+        return False
+    mode = getattr(stream, "mode", None)
+    return isinstance(mode, str) and "b" in mode
+
+
+@contextmanager
+def output(path, extension, compression):
+    """Opens a file for writing a book, or uses a writable object.
+    Yields what to write to, and whether it takes bytes.
+
+    Text streams with an underlying binary buffer, like standard output,
+    are written to through that buffer. Objects only need a `write`
+    method, compressed output needs them to take bytes.
+    """
+    # Before opening anything, not to leave an empty file behind
+    if compression == "zstd":
+        try:
+            import zstandard  # type: ignore
+        except ImportError:
+            raise RuntimeError(
+                "Compressing with zstd needs the zstandard package"
+            )
+
+    owned = not hasattr(path, "write")
+    if not owned:
+        stream = path
+        if isinstance(stream, io.TextIOBase) and hasattr(stream, "buffer"):
+            stream.flush()
+            stream = stream.buffer
+    else:
+        filename = "%s.%s" % (path, extension)
+        if compression is not None:
+            filename += "." + compressed_extensions[compression]
+        stream = open(filename, "wb", buffering=buffer_size)
+
+    binary = owned or is_binary(stream)
+    if compression is not None and not binary:
+        raise TypeError("Compressed books can only be written in binary")
+
+    try:
+        if compression == "gzip":
+            with gzip.GzipFile(
+                fileobj=stream, mode="wb", compresslevel=6
+            ) as compressed:
+                yield compressed, True
+        elif compression == "zstd":
+            compressor = zstandard.ZstdCompressor()
+            with compressor.stream_writer(stream, closefd=False) as compressed:
+                yield compressed, True
+        else:
+            yield stream, binary
+    finally:
+        if owned:
+            stream.close()
+        else:
+            flush = getattr(stream, "flush", None)
+            if flush is not None:
+                flush()
+
+
 class Formatter(metaclass=ABCMeta):
     """A suite of static methods for formatting a file in a given format."""
 
     @classmethod
-    def write_file(cls, path: str, pages: List[List[str]], settings: Settings):
-        def do_write(f):
-            def w(s):
-                f.write(s)
-                f.write("\n")
-
-            w(cls.begin_file(settings))
-            for page in pages:
-                w(cls.begin_page(settings))
-                for line in page:
-                    w(cls.format_line(line, settings))
-                w(cls.end_page(settings))
-            w(cls.end_file(settings))
-
-        if isinstance(path, io.IOBase):
-            do_write(path)
-        else:
-            with open("%s.%s" % (path, cls.file_extension), "w") as f:
-                do_write(f)
+    def write_file(
+        cls,
+        path: Union[str, IO],
+        pages: Iterable[List[str]],
+        settings: Settings,
+        compression: Optional[str] = None,
+    ) -> "Written":
+        """Writes pages to a file named after `path` and this format,
+        or to any writable file-like object, like standard output.
+
+        Pages are written one at a time, each with a single write. Output
+        can be compressed with "gzip" or "zstd", which adds ".gz" or
+        ".zst" to the name of the file.
+        """
+        written = Written()
+        start = time.perf_counter()
+        with output(path, cls.file_extension, compression) as (f, binary):
+            def w(text):
+                text += "\n"
+                data = text.encode("UTF-8") if binary else text
+                f.write(data)
+                written.size += len(data)
+
+            for part in cls.file_parts(pages, settings):
+                w(part)
+
+        written.seconds = time.perf_counter() - start
+        return written
+
+    @classmethod
+    def file_parts(
+        cls, pages: Iterable[List[str]], settings: Settings
+    ) -> Iterator[str]:
+        """Yields the beginning of the file, each formatted page,
+        then the end of the file."""
+        yield cls.begin_file(settings)
+        for page in pages:
+            yield cls.format_page(page, settings)
+        yield cls.end_file(settings)
+
+    @classmethod
+    def format_page(cls, page: List[str], settings: Settings) -> str:
+        return "\n".join([
+            cls.begin_page(settings),
+            *(cls.format_line(line, settings) for line in page),
+            cls.end_page(settings),
+        ])
 
     @staticmethod
     @abstractmethod
@@ -1,4 +1,4 @@
-import cgi
+import html
 from typing import List, Union
 from .formatter import Formatter, FormatTag, Format as F
 from ..domain import Settings
@@ -54,7 +54,7 @@ class HtmlFormatter(Formatter):
         result = ""
         for elem in line:
             if isinstance(elem, str):
-                result += cgi.escape(elem)
+                result += html.escape(elem, quote=False)
             else:
                 if elem.kind not in black_list:
                     result += tag(elem)
@@ -0,0 +1,571 @@
+"""PDF files written directly, on the grid of the PostScript template
+
+Text is shown with the same Iosevka fonts as PostScript files, as CID
+fonts where codes are glyph indices: glyphs have their own widths, one
+cell for most, two for some symbols and none for combining marks.
+Background colors are drawn as boxes of a Type 3 font before the text
+they are behind, so that everything on a line is text, and pieces of
+lines formatted separately are drawn one after the other. Boxes are
+drawn as pages are written, since a background can be opened by one
+piece of a line and be behind the text of the next ones.
+
+Pages are written as soon as they are formatted, with compressed
+content streams, where the characters of strings are replaced by the
+indices of their glyphs. Fonts are written once at the end of the file, with
+only the glyphs used by the pages.
+"""
+
+import re
+import time
+import zlib
+import struct
+from functools import lru_cache
+from typing import Dict, IO, Iterable, List, Optional, Set, Tuple, Union
+
+from .formatter import Formatter, FormatTag, Format as F, Written, output
+from .postscript import escaped, font, font_files, font_styles, glyph_name
+from .postscript import reverse_glyph_names, sanitize
+from ..domain import Settings
+
+# As in the PostScript template: characters are 10 points high, cells
+# half as wide, and lines 1.25 times as high
+font_size = 10
+cell_width = font_size / 2
+line_height = font_size * 1.25
+# Advance of glyphs, in thousandths of the font size
+advance = 500
+
+# Binary characters in a comment tell that the file is binary
+header = "%PDF-1.4\n%âãÏÓ"
+
+# One glyph, a box drawn in the fill color over a whole cell, and a bit
+# more to avoid gaps, like the backgrounds of the PostScript template
+box_glyph = "500 0 0 -274 510 989 d1 0 -274 510 1263 re f"
+
+
+def rgb(hexa: str) -> str:
+    if hexa[0] == "#":
+        hexa = hexa[1:]
+    return " ".join(
+        "%.4g" % (int(hexa[i:i + 2], 16) / 255) for i in (0, 2, 4)
+    )
+
+
+def color(hexa: str) -> str:
+    return "%s rg" % rgb(hexa)
+
+
+def reset_color(settings):
+    return "0 g" if settings.light else "1 g"
+
+
+# Font selections, strings shown, fill colors and background colors,
+# in formatted lines
+shown = re.compile(
+    r"/(f[RIBO]) \d+ Tf"
+    r"|\(((?:[^\\()]|\\.)*)\) Tj"
+    r"|\b([\d.]+ [\d.]+ [\d.]+ rg|[\d.]+ g)\b"
+    r"|\b([\d.]+ [\d.]+ [\d.]+|null) bg ?"
+)
+
+
+def encode(content: str, glyphs: Dict[str, Dict[str, int]]) -> str:
+    """Returns the content of a page with the characters of its strings
+    replaced by their codes, the indices of their glyphs in hexadecimal,
+    and boxes drawn behind the strings with a background color.
+
+    The font, fill color and background color are kept from one piece of
+    a line to the next, like in PostScript files, since tags opened by a
+    piece can be closed by another one.
+
+    `glyphs` has the index of each character shown so far with each font
+    selection, and gets the characters of the page.
+    """
+    selection = "fR"
+    fill = ""
+    background: Optional[str] = None
+
+    def replace(match):
+        nonlocal selection, fill, background
+        name, text, fill_color, box_color = match.groups()
+        if name:
+            selection = name
+            return match.group()
+        if fill_color:
+            fill = fill_color
+            return match.group()
+        if box_color:
+            background = None if box_color == "null" else box_color
+            return ""
+        indices = glyphs[selection]
+        codes = []
+        width = 0
+        for character in escaped.sub(r"\1", text):
+            index = indices.get(character)
+            if index is None:
+                index = indices[character] = font(selection).glyphs[
+                    glyph_name(selection, character)
+                ]
+            codes.append("%04X" % index)
+            width += widths(selection).get(index, advance)
+        result = "<%s> Tj" % "".join(codes)
+        if background is None:
+            return result
+
+        # Boxes behind the text, then back to where they start. As
+        # artifacts, they are not copied with the text
+        return (
+            "/Artifact BMC %s rg /bx %d Tf <%s> Tj [%d] TJ EMC"
+            " %s /%s %d Tf %s" % (
+                background, font_size, "01" * (width // advance),
+                width, fill, selection, font_size, result
+            )
+        )
+
+    return shown.sub(replace, content)
+
+
+@lru_cache(maxsize=None)
+def widths(selection: str) -> Dict[int, int]:
+    """Returns the advance of the glyphs of a font selection that are not
+    one cell wide, in thousandths of the font size, like `glyphshow`
+    moves by in PostScript files."""
+    source = font(selection)
+    units = 1000 / struct.unpack(">H", source.tables[b"head"][18:20])[0]
+    count = struct.unpack(">H", source.tables[b"hhea"][34:36])[0]
+    hmtx = source.tables[b"hmtx"]
+    metrics = struct.unpack(">%dH" % (count * 2), hmtx[:count * 4])[::2]
+    # Glyphs after the last metrics have its advance
+    last = round(metrics[-1] * units)
+    return {
+        index: width for index, width in (
+            (index, round(metrics[index] * units) if index < count else last)
+            for index in source.glyphs.values()
+        ) if width != advance
+    }
+
+
+@lru_cache(maxsize=None)
+def glyph_characters(selection: str) -> Dict[int, str]:
+    """Returns the character of each glyph of a font selection, for
+    copying text from PDF files."""
+    codes = {
+        name: code
+        for code, names in reverse_glyph_names().items() for name in names
+    }
+    characters: Dict[int, str] = {}
+    for name, index in font(selection).glyphs.items():
+        if re.match(r"uni[0-9A-F]{4}$", name):
+            code: Optional[int] = int(name[3:], 16)
+        elif re.match(r"u[0-9A-F]{5,6}$", name):
+            code = int(name[1:], 16)
+        else:
+            code = codes.get(name)
+        if code is not None and index not in characters:
+            characters[index] = chr(code)
+    return characters
+
+
+class PdfFormatter(Formatter):
+    file_extension = "pdf"
+
+    @staticmethod
+    def format_tags(line: List[Union[FormatTag, str]], settings) -> str:
+        # Regular font. Colors are kept from previous pieces of the line,
+        # boxes behind text with a background are drawn by `encode`
+        result = ["/fR %d Tf" % font_size]
+        current_font_styles: Set[F] = set()
+
+        for elem in line:
+            if isinstance(elem, str):
+                if elem:
+                    result.append("(%s) Tj" % sanitize(elem))
+                continue
+
+            tag = elem
+            if tag.kind == F.ForegroundColor:
+                if tag.open:
+                    result.append(color(tag.data["color"]))
+                else:
+                    result.append(reset_color(settings))
+
+            elif tag.kind == F.BackgroundColor:
+                if tag.open:
+                    result.append("%s bg" % rgb(tag.data["color"]))
+                else:
+                    result.append("null bg")
+
+            elif tag.kind in (F.Bold, F.Italic):
+                if tag.open:
+                    current_font_styles.add(tag.kind)
+                else:
+                    current_font_styles.remove(tag.kind)
+                key = tuple(sorted(current_font_styles, key=lambda f: f.name))
+                selection = font_styles[key]
+                result.append("/%s %d Tf" % (selection, font_size))
+
+        return " ".join(result)
+
+    @staticmethod
+    def begin_file(settings: Settings) -> str:
+        return header
+
+    @staticmethod
+    def begin_page(settings: Settings) -> str:
+        width = settings.page_width * cell_width
+        height = settings.page_height * line_height
+        result = ""
+        if not settings.light:
+            result += "0 g -1 -1 %g %g re f\n" % (width + 2, height + 2)
+        # First baseline, as in the PostScript template
+        return result + "BT %g TL 0 %g Td" % (
+            line_height, height - line_height * 0.8
+        )
+
+    @staticmethod
+    def format_line(line: str, settings) -> str:
+        return "%s %s T*" % (reset_color(settings), line)
+
+    @staticmethod
+    def end_page(settings: Settings) -> str:
+        return "ET"
+
+    @staticmethod
+    def end_file(settings: Settings) -> str:
+        return "%%EOF"
+
+    @classmethod
+    def write_file(
+        cls,
+        path: Union[str, IO],
+        pages: Iterable[List[str]],
+        settings: Settings,
+        compression: Optional[str] = None,
+    ) -> Written:
+        """Writes pages to a PDF file named after `path`, or to any binary
+        file-like object.
+
+        Each page is written as soon as it is formatted. Fonts come last,
+        with only the glyphs used by the pages.
+        """
+        written = Written()
+        start = time.perf_counter()
+        with output(path, cls.file_extension, compression) as (f, binary):
+            if not binary:
+                raise TypeError("PDF files can only be written in binary")
+            document = Document(f, written)
+            document.write(
+                ("%s\n" % cls.begin_file(settings)).encode("latin-1")
+            )
+
+            catalog = document.reserve()
+            page_tree = document.reserve()
+            resources = document.reserve()
+            kids = []
+            media_box = "[0 0 %g %g]" % (
+                settings.page_width * cell_width,
+                settings.page_height * line_height,
+            )
+
+            for page in pages:
+                content = encode(
+                    cls.format_page(page, settings), document.glyphs
+                )
+                contents = document.add_stream(
+                    b"", zlib.compress(content.encode("ascii"))
+                )
+                kids.append(document.add(
+                    "<< /Type /Page /Parent %d 0 R /MediaBox %s"
+                    " /Resources %d 0 R /Contents %d 0 R >>" % (
+                        page_tree, media_box, resources, contents
+                    )
+                ))
+
+            fonts = {
+                selection: add_font(document, selection, set(indices.values()))
+                for selection, indices in document.glyphs.items() if indices
+            }
+            fonts["bx"] = add_box_font(document)
+            document.add("<< /Font << %s >> >>" % " ".join(
+                "/%s %d 0 R" % item for item in fonts.items()
+            ), resources)
+            document.add("<< /Type /Pages /Kids [%s] /Count %d >>" % (
+                " ".join("%d 0 R" % kid for kid in kids), len(kids)
+            ), page_tree)
+            document.add(
+                "<< /Type /Catalog /Pages %d 0 R >>" % page_tree, catalog
+            )
+            document.end(catalog)
+            document.write(("%s\n" % cls.end_file(settings)).encode())
+
+        written.seconds = time.perf_counter() - start
+        return written
+
+
+class Document(object):
+    """Objects of a PDF file, written as soon as they are added."""
+
+    def __init__(self, stream, written: Written):
+        self.stream = stream
+        self.written = written
+        self.offsets: Dict[int, int] = {}
+        self.count = 0
+        # Index of the glyph of each character shown, by font selection
+        self.glyphs: Dict[str, Dict[str, int]] = {
+            name: {} for name in font_files
+        }
+
+    def write(self, data: bytes):
+        self.stream.write(data)
+        self.written.size += len(data)
+
+    def reserve(self) -> int:
+        """Returns the number of an object to add later."""
+        self.count += 1
+        return self.count
+
+    def add(self, body: str, number: Optional[int] = None) -> int:
+        return self.add_object(body.encode("latin-1"), number)
+
+    def add_object(self, body: bytes, number: Optional[int] = None) -> int:
+        if number is None:
+            number = self.reserve()
+        self.offsets[number] = self.written.size
+        self.write(b"%d 0 obj\n%s\nendobj\n" % (number, body))
+        return number
+
+    def add_stream(self, entries: bytes, data: bytes) -> int:
+        """Adds a stream compressed with zlib, with more entries
+        for its dictionary."""
+        return self.add_object(
+            b"<< /Length %d /Filter /FlateDecode %s>>\nstream\n%s\nendstream"
+            % (len(data), entries, data)
+        )
+
+    def end(self, root: int):
+        """Writes the table of the objects' offsets, and the trailer."""
+        start = self.written.size
+        self.write(b"xref\n0 %d\n0000000000 65535 f \n" % (self.count + 1))
+        # Numbers of objects that were never added are free
+        self.write(b"".join(
+            b"%010d 00000 n \n" % self.offsets[number]
+            if number in self.offsets else b"0000000000 65535 f \n"
+            for number in range(1, self.count + 1)
+        ))
+        self.write(b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n"
+                   % (self.count + 1, root, start))
+
+
+def add_font(document: Document, selection: str, glyphs: Set[int]) -> int:
+    """Adds a font selection, with only the given glyphs, and returns
+    its number."""
+    source = font(selection)
+    head = source.tables[b"head"]
+    units = 1000 / struct.unpack(">H", head[18:20])[0]
+    box = [round(v * units) for v in struct.unpack(">hhhh", head[36:44])]
+    ascent, descent = struct.unpack(">hh", source.tables[b"hhea"][4:8])
+    italic_angle = float(
+        re.findall(r"/ItalicAngle (\S+) def", source.header)[0]
+    )
+    name = re.findall(r"/FontName /(\S+) def", source.header)[0]
+    # Subsets are named after the glyphs they have
+    digest = zlib.crc32(repr(sorted(glyphs)).encode())
+    tag = "".join(chr(ord("A") + (digest >> i & 15)) for i in range(0, 24, 4))
+
+    truetype = source.truetype(glyphs)
+    font_file = document.add_stream(
+        b"/Length1 %d " % len(truetype), zlib.compress(truetype)
+    )
+    # Fixed pitch, symbolic, and italic
+    flags = 1 | 4 | (64 if italic_angle else 0)
+    descriptor = document.add(
+        "<< /Type /FontDescriptor /FontName /%s+%s /Flags %d"
+        " /FontBBox [%s] /ItalicAngle %g /Ascent %d /Descent %d"
+        " /CapHeight %d /StemV 80 /FontFile2 %d 0 R >>" % (
+            tag, name, flags, " ".join(str(v) for v in box), italic_angle,
+            ascent * units, descent * units, ascent * units, font_file
+        )
+    )
+    # Glyphs that are not one cell wide, like circled numbers and
+    # combining marks, keep their own advance
+    exceptions = widths(selection)
+    cid_font = document.add(
+        "<< /Type /Font /Subtype /CIDFontType2 /BaseFont /%s+%s"
+        " /CIDSystemInfo << /Registry (Adobe) /Ordering (Identity)"
+        " /Supplement 0 >> /FontDescriptor %d 0 R /DW %d /W [%s]"
+        " /CIDToGIDMap /Identity >>" % (
+            tag, name, descriptor, advance, " ".join(
+                "%d [%d]" % (index, exceptions[index])
+                for index in sorted(glyphs) if index in exceptions
+            )
+        )
+    )
+    characters = glyph_characters(selection)
+    to_unicode = add_unicode_map(document, [
+        "<%04X> <%s>" % (index, characters[index].encode("utf-16-be").hex())
+        for index in sorted(glyphs) if index in characters
+    ], "<0000> <FFFF>")
+    return document.add(
+        "<< /Type /Font /Subtype /Type0 /BaseFont /%s+%s"
+        " /Encoding /Identity-H /DescendantFonts [%d 0 R]"
+        " /ToUnicode %d 0 R >>" % (tag, name, cid_font, to_unicode)
+    )
+
+
+def unicode_map(pairs: List[str], code_space: str) -> str:
+    """Returns the CMap giving the characters of codes, from pairs of
+    a code and UTF-16 characters, both in hexadecimal."""
+    # At most 100 characters per section
+    sections = [
+        "%d beginbfchar\n%s\nendbfchar" % (
+            len(pairs[i:i + 100]), "\n".join(pairs[i:i + 100])
+        )
+        for i in range(0, len(pairs), 100)
+    ]
+    return "\n".join([
+        "/CIDInit /ProcSet findresource begin",
+        "12 dict begin",
+        "begincmap",
+        "/CIDSystemInfo << /Registry (Adobe) /Ordering (UCS)"
+        " /Supplement 0 >> def",
+        "/CMapName /Adobe-Identity-UCS def",
+        "/CMapType 2 def",
+        "1 begincodespacerange",
+        code_space,
+        "endcodespacerange",
+        *sections,
+        "endcmap",
+        "CMapName currentdict /CMap defineresource pop",
+        "end",
+        "end",
+    ])
+
+
+def add_unicode_map(document: Document, pairs: List[str], code_space: str):
+    return document.add_stream(b"", zlib.compress(
+        unicode_map(pairs, code_space).encode("ascii")
+    ))
+
+
+def add_box_font(document: Document) -> int:
+    box = document.add_stream(b"", zlib.compress(box_glyph.encode()))
+    # Boxes have no text
+    to_unicode = add_unicode_map(document, ["<01> <>"], "<00> <FF>")
+    return document.add(
+        "<< /Type /Font /Subtype /Type3 /FontBBox [0 -274 510 989]"
+        " /FontMatrix [0.001 0 0 0.001 0 0] /CharProcs << /box %d 0 R >>"
+        " /Encoding << /Type /Encoding /Differences [1 /box] >>"
+        " /FirstChar 1 /LastChar 1 /Widths [%d] /Resources << >>"
+        " /ToUnicode %d 0 R >>" % (box, advance, to_unicode)
+    )
+
+
+def merge_files(paths: List[str], stream: IO) -> Written:
+    """Writes the pages of PDF files, one file after the other, to a
+    binary file-like object, as a single PDF file.
+
+    Files must have a table of offsets, not a cross-reference stream, as
+    written by Ghostscript with `-dCompatibilityLevel=1.4`. Their objects
+    are all copied, only renumbered, and their pages moved to the same
+    page tree. Attributes that pages inherit from their tree are lost,
+    and fonts are not shared: each file keeps its own.
+    """
+    written = Written()
+    start = time.perf_counter()
+    document = Document(stream, written)
+    document.write(("%s\n" % header).encode("latin-1"))
+    catalog = document.reserve()
+    page_tree = document.reserve()
+    kids: List[int] = []
+
+    for path in paths:
+        with open(path, "rb") as f:
+            objects, root = read_objects(f.read())
+        first = document.count
+        document.count += max(objects)
+
+        def renumber(match):
+            return b"%d 0 R" % (int(match.group(1)) + first)
+
+        pages = page_numbers(objects, root)
+        page_set = set(pages)
+        for number, (entries, data) in objects.items():
+            entries = reference.sub(renumber, entries)
+            if number in page_set:
+                entries = parent.sub(b"/Parent %d 0 R" % page_tree, entries)
+            if data is not None:
+                entries += b"\nstream\n" + data + b"\nendstream"
+            document.add_object(entries, number + first)
+        kids.extend(number + first for number in pages)
+
+    document.add("<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        " ".join("%d 0 R" % kid for kid in kids), len(kids)
+    ), page_tree)
+    document.add("<< /Type /Catalog /Pages %d 0 R >>" % page_tree, catalog)
+    document.end(catalog)
+    document.write(b"%%EOF\n")
+    stream.flush()
+    written.seconds = time.perf_counter() - start
+    return written
+
+
+reference = re.compile(rb"\b(\d+) \d+ R\b")
+parent = re.compile(rb"/Parent \d+ 0 R")
+stream_or_end = re.compile(rb"\bstream\r?\n|\bendobj")
+
+
+def read_objects(data: bytes):
+    """Returns the objects of a PDF file by number, each as its
+    dictionary (or value) and the data of its stream, or None, along
+    with the number of the file's catalog."""
+    start = int(data[data.rindex(b"startxref") + 9:].split()[0])
+    end = data.index(b"trailer", start)
+    if not data[start:].startswith(b"xref"):
+        raise ValueError("PDF files to merge need a table of offsets")
+
+    offsets = {}
+    section = data[start + 4:end].split()
+    i = 0
+    while i < len(section):
+        first, count = int(section[i]), int(section[i + 1])
+        for j in range(count):
+            entry = section[i + 2 + j * 3:i + 5 + j * 3]
+            if entry[2] == b"n":
+                offsets[first + j] = int(entry[0])
+        i += 2 + count * 3
+    root = int(re.findall(rb"/Root (\d+) \d+ R", data[end:])[0])
+
+    objects: Dict[int, Tuple[bytes, Optional[bytes]]] = {}
+    for number, offset in offsets.items():
+        body = data.index(b"obj", offset) + 3
+        stream = stream_or_end.search(data, body)
+        if stream is None:
+            raise ValueError("Object %d of a PDF file is unfinished" % number)
+        entries = data[body:stream.start()].strip()
+        content = None
+        if stream.group().startswith(b"stream"):
+            length = re.findall(rb"/Length (\d+)( \d+ R)?", entries)[0]
+            size = int(length[0])
+            if length[1]:
+                # The length is another object
+                value = data.index(b"obj", offsets[size]) + 3
+                size = int(data[value:value + 32].split()[0])
+            content = data[stream.end():stream.end() + size]
+        objects[number] = (entries, content)
+    return objects, root
+
+
+def page_numbers(objects, root: int) -> List[int]:
+    """Returns the numbers of the page objects of a PDF file, in order."""
+    def children(number):
+        entries = objects[number][0]
+        kids = re.findall(rb"/Kids\s*\[([^\]]*)\]", entries)
+        if not kids:
+            return [number]
+        return [
+            page for kid in reference.findall(kids[0])
+            for page in children(int(kid))
+        ]
+
+    pages = re.findall(rb"/Pages (\d+) \d+ R", objects[root][0])[0]
+    return children(int(pages))
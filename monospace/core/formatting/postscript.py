@@ -1,24 +1,113 @@
-import pkg_resources
-from jinja2 import Template
-from typing import List, Union, Set
+import os
+import re
+import tempfile
+from collections import Counter
+from functools import lru_cache
+from typing import (
+    Dict, Iterable, Iterator, List, Optional, Union, Set, Tuple
+)
 from .formatter import Formatter, FormatTag, Format as F
+from .type42 import Type42Font
 from ..domain import Settings
 
 
 def get_file(name):
-    return pkg_resources.resource_string(__name__, name).decode("UTF-8")
+    import pkgutil
+    return pkgutil.get_data(__name__, name).decode("UTF-8")
 
 
-template = Template(get_file("postscript_template.ps"))
+# Fonts and templates are only read when a PostScript file is started
+@lru_cache(maxsize=None)
+def template():
+    from jinja2 import Template
+    return Template(get_file("postscript_template.ps"))
 
-fonts = "\n".join([
-    get_file("iosevka-plus-regular.t42"),
-    get_file("iosevka-plus-italic.t42"),
-    get_file("iosevka-plus-bold.t42"),
-    get_file("iosevka-plus-bold-italic.t42"),
-])
 
-reverse_glyphs = get_file("reverse_glyphs.ps")
+# Font of each style selection, in the order they are defined
+font_files = {
+    "fR": "iosevka-plus-regular.t42",
+    "fI": "iosevka-plus-italic.t42",
+    "fB": "iosevka-plus-bold.t42",
+    "fO": "iosevka-plus-bold-italic.t42",
+}
+
+
+@lru_cache(maxsize=None)
+def fonts():
+    return "\n".join(get_file(name) for name in font_files.values())
+
+
+@lru_cache(maxsize=None)
+def font(selection: str) -> Type42Font:
+    return Type42Font(get_file(font_files[selection]))
+
+
+@lru_cache(maxsize=None)
+def reverse_glyphs():
+    return get_file("reverse_glyphs.ps")
+
+
+@lru_cache(maxsize=None)
+def reverse_glyph_names() -> Dict[int, List[str]]:
+    """Returns the glyph names `ushow` tries for each code point,
+    after its "uniXXXX" name."""
+    return {
+        int(code, 16): names.strip("[ ]").lstrip("/").split("/")
+        for code, names in re.findall(
+            r"^    16#([0-9A-F]+) (.*)$", reverse_glyphs(), re.M
+        )
+    }
+
+
+def glyph_name(selection: str, character: str) -> str:
+    """Returns the name of the glyph `ushow` shows for a character,
+    which is `.notdef` for characters missing from the font."""
+    code = ord(character)
+    uniname = "uni%04X" % code if code <= 0xFFFF else "u%X" % code
+    glyphs = font(selection).glyphs
+    for name in [uniname, *reverse_glyph_names().get(code, [])]:
+        if name in glyphs:
+            return name
+    return ".notdef"
+
+
+# Strings shown, and font selections, in formatted lines
+shown = re.compile(r"\(((?:[^\\()]|\\.)*)\)|\b(f[RIBO])\b")
+escaped = re.compile(r"\\(.)")
+
+
+def used_characters(pages: Iterable[str]) -> Dict[str, Set[str]]:
+    """Returns the characters shown with each font selection
+    in formatted pages."""
+    characters: Dict[str, Set[str]] = {name: set() for name in font_files}
+    for page in pages:
+        selection = "fR"
+        for string, name in shown.findall(page):
+            if name:
+                selection = name
+            else:
+                characters[selection].update(escaped.sub(r"\1", string))
+    return characters
+
+
+def subset_fonts(characters: Dict[str, Set[str]]) -> str:
+    return "\n".join(
+        font(selection).subset(
+            glyph_name(selection, character) for character in used
+        )
+        for selection, used in characters.items()
+    )
+
+
+def subset_reverse_glyphs(characters: Dict[str, Set[str]]) -> str:
+    """Returns the reverse glyph list, with only the code points of the
+    characters used."""
+    codes = set("%04X" % ord(c) for used in characters.values() for c in used)
+    return "\n".join(
+        line for line in reverse_glyphs().split("\n")
+        if not line.startswith("    16#") or line[7:].split(" ")[0] in codes
+    )
+
 
 font_styles = {
     (): "fR",
@@ -38,64 +127,113 @@ class PostScriptFormatter(Formatter):
     @staticmethod
     def format_tags(line: List[Union[FormatTag, str]], settings) -> str:
 
-        # Regular font, open group
-        result = "fR ("
+        # Regular font, then groups of text between tags
+        result = ["fR"]
+        text = ""
 
-        # For color styles, closing the current group and invoking the next
+        # For color styles, showing the current group and invoking the next
         # color is enough.
         # For bold / italic / bold-italic, they cannot be combined. Instead,
         # they are separate fonts that have to be selected.
 
-        # TODO: Works for now, but closing two tags in a row will make
-        # an empty group: ') u fO (...) u fB () u fR ('
-
         current_font_styles: Set[F] = set([])
 
         for elem in line:
             if isinstance(elem, str):
-                result += sanitize(elem)
-            else:
-                tag = elem
-
-                if tag.kind in (F.ForegroundColor, F.BackgroundColor):
-                    foreground = tag.kind == F.ForegroundColor
-
-                    if tag.open:
-                        color = tag.data["color"]
-                        if color[0] != "#":
-                            color = "#" + color
-                        if foreground:
-                            result += ") u 16%s sethexcolor (" % color
-                        else:
-                            result += ") u /gc 16%s def (" % color
+                text += sanitize(elem)
+                continue
+
+            # Show the current group, unless it is empty
+            if text:
+                result.append("(%s) u" % text)
+                text = ""
+            tag = elem
+
+            if tag.kind in (F.ForegroundColor, F.BackgroundColor):
+                foreground = tag.kind == F.ForegroundColor
+
+                if tag.open:
+                    color = tag.data["color"]
+                    if color[0] != "#":
+                        color = "#" + color
+                    if foreground:
+                        result.append("16%s sethexcolor" % color)
                     else:
-                        if foreground:
-                            result += ") u %s (" % reset_color(settings)
-                        else:
-                            result += ") u /gc null def ("
-
-                elif tag.kind in (F.Bold, F.Italic):
-                    if tag.open:
-                        current_font_styles.add(tag.kind)
+                        result.append("/gc 16%s def" % color)
+                else:
+                    if foreground:
+                        result.append(reset_color(settings))
                     else:
-                        current_font_styles.remove(tag.kind)
-                    # Close group, render, switch to correct font, open next
-                    key = tuple(
-                        sorted(current_font_styles, key=lambda f: f.name)
-                    )
-                    result += ") u %s (" % font_styles[key]
+                        result.append("/gc null def")
+
+            elif tag.kind in (F.Bold, F.Italic):
+                if tag.open:
+                    current_font_styles.add(tag.kind)
+                else:
+                    current_font_styles.remove(tag.kind)
+                # Switch to correct font
+                key = tuple(
+                    sorted(current_font_styles, key=lambda f: f.name)
+                )
+                result.append(font_styles[key])
+
+        if text:
+            result.append("(%s) u" % text)
 
         # function u renders each character as unicode, in a regular grid
-        return result + ") u "
+        return " ".join(result) + " "
+
+    @classmethod
+    def file_parts(
+        cls, pages: Iterable[List[str]], settings: Settings
+    ) -> Iterator[str]:
+        # Fonts come first, with only the glyphs used by the pages, and
+        # procedures for the colors they set often: pages are formatted
+        # to a temporary file while these are collected, then copied back
+        counts: Counter = Counter()
+        lengths: List[int] = []
+        with tempfile.TemporaryFile(
+            "w+", encoding="UTF-8", newline=""
+        ) as spool:
+
+            def formatted():
+                for page in pages:
+                    text = cls.format_page(page, settings)
+                    counts.update(filter(None, color_operators.findall(text)))
+                    spool.write(text)
+                    lengths.append(len(text))
+                    yield text
+
+            characters = used_characters(formatted())
+
+            # Colors set often are replaced by procedures
+            procedures = color_procedures(
+                operator for operator, count in counts.most_common()
+                if count >= min_color_uses
+            )
+
+            def replace(match):
+                if match.group(1) is None:
+                    return match.group()
+                return procedures.get(match.group(1), (match.group(1),))[0]
+
+            yield begin_file(
+                settings, characters,
+                "\n".join(definition for _, definition in procedures.values())
+            )
+            spool.seek(0)
+            for length in lengths:
+                yield color_operators.sub(replace, spool.read(length))
+        yield cls.end_file(settings)
 
     @staticmethod
     def begin_file(settings: Settings) -> str:
-        return template.render(
-            fonts=fonts,
-            reverse_glyphs=reverse_glyphs,
-            page_width=settings.page_width,
-            page_height=settings.page_height,
-        )
+        """Returns the beginning of a file with the complete fonts."""
+        return begin_file(settings)
+
+    @classmethod
+    def format_page(cls, page: List[str], settings: Settings) -> str:
+        return compact(super().format_page(page, settings))
 
     @staticmethod
     def begin_page(settings: Settings) -> str:
@@ -117,6 +255,161 @@ class PostScriptFormatter(Formatter):
         return r"%%EOF"
 
 
+def begin_file(
+    settings: Settings,
+    characters: Optional[Dict[str, Set[str]]] = None,
+    colors: str = "",
+) -> str:
+    """Returns the beginning of a file, with fonts subsetted to the
+    characters shown with each font selection, if given, and definitions
+    of procedures setting colors."""
+    return template().render(
+        colors=colors,
+        fonts=fonts() if characters is None else subset_fonts(characters),
+        reverse_glyphs=(
+            reverse_glyphs() if characters is None
+            else subset_reverse_glyphs(characters)
+        ),
+        page_width=settings.page_width,
+        page_height=settings.page_height,
+    )
+
+
+# Operators shown on a page, and strings shown
+operators = re.compile(
+    r"\(((?:[^\\()]|\\.)*)\) u\b|/gc \S+ def|\S+ fg|\S+ sethexcolor|\S+"
+)
+
+
+def compact(page: str) -> str:
+    """Returns the PostScript of a page, setting the font and colors
+    only when they change before some text, and showing neighbouring
+    strings together.
+
+    Lines and all other operators are kept. Strings can span lines.
+    """
+    # Font and colors set by the page so far, then by what is emitted,
+    # None when not known
+    font, fg, gc = "fR", None, "/gc null def"
+    set_font = set_fg = set_gc = None
+    lines: List[List[str]] = [[]]
+    text: List[str] = []
+
+    def show():
+        if text:
+            lines[-1].append("(%s) u" % "".join(text))
+            text.clear()
+
+    end = 0
+    for match in operators.finditer(page):
+        if "\n" in page[end:match.start()]:
+            show()
+            lines.append([])
+        end = match.end()
+
+        string, operator = match.group(1), match.group()
+        if string is not None:
+            if not string:
+                continue
+            if (font, fg, gc) != (set_font, set_fg, set_gc):
+                show()
+                for wanted, current in (
+                    (font, set_font), (fg, set_fg), (gc, set_gc)
+                ):
+                    if wanted is not None and wanted != current:
+                        lines[-1].append(wanted)
+                set_font, set_fg, set_gc = font, fg, gc
+            text.append(string)
+        elif operator in font_files:
+            font = operator
+        elif operator.endswith((" fg", " sethexcolor")):
+            fg = operator
+        elif operator.startswith("/gc "):
+            gc = operator
+        else:
+            show()
+            lines[-1].append(operator)
+            # Black background, and back to the top with the regular font
+            if operator == "bk":
+                set_fg = "0 fg"
+            elif operator == "tr":
+                set_font = "fR"
+            elif operator == "showpage":
+                set_fg = None
+    show()
+    if "\n" in page[end:]:
+        lines.append([])
+
+    return "\n".join(" ".join(line) for line in lines)
+
+
+# Colors set at least this many times are set by procedures
+min_color_uses = 3
+# Operators setting colors, and strings, matched to be skipped
+color_operators = re.compile(
+    r"\((?:[^\\()]|\\.)*\)"
+    r"|(16#[0-9a-fA-F]{6} sethexcolor|/gc 16#[0-9a-fA-F]{6} def)"
+)
+
+
+def color_procedures(operators: Iterable[str]) -> Dict[str, Tuple[str, str]]:
+    """Returns the name of a procedure for each operator setting a color,
+    and its definition."""
+    procedures = {}
+    # Foreground colors, then backgrounds
+    counts = {"F": 0, "G": 0}
+    for operator in operators:
+        if operator.startswith("/gc"):
+            prefix, body = "G", operator
+        else:
+            color = operator[3:9]
+            prefix, body = "F", "%s setrgbcolor" % " ".join(
+                "%.4g" % (int(color[i:i + 2], 16) / 255) for i in (0, 2, 4)
+            )
+        name = "%s%x" % (prefix, counts[prefix])
+        counts[prefix] += 1
+        procedures[operator] = (name, "/%s { %s } bind def" % (name, body))
+    return procedures
+
+
+def split_file(path: str, parts: int, directory: str) -> List[str]:
+    """Writes the pages of a PostScript file to at most `parts` files in
+    a directory, each starting with the fonts and procedures of the
+    file, and returns their paths."""
+    with open(path, encoding="UTF-8") as f:
+        pages = sum(1 for line in f if line == "showpage\n")
+    per_part = max(-(-pages // parts), 1)
+
+    paths: List[str] = []
+    with open(path, encoding="UTF-8") as f:
+        prologue = []
+        for line in f:
+            prologue.append(line)
+            if line == "%%EndSetup\n":
+                break
+
+        part = None
+        written = 0
+        for line in f:
+            if line == "%%EOF\n":
+                break
+            if part is None:
+                paths.append(os.path.join(directory, "%d.ps" % len(paths)))
+                part = open(paths[-1], "w", encoding="UTF-8")
+                part.writelines(prologue)
+            part.write(line)
+            if line == "showpage\n":
+                written += 1
+                if written % per_part == 0:
+                    part.write("%%EOF\n")
+                    part.close()
+                    part = None
+        if part is not None:
+            part.write("%%EOF\n")
+            part.close()
+    return paths
+
+
 def sanitize(s: str) -> str:
     s = s.replace("\\", "\\\\")
     s = s.replace("(", r"\(")
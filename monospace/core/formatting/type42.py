@@ -0,0 +1,218 @@
+"""Subsets of Type 42 fonts, with only the glyphs a document shows
+
+A Type 42 font is a TrueType font wrapped in PostScript: the TrueType
+tables are in the hexadecimal strings of its `sfnts` array, and its
+`CharStrings` dictionary gives the index in the font of each glyph name.
+
+Subsets keep every table, and every glyph at the same index, so that
+indices stay valid, but the outlines of unused glyphs are left empty and
+their names are left out of `CharStrings`. Glyphs made of other glyphs
+keep these too.
+"""
+
+import re
+import struct
+from typing import Dict, Iterable, List, Set
+
+# PostScript strings are at most 65535 bytes long, including the padding
+# of the last table they contain, and the byte that ends each string of
+# `sfnts`, ignored by interpreters
+max_string = 65528
+
+# Components of composite glyphs, read after their flags and index
+arg_words = 0x0001
+has_scale = 0x0008
+more_components = 0x0020
+has_xy_scale = 0x0040
+has_2x2 = 0x0080
+
+
+def checksum(data: bytes) -> int:
+    data += b"\0" * (-len(data) % 4)
+    return sum(struct.unpack(">%dI" % (len(data) // 4), data)) & 0xFFFFFFFF
+
+
+def components(glyph: bytes) -> List[int]:
+    """Returns the indices of the glyphs a composite glyph is made of."""
+    if len(glyph) < 10 or struct.unpack(">h", glyph[:2])[0] >= 0:
+        return []
+    result = []
+    offset = 10
+    flags = more_components
+    while flags & more_components:
+        flags, index = struct.unpack(">HH", glyph[offset:offset + 4])
+        result.append(index)
+        offset += 4 + (4 if flags & arg_words else 2)
+        if flags & has_scale:
+            offset += 2
+        elif flags & has_xy_scale:
+            offset += 4
+        elif flags & has_2x2:
+            offset += 8
+    return result
+
+
+class Type42Font(object):
+    def __init__(self, source: str):
+        start = source.index("  /sfnts [")
+        end = source.index("] def", start)
+        names = source.index("  /CharStrings", end)
+        names_end = source.index("end readonly def", names)
+
+        self.header = source[:start]
+        self.trailer = source[source.index("\n", names_end) + 1:]
+        self.glyphs: Dict[str, int] = {
+            name: int(index) for name, index in re.findall(
+                r"^\s*/(\S+) (\d+) def$", source[names:names_end], re.M
+            )
+        }
+
+        # Strings without their padding byte make up the TrueType font
+        sfnt = b"".join(
+            data[:-1] if len(data) % 2 else data
+            for data in (
+                bytes.fromhex(string)
+                for string in re.findall(r"<([^>]*)>", source[start:end])
+            )
+        )
+        count = struct.unpack(">H", sfnt[4:6])[0]
+        self.tables: Dict[bytes, bytes] = {}
+        for i in range(count):
+            tag, _, offset, length = struct.unpack(
+                ">4sIII", sfnt[12 + 16 * i:28 + 16 * i]
+            )
+            self.tables[tag] = sfnt[offset:offset + length]
+
+    @property
+    def short_offsets(self) -> bool:
+        return struct.unpack(">h", self.tables[b"head"][50:52])[0] == 0
+
+    def glyph_offsets(self) -> List[int]:
+        loca = self.tables[b"loca"]
+        if self.short_offsets:
+            return [
+                offset * 2 for offset in
+                struct.unpack(">%dH" % (len(loca) // 2), loca)
+            ]
+        return list(struct.unpack(">%dI" % (len(loca) // 4), loca))
+
+    def kept_glyphs(self, indices: Iterable[int]) -> Set[int]:
+        """Returns the indices of the glyphs, of the glyphs they are made
+        of, and of `.notdef`."""
+        offsets = self.glyph_offsets()
+        glyf = self.tables[b"glyf"]
+        kept: Set[int] = set()
+        pending = [0, *indices]
+        while pending:
+            index = pending.pop()
+            if index not in kept:
+                kept.add(index)
+                glyph = glyf[offsets[index]:offsets[index + 1]]
+                pending.extend(components(glyph))
+        return kept
+
+    def subset_strings(self, kept: Set[int]) -> List[bytes]:
+        """Returns the TrueType font with only the outlines of the kept
+        glyphs, cut in strings as in `sfnts`."""
+        offsets = self.glyph_offsets()
+        glyf = self.tables[b"glyf"]
+
+        # Glyphs, each starting a new piece of the table
+        glyphs = []
+        for i in range(len(offsets) - 1):
+            glyph = glyf[offsets[i]:offsets[i + 1]] if i in kept else b""
+            glyphs.append(glyph + b"\0" * (-len(glyph) % 4))
+        new_offsets = [0]
+        for data in glyphs:
+            new_offsets.append(new_offsets[-1] + len(data))
+        if self.short_offsets:
+            loca = struct.pack(
+                ">%dH" % len(new_offsets), *(o // 2 for o in new_offsets)
+            )
+        else:
+            loca = struct.pack(">%dI" % len(new_offsets), *new_offsets)
+        head = self.tables[b"head"]
+
+        tables = dict(self.tables)
+        tables[b"head"] = head[:8] + b"\0\0\0\0" + head[12:]
+        tables[b"loca"] = loca
+        tables[b"glyf"] = b"".join(glyphs)
+
+        return sfnt_strings(tables, {b"glyf": glyphs})
+
+    def truetype(self, indices: Iterable[int]) -> bytes:
+        """Returns the TrueType font with only the outlines of the glyphs
+        at these indices, for embedding in other formats."""
+        return b"".join(self.subset_strings(self.kept_glyphs(indices)))
+
+    def subset(self, names: Iterable[str]) -> str:
+        """Returns the PostScript of the font with only the named glyphs,
+        and `.notdef`. Unknown names are ignored."""
+        wanted = set(names)
+        strings = self.subset_strings(self.kept_glyphs(
+            self.glyphs[name] for name in wanted if name in self.glyphs
+        ))
+        kept_names = "".join(
+            "    /%s %d def\n" % (name, index)
+            for name, index in self.glyphs.items()
+            if name in wanted or index == 0
+        )
+        return "".join([
+            self.header,
+            "  /sfnts [\n",
+            *("%s\n" % hex_string(string) for string in strings),
+            "  ] def\n",
+            "  /CharStrings %d dict dup begin\n" % kept_names.count("\n"),
+            kept_names,
+            "  end readonly def\n",
+            self.trailer,
+        ])
+
+
+def sfnt_strings(
+    tables: Dict[bytes, bytes], pieces: Dict[bytes, List[bytes]]
+) -> List[bytes]:
+    """Returns the TrueType font made of the tables, cut in strings
+    that each start a table, or a piece of it listed in `pieces`."""
+    tags = sorted(tables)
+    selector = len(tags).bit_length() - 1
+    directory = [struct.pack(
+        ">IHHHH", 0x00010000, len(tags),
+        16 << selector, selector, 16 * len(tags) - (16 << selector)
+    )]
+    offset = 12 + 16 * len(tags)
+    for tag in tags:
+        data = tables[tag]
+        directory.append(
+            struct.pack(">4sIII", tag, checksum(data), offset, len(data))
+        )
+        offset += len(data) + -len(data) % 4
+
+    strings = [b"".join(directory)]
+    for tag in tags:
+        if tag == b"head":
+            head = len(strings)
+        data = tables[tag]
+        padding = b"\0" * (-len(data) % 4)
+        string = b""
+        for piece in pieces.get(tag, [data]):
+            if string and len(string) + len(piece) > max_string:
+                strings.append(string)
+                string = b""
+            string += piece
+        strings.append(string + padding)
+
+    # The font's checksum, with the adjustment first set to 0, is made
+    # to add up to this magic number
+    font = b"".join(strings)
+    adjustment = (0xB1B0AFBA - checksum(font)) & 0xFFFFFFFF
+    strings[head] = (
+        strings[head][:8] + struct.pack(">I", adjustment) + strings[head][12:]
+    )
+    return strings
+
+
+def hex_string(data: bytes) -> str:
+    text = data.hex().upper()
+    lines = [text[i:i + 64] for i in range(0, len(text), 64)]
+    return " <\n%s\n  00\n >" % "\n".join("  " + line for line in lines)
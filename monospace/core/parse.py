@@ -1,17 +1,223 @@
+import re
 import json
-import pypandoc  # type: ignore
+import marshal
+from typing import Iterable, Iterator, List, Set
 
-try:
-    pypandoc._ensure_pandoc_path()
-except OSError:
-    pypandoc.download_pandoc()
-    pypandoc._ensure_pandoc_path()
+from . import cache
+from .parsing import pandoc
 
+reader_options = {"format": "markdown", "to": "json"}
 
-def parse(source_filename) -> dict:
-    raw_ast: str = pypandoc.convert_file(
-        source_file=source_filename,
-        format="markdown",
-        to="json"
+# Pandoc's AST only contains dicts, lists and strings,
+# marshal loads it several times faster than json or pickle
+ast_cache = cache.Cache("ast", max_size=256 * cache.MB, serializer=marshal)
+
+chapter_header = re.compile(r"#(\s|$)")
+setext_underline = re.compile(r"=+\s*$")
+code_fence = re.compile(r"\s*(`{3,}|~{3,})(.*)")
+div_fence = re.compile(r":{3,}(\s*\S)?")
+# Reference links and footnotes can be defined in any chapter
+definition = re.compile(r" {0,3}\[[^\]]+\]:")
+# Example lists are numbered across the whole document
+example_marker = re.compile(r"\(@[\w-]*\)")
+# Headers can be linked to by their title, from any chapter
+atx_title = re.compile(r" {0,3}#{1,6}\s+(.*?)(?:\s+#+)?(?:\s*\{[^}]*\})?\s*$")
+any_underline = re.compile(r"(=+|-+)\s*$")
+# Bracketed text, but not of inline links or spans
+bracketed = re.compile(r"\[([^\[\]]+)\](?![({])")
+
+
+def parse(source_filename, parser="pandoc") -> dict:
+    """Parses a markdown file into Pandoc's AST.
+
+    The source is split into chapters, each parsed (and cached) on its
+    own, so that editing a chapter only requires parsing that chapter
+    again. The chapters' ASTs are then stitched back together.
+
+    With the "python" parser, Pandoc is not needed at all, and chapters
+    are not cached: parsing them is faster than reading the cache.
+    """
+    chunks = list(parse_chunks(source_filename, parser))
+
+    # Metadata can only be in the front matter, i.e. the first chunk
+    ast = dict(chunks[0])
+    ast["blocks"] = [block for chunk in chunks for block in chunk["blocks"]]
+    return ast
+
+
+def parse_chunks(source_filename, parser="pandoc") -> Iterator[dict]:
+    """Parses a markdown file into one Pandoc AST per chapter.
+
+    Chapters are read from the file and parsed as they are needed,
+    the first one holds the document's metadata. Sources whose chapters
+    depend on each other are parsed in one chunk, see `splittable`.
+    """
+    if parser == "python":
+        from .parsing import markdown
+
+    used: Set[str] = set()
+    with open(source_filename, encoding="UTF-8") as f:
+        if splittable(f):
+            f.seek(0)
+            chunks: Iterable[str] = chapters(f)
+        else:
+            f.seek(0)
+            chunks = [f.read()]
+
+        for chunk in chunks:
+            if parser == "python":
+                ast = markdown.parse(chunk)
+            else:
+                ast = parse_chunk(chunk)
+            deduplicate_identifiers(ast, used)
+            yield ast
+
+
+def parse_chunk(source: str) -> dict:
+    key = cache.make_key(
+        source,
+        pandoc.version(),
+        pandoc.backend(),
+        sorted(reader_options.items())
     )
-    return json.loads(raw_ast)
+    ast = ast_cache.get(key)
+
+    if ast is None:
+        raw_ast: str = pandoc.convert(source, **reader_options)
+        ast = json.loads(raw_ast)
+        ast_cache.set(key, ast)
+
+    return ast
+
+
+def deduplicate_identifiers(chunk: dict, used: Set[str]):
+    """Renames headers having an identifier used in a previous chunk,
+    and adds the chunk's identifiers to the `used` ones.
+
+    Pandoc appends a number to identifiers already used by previous
+    headers, but each chunk was parsed without knowing the others.
+    """
+    for header in headers(chunk["blocks"]):
+        attributes = header["c"][1]
+        identifier = attributes[0]
+        if identifier in used:
+            n = 1
+            while "%s-%d" % (identifier, n) in used:
+                n += 1
+            attributes[0] = "%s-%d" % (identifier, n)
+        used.add(attributes[0])
+
+
+def headers(blocks):
+    for block in blocks:
+        kind = block["t"]
+        if kind == "Header":
+            yield block
+        elif kind == "BlockQuote":
+            yield from headers(block["c"])
+        elif kind == "Div":
+            yield from headers(block["c"][1])
+        elif kind == "BulletList":
+            for item in block["c"]:
+                yield from headers(item)
+        elif kind == "OrderedList":
+            for item in block["c"][1]:
+                yield from headers(item)
+
+
+def split_chapters(source: str) -> List[str]:
+    """Splits a markdown source before each level 1 header.
+
+    Headers in code blocks, divs and the front matter are left alone.
+    Sources whose chapters depend on each other are not split at all,
+    see `splittable`.
+    """
+    lines = source.splitlines(keepends=True)
+    if not splittable(lines):
+        return [source]
+    return list(chapters(lines))
+
+
+def splittable(lines: Iterable[str]) -> bool:
+    """Returns whether the chapters of a source parse the same on their own
+    as in the whole source.
+
+    Pandoc needs the whole source for reference links and footnotes, whose
+    definitions can be in any chapter, for example lists, numbered across
+    chapters, and for links to headers by their title. Titles are compared
+    to any bracketed text, which can be more than links: such sources are
+    only parsed in one chunk when they did not need to be.
+    """
+    titles: Set[str] = set()
+    texts: Set[str] = set()
+    previous = ""
+    for line in lines:
+        if definition.match(line) or example_marker.search(line):
+            return False
+        header = atx_title.match(line)
+        if header:
+            titles.add(reference_key(header.group(1)))
+        elif previous.strip() and any_underline.match(line):
+            titles.add(reference_key(previous))
+        # Link texts can continue on the next line
+        for text in bracketed.findall(previous.rstrip() + " " + line):
+            texts.add(reference_key(text))
+        previous = line
+    return not titles & texts
+
+
+def reference_key(text: str) -> str:
+    """Pandoc matches references regardless of case and spacing."""
+    return " ".join(text.split()).lower()
+
+
+def chapters(lines: Iterable[str]) -> Iterator[str]:
+    """Yields chapters from lines of markdown, see `split_chapters`."""
+    chunk: List[str] = []
+    fence = None
+    divs = 0
+    front_matter = False
+    previous = ""
+
+    # Headers are found one line late, setext ones need their underline
+    lines = iter(lines)
+    line = next(lines, None)
+    if line is not None and line.rstrip() == "---":
+        # Skip front matter, YAML comments look like headers
+        front_matter = True
+
+    while line is not None:
+        next_line = next(lines, None)
+
+        if front_matter:
+            if chunk and line.rstrip() in ("---", "..."):
+                front_matter = False
+            chunk.append(line)
+            previous, line = line, next_line
+            continue
+
+        match = code_fence.match(line)
+        div = div_fence.match(line)
+
+        if fence is not None:
+            if match and not match.group(2).strip() \
+                    and match.group(1).startswith(fence):
+                fence = None
+        elif match:
+            fence = match.group(1)
+        elif div:
+            # Opening fences have attributes, closing fences don't
+            divs += 1 if div.group(1) else -1
+        elif divs == 0 and chunk and not previous.strip():
+            # Pandoc needs a blank line before headers
+            if chapter_header.match(line) or (
+                line.strip() and setext_underline.match(next_line or "")
+            ):
+                yield "".join(chunk)
+                chunk = []
+
+        chunk.append(line)
+        previous, line = line, next_line
+
+    # An empty source is still a (empty) document
+    yield "".join(chunk)
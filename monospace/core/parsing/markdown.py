@@ -0,0 +1,1087 @@
+"""Pure-Python reader for the subset of Pandoc's markdown used by monospace
+
+Produces the same AST as `pandoc --from markdown --to json` for:
+
+- YAML front matter (maps, lists, booleans and text)
+- ATX and setext headers, with attributes
+- Paragraphs, block quotes and horizontal rules
+- Bullet and decimal ordered lists
+- Fenced and indented code blocks, fenced divs
+- Emphasis, strong emphasis, strikeout, superscript, subscript
+- Inline code, links, images (and implicit figures), inline notes
+- Smart quotes, dashes, ellipses and abbreviations
+
+Anything else (tables, raw HTML, math, citations, reference links,
+reference footnotes...) is read as plain text, use Pandoc for those.
+
+The structure follows Pandoc's own markdown reader, so that its quirks
+(when a paragraph is "Plain", how list items continue...) are the same.
+"""
+
+import re
+import html
+from typing import List, Optional, Set, Tuple
+
+API_VERSION = [1, 23, 1, 1]
+
+# From Pandoc's data/abbreviations
+abbreviations = {
+    "Mr.", "Mrs.", "Ms.", "Capt.", "Dr.", "Prof.", "Gen.", "Gov.",
+    "e.g.", "i.e.", "Sgt.", "St.", "vol.", "vs.", "Sen.", "Rep.", "Pres.",
+    "Hon.", "Rev.", "Ph.D.", "M.D.", "M.A.", "p.", "pp.", "ch.", "sec.",
+    "cf.", "cp.",
+}
+
+blank_line = re.compile(r"\s*$")
+code_fence = re.compile(r"( {0,3})(`{3,}|~{3,})\s*([^`]*?)\s*$")
+div_fence = re.compile(r" {0,3}(:{3,})\s*(.*?)\s*$")
+atx_header = re.compile(r" {0,3}(#{1,6})(?:\s+(.*?))?\s*$")
+setext_underline = re.compile(r"(=+|-+)\s*$")
+horizontal_rule = re.compile(r" {0,3}([-*_])(?: *\1){2,} *$")
+block_quote = re.compile(r" {0,3}> ?")
+bullet_item = re.compile(r"( {0,3})([-*+])( +|$)")
+ordered_item = re.compile(r"( {0,3})(\d{1,9})([.)])( +|$)")
+indented_code = re.compile(r"    ")
+task = re.compile(r"^\[([ xX])\](?=\s)")
+attribute = re.compile(
+    r"""\s*(?:#([^\s}]+)|\.([^\s}]+)|(-)(?=[\s}])"""
+    r"""|([\w.:-]+)=("[^"]*"|'[^']*'|[^\s"'}]+))"""
+)
+entity = re.compile(r"&(#[0-9]+|#[xX][0-9a-fA-F]+|[A-Za-z][A-Za-z0-9]*);")
+escapable = set("\\`*_{}[]()>#+-.!|\"$%&'*,/:;<=>?@^~")
+
+Attr = list
+Inlines = List[dict]
+Blocks = List[dict]
+
+
+def parse(source: str) -> dict:
+    reader = Reader()
+    lines = [line.expandtabs(4) for line in source.splitlines()]
+    meta, lines = reader.front_matter(lines)
+    # Pandoc appends two new lines to its input
+    blocks = reader.blocks(lines + [""])
+    return {"pandoc-api-version": API_VERSION, "meta": meta, "blocks": blocks}
+
+
+class Reader(object):
+    def __init__(self) -> None:
+        self.identifiers: Set[str] = set()
+
+    # --- Front matter --------------------------------------------------------
+
+    def front_matter(self, lines: List[str]) -> Tuple[dict, List[str]]:
+        if len(lines) < 2 or lines[0].rstrip() != "---":
+            return {}, lines
+        if not lines[1].strip():
+            return {}, lines
+
+        for end in range(1, len(lines)):
+            if lines[end].rstrip() in ("---", "..."):
+                yaml = yaml_lines(lines[1:end])
+                value, _ = parse_yaml(yaml, 0, 0)
+                meta = self.meta_value(value)["c"] if value else {}
+                return meta, lines[end + 1:]
+
+        return {}, lines
+
+    def meta_value(self, value) -> dict:
+        if isinstance(value, dict):
+            return {
+                "t": "MetaMap",
+                "c": {
+                    k: self.meta_value(v) for k, v in value.items()
+                    if not k.endswith("_")
+                }
+            }
+        elif isinstance(value, list):
+            return {"t": "MetaList", "c": [self.meta_value(v) for v in value]}
+        elif isinstance(value, bool):
+            return {"t": "MetaBool", "c": value}
+        elif value is None:
+            return {"t": "MetaString", "c": ""}
+
+        blocks = Reader().blocks(value.splitlines())
+        if len(blocks) == 1 and blocks[0]["t"] in ("Plain", "Para"):
+            return {"t": "MetaInlines", "c": blocks[0]["c"]}
+        return {"t": "MetaBlocks", "c": blocks}
+
+    # --- Blocks --------------------------------------------------------------
+
+    def blocks(
+        self,
+        lines: List[str],
+        in_list: bool = False,
+        in_div: bool = False
+    ) -> Blocks:
+        """Parses lines into blocks.
+
+        In lists, a new list item ends paragraphs. In divs, the closing
+        fence (the end of `lines`) makes the last paragraph a "Para".
+        """
+        blocks: Blocks = []
+        i = 0
+
+        while i < len(lines):
+            if blank_line.match(lines[i]):
+                i += 1
+                continue
+
+            for read in (
+                self.code_block_fenced,
+                self.bullet_list,
+                self.div_fenced,
+                self.header,
+                self.code_block_indented,
+                self.block_quote,
+                self.horizontal_rule,
+                self.ordered_list,
+            ):
+                result = read(lines, i)
+                if result is not None:
+                    block, i = result
+                    blocks.append(block)
+                    break
+            else:
+                block, i = self.paragraph(lines, i, in_list, in_div)
+                blocks.append(block)
+
+        return blocks
+
+    def code_block_fenced(self, lines, i):
+        match = code_fence.match(lines[i])
+        if not match:
+            return None
+        indent, fence, info = match.groups()
+
+        attr: Attr = ["", [], []]
+        if info.startswith("{"):
+            parsed = parse_attributes(info)
+            if parsed is None:
+                return None
+            attr = parsed
+        elif info:
+            attr = ["", [info.split()[0]], []]
+
+        code = []
+        j = i + 1
+        while j < len(lines):
+            closing = re.match(r" {0,3}(%s+)\s*$" % fence[0], lines[j])
+            if closing and len(closing.group(1)) >= len(fence):
+                j += 1
+                break
+            code.append(remove_indent(lines[j], len(indent)))
+            j += 1
+
+        return {"t": "CodeBlock", "c": [attr, "\n".join(code)]}, j
+
+    def code_block_indented(self, lines, i):
+        if not indented_code.match(lines[i]):
+            return None
+
+        code = []
+        j = i
+        while j < len(lines):
+            if indented_code.match(lines[j]):
+                code.append(lines[j][4:])
+                j += 1
+            elif blank_line.match(lines[j]):
+                k = j
+                while k < len(lines) and blank_line.match(lines[k]):
+                    k += 1
+                if k < len(lines) and indented_code.match(lines[k]):
+                    code.extend(line[4:] for line in lines[j:k])
+                    j = k
+                else:
+                    break
+            else:
+                break
+
+        text = "\n".join(code).rstrip("\n")
+        return {"t": "CodeBlock", "c": [["", [], []], text]}, j
+
+    def div_fenced(self, lines, i):
+        match = div_fence.match(lines[i])
+        if not match or not match.group(2):
+            return None
+
+        info = match.group(2).rstrip(":").strip()
+        if info.startswith("{"):
+            attr = parse_attributes(info)
+            if attr is None:
+                return None
+        elif re.match(r"[^\s{]+$", info):
+            attr = ["", [info], []]
+        else:
+            return None
+
+        level = 1
+        fence = None
+        j = i + 1
+        while j < len(lines):
+            line = lines[j]
+            code = code_fence.match(line)
+            div = div_fence.match(line)
+            if fence is not None:
+                if code and code.group(2).startswith(fence) \
+                        and not code.group(3):
+                    fence = None
+            elif code:
+                fence = code.group(2)
+            elif div:
+                level += 1 if div.group(2) else -1
+                if level == 0:
+                    break
+            j += 1
+
+        if level != 0:
+            # No closing fence, this is not a div
+            return None
+
+        contents = self.blocks(lines[i + 1:j], in_div=True)
+        return {"t": "Div", "c": [attr, contents]}, j + 1
+
+    def header(self, lines, i):
+        match = atx_header.match(lines[i])
+        if match:
+            level = len(match.group(1))
+            text = match.group(2) or ""
+            end = i + 1
+        elif (
+            i + 2 < len(lines)
+            and setext_underline.match(lines[i + 1])
+            and blank_line.match(lines[i + 2])
+            and not bullet_item.match(lines[i])
+        ):
+            level = 1 if lines[i + 1][0] == "=" else 2
+            text = lines[i].strip()
+            end = i + 2
+        else:
+            return None
+
+        attr: Attr = ["", [], []]
+        attributes = re.search(r"\{[^{}]*\}\s*$", text)
+        if attributes:
+            parsed = parse_attributes(attributes.group(0).strip())
+            if parsed is not None:
+                attr = parsed
+                text = text[:attributes.start()]
+        if match:
+            text = re.sub(r"(^|\s)#+\s*$|#+\s*$", "", text.rstrip())
+
+        inlines = trim(InlineReader(text.strip()).inlines())
+
+        if not attr[0]:
+            attr[0] = self.unique_identifier(identifier(inlines))
+        else:
+            self.identifiers.add(attr[0])
+
+        return {"t": "Header", "c": [level, attr, inlines]}, end
+
+    def unique_identifier(self, base: str) -> str:
+        base = base or "section"
+        result = base
+        n = 0
+        while result in self.identifiers:
+            n += 1
+            result = "%s-%d" % (base, n)
+        self.identifiers.add(result)
+        return result
+
+    def horizontal_rule(self, lines, i):
+        if horizontal_rule.match(lines[i]):
+            return {"t": "HorizontalRule"}, i + 1
+        return None
+
+    def block_quote(self, lines, i):
+        if not block_quote.match(lines[i]):
+            return None
+
+        quoted = []
+        j = i
+        while j < len(lines):
+            match = block_quote.match(lines[j])
+            if match:
+                quoted.append(lines[j][match.end():])
+            elif not blank_line.match(lines[j]) and quoted[-1].strip():
+                # Lazy continuation line
+                quoted.append(lines[j])
+            else:
+                break
+            j += 1
+
+        contents = self.blocks(quoted + [""])
+        return {"t": "BlockQuote", "c": contents}, j
+
+    def bullet_list(self, lines, i):
+        match = bullet_item.match(lines[i])
+        if not match or horizontal_rule.match(lines[i]):
+            return None
+
+        items, j = self.list_items(lines, i, is_bullet_item)
+        return {"t": "BulletList", "c": items}, j
+
+    def ordered_list(self, lines, i):
+        match = ordered_item.match(lines[i])
+        if not match:
+            return None
+
+        start = int(match.group(2))
+        delimiter = match.group(3)
+
+        def same_list(line):
+            match = ordered_item.match(line)
+            return match is not None and match.group(3) == delimiter
+
+        items, j = self.list_items(lines, i, same_list)
+        style = {"t": "Decimal"}
+        delim = {"t": "Period" if delimiter == "." else "OneParen"}
+        return {"t": "OrderedList", "c": [[start, style, delim], items]}, j
+
+    def list_items(self, lines, i, is_item) -> Tuple[List[Blocks], int]:
+        items: List[Blocks] = []
+
+        while i < len(lines) and is_item(lines[i]):
+            match = bullet_item.match(lines[i]) or ordered_item.match(lines[i])
+            assert match is not None
+            indent = match.end()
+            raw = [task.sub(checkbox, lines[i][indent:])]
+            j = i + 1
+
+            # Lines of the first paragraph
+            while j < len(lines):
+                line = lines[j]
+                if (
+                    blank_line.match(line)
+                    or is_list_item(line)
+                    or code_fence.match(line)
+                    or is_list_item(remove_indent(line, indent).lstrip())
+                ):
+                    break
+                raw.append(remove_indent(line, indent, exactly=True))
+                j += 1
+            j = skip_blank_lines(lines, j, raw)
+
+            # Continuation blocks, indented to the item's content
+            while (
+                j < len(lines)
+                and not blank_line.match(lines[j])
+                and lines[j].startswith(" " * indent)
+            ):
+                raw.append(lines[j][indent:])
+                j += 1
+                while j < len(lines) and not blank_line.match(lines[j]):
+                    line = lines[j]
+                    if line.startswith(" " * indent):
+                        line = line[indent:]
+                    elif is_list_item(line):
+                        break
+                    raw.append(line)
+                    j += 1
+                j = skip_blank_lines(lines, j, raw)
+
+            items.append(self.blocks(raw, in_list=True))
+            i = j
+
+        return compactify(items), i
+
+    def paragraph(self, lines, i, in_list, in_div):
+        text = [lines[i]]
+        j = i + 1
+        kind = "Plain"
+
+        while j < len(lines):
+            line = lines[j]
+            if blank_line.match(line):
+                kind = "Para"
+                break
+            fence = code_fence.match(line)
+            if fence and fence.group(2)[0] == "`":
+                kind = "Para"
+                break
+            if in_list and is_list_item(line):
+                break
+            text.append(line)
+            j += 1
+        else:
+            if in_div:
+                kind = "Para"
+
+        inlines = trim(InlineReader("\n".join(text)).inlines())
+
+        if kind == "Para" and len(inlines) == 1 and inlines[0]["t"] == "Image":
+            image_attr, caption, target = inlines[0]["c"]
+            if caption:
+                # Pandoc turns lone images with a caption into figures
+                identifier, classes, attributes = image_attr
+                image = {
+                    "t": "Image",
+                    "c": [["", classes, attributes], caption, target]
+                }
+                return {"t": "Figure", "c": [
+                    [identifier, [], []],
+                    [None, [{"t": "Plain", "c": caption}]],
+                    [{"t": "Plain", "c": [image]}]
+                ]}, j
+
+        return {"t": kind, "c": inlines}, j
+
+
+def compactify(items: List[Blocks]) -> List[Blocks]:
+    """Makes lists either tight (with "Plain" items) or loose ("Para").
+
+    The last item of a tight list followed by a blank line is a "Para",
+    it becomes "Plain". Otherwise, any "Para" makes the whole list loose.
+    """
+    paragraphs = [
+        block for item in items for block in item if block["t"] == "Para"
+    ]
+    if not paragraphs:
+        return items
+
+    last = items[-1][-1] if items[-1] else None
+    if len(paragraphs) == 1 and last is paragraphs[0]:
+        items[-1][-1] = {"t": "Plain", "c": last["c"]}
+        return items
+
+    return [
+        [{"t": "Para", "c": block["c"]} if block["t"] == "Plain" else block
+         for block in item]
+        for item in items
+    ]
+
+
+def checkbox(match) -> str:
+    return "\u2610" if match.group(1) == " " else "\u2612"
+
+
+def is_list_item(line: str) -> bool:
+    return is_bullet_item(line) or ordered_item.match(line) is not None
+
+
+def is_bullet_item(line: str) -> bool:
+    return (
+        bullet_item.match(line) is not None
+        and not horizontal_rule.match(line)
+    )
+
+
+def remove_indent(line: str, indent: int, exactly: bool = False) -> str:
+    spaces = len(line) - len(line.lstrip(" "))
+    if exactly and spaces < indent:
+        return line
+    return line[min(spaces, indent):]
+
+
+def skip_blank_lines(lines, j, raw):
+    while j < len(lines) and blank_line.match(lines[j]):
+        raw.append("")
+        j += 1
+    return j
+
+
+# --- Inlines -----------------------------------------------------------------
+
+
+class InlineReader(object):
+    """Reads inline elements, one character at a time.
+
+    Like in Pandoc, unclosed emphasis or quotes don't backtrack:
+    their delimiter is kept as text, followed by what was read after it.
+    """
+
+    def __init__(self, text: str) -> None:
+        self.text = text
+        self.pos = 0
+        # Position right after the last alphanumeric character read,
+        # needed for intraword underscores and apostrophes
+        self.last_str_end = -1
+        self.quote_context: Optional[str] = None
+
+    def inlines(self, until=None) -> Inlines:
+        result: Inlines = []
+        while self.pos < len(self.text):
+            if until is not None and until():
+                break
+            append(result, self.inline())
+        return result
+
+    def inline(self) -> Inlines:
+        c = self.text[self.pos]
+
+        if c in " \t":
+            return self.whitespace()
+        elif c == "\n":
+            self.pos += 1
+            return [{"t": "SoftBreak"}]
+        elif c == "`":
+            return self.code()
+        elif c in "*_":
+            return self.emphasis()
+        elif c == "^":
+            return self.superscript() or self.note() or self.symbol()
+        elif c == "[":
+            return self.link() or self.symbol()
+        elif c == "!":
+            return self.image() or self.symbol()
+        elif c == "~":
+            return self.strikeout() or self.subscript() or self.symbol()
+        elif c == "\\":
+            return self.escape()
+        elif c == "<":
+            return self.autolink() or self.symbol()
+        elif c in "\"'":
+            return self.quoted() or self.symbol()
+        elif c == "-":
+            return self.dash()
+        elif c == ".":
+            return self.ellipsis() or self.string()
+        elif c == "&":
+            return self.entity() or self.symbol()
+        elif c.isalnum():
+            return self.string()
+        return self.symbol()
+
+    def peek(self, offset: int = 0) -> str:
+        pos = self.pos + offset
+        return self.text[pos] if 0 <= pos < len(self.text) else ""
+
+    def startswith(self, s: str) -> bool:
+        return self.text.startswith(s, self.pos)
+
+    def symbol(self) -> Inlines:
+        self.pos += 1
+        return [str_(self.text[self.pos - 1])]
+
+    def string(self) -> Inlines:
+        start = self.pos
+        while self.pos < len(self.text):
+            c = self.text[self.pos]
+            if c.isalnum():
+                self.pos += 1
+            elif c == "." and self.peek(1) != ".":
+                self.pos += 1
+            else:
+                break
+        result = self.text[start:self.pos]
+        self.last_str_end = self.pos
+
+        if result in abbreviations and self.peek() in (" ", "\t"):
+            # Non-breaking space after abbreviations
+            while self.peek() in (" ", "\t") and self.peek():
+                self.pos += 1
+            return [str_(result + "\u00a0")]
+        return [str_(result)]
+
+    def whitespace(self) -> Inlines:
+        start = self.pos
+        while self.peek() in (" ", "\t") and self.peek():
+            self.pos += 1
+        if self.peek() == "\n" and self.pos - start >= 2:
+            self.pos += 1
+            return [{"t": "LineBreak"}]
+        return [{"t": "Space"}]
+
+    def escape(self) -> Inlines:
+        c = self.peek(1)
+        if c == "\n":
+            self.pos += 2
+            return [{"t": "LineBreak"}]
+        elif c == " ":
+            self.pos += 2
+            return [str_("\u00a0")]
+        elif c in escapable and c:
+            self.pos += 2
+            return [str_(c)]
+        return self.symbol()
+
+    def entity(self) -> Optional[Inlines]:
+        match = entity.match(self.text, self.pos)
+        if not match:
+            return None
+        unescaped = html.unescape(match.group(0))
+        if unescaped == match.group(0):
+            return None
+        self.pos = match.end()
+        return [str_(unescaped)]
+
+    def code(self) -> Inlines:
+        start = self.pos
+        ticks = re.match(r"`+", self.text[start:]).group(0)  # type: ignore
+        end = re.compile(r"(?<!`)%s(?!`)" % ticks)
+        match = end.search(self.text, start + len(ticks))
+        if not match:
+            self.pos += len(ticks)
+            return [str_(ticks)]
+
+        code = self.text[start + len(ticks):match.start()]
+        self.pos = match.end()
+        attr = self.attributes() or ["", [], []]
+        return [{
+            "t": "Code",
+            "c": [attr, re.sub(r"\s*\n\s*", " ", code).strip()]
+        }]
+
+    def attributes(self) -> Optional[Attr]:
+        if self.peek() != "{":
+            return None
+        end = self.text.find("}", self.pos)
+        if end == -1:
+            return None
+        attr = parse_attributes(self.text[self.pos:end + 1])
+        if attr is not None:
+            self.pos = end + 1
+        return attr
+
+    # Emphasis, ported from Pandoc's `enclosure`
+
+    def emphasis(self) -> Inlines:
+        c = self.peek()
+
+        if c == "_" and self.last_str_end == self.pos:
+            # Intraword underscores are just text
+            return self.symbol()
+
+        start = self.pos
+        while self.peek() == c:
+            self.pos += 1
+        delimiters = self.text[start:self.pos]
+
+        if self.peek() in (" ", "\t", "\n", ""):
+            return [str_(delimiters)]
+        if len(delimiters) == 3:
+            return self.three(c)
+        elif len(delimiters) == 2:
+            return self.two(c, [])
+        elif len(delimiters) == 1:
+            return self.one(c, [])
+        return [str_(delimiters)]
+
+    def ender(self, c: str, n: int) -> bool:
+        if not self.startswith(c * n):
+            return False
+        if c == "_":
+            after = self.peek(n)
+            if after.isalnum():
+                return False
+        return True
+
+    def consume_ender(self, c: str, n: int) -> bool:
+        if self.ender(c, n):
+            self.pos += n
+            self.last_str_end = self.pos
+            return True
+        return False
+
+    def three(self, c: str) -> Inlines:
+        contents = self.inlines(until=lambda: self.ender(c, 1))
+        if self.consume_ender(c, 3):
+            return [strong([emph(contents)])]
+        elif self.consume_ender(c, 2):
+            return self.one(c, [strong(contents)])
+        elif self.consume_ender(c, 1):
+            return self.two(c, [emph(contents)])
+        return [str_(c * 3), *contents]
+
+    def two(self, c: str, prefix: Inlines) -> Inlines:
+        contents = self.inlines(until=lambda: self.ender(c, 2))
+        if self.consume_ender(c, 2):
+            return [strong(join(prefix, contents))]
+        return [str_(c * 2), *join(prefix, contents)]
+
+    def one(self, c: str, prefix: Inlines) -> Inlines:
+        contents: Inlines = []
+        while self.pos < len(self.text):
+            if not self.ender(c, 1):
+                append(contents, self.inline())
+            elif self.startswith(c * 2) and not self.startswith(c * 3):
+                # Strong emphasis inside emphasis
+                self.pos += 2
+                append(contents, self.two(c, []))
+            else:
+                break
+
+        if self.consume_ender(c, 1):
+            return [emph(join(prefix, contents))]
+        return join([str_(c)], join(prefix, contents))
+
+    def strikeout(self) -> Optional[Inlines]:
+        if not self.startswith("~~") or self.peek(2) in (" ", "\n", ""):
+            return None
+        return self.enclosed("~~", "Strikeout", allow_spaces=True)
+
+    def subscript(self) -> Optional[Inlines]:
+        return self.enclosed("~", "Subscript")
+
+    def superscript(self) -> Optional[Inlines]:
+        return self.enclosed("^", "Superscript")
+
+    def enclosed(self, delimiter, kind, allow_spaces=False):
+        start = self.pos
+        self.pos += len(delimiter)
+        contents: Inlines = []
+        while self.pos < len(self.text):
+            if self.startswith(delimiter):
+                if not contents:
+                    break
+                self.pos += len(delimiter)
+                return [{"t": kind, "c": contents}]
+            if not allow_spaces and self.peek() in (" ", "\t", "\n"):
+                break
+            append(contents, self.inline())
+        self.pos = start
+        return None
+
+    def note(self) -> Optional[Inlines]:
+        if self.peek(1) != "[":
+            return None
+        start = self.pos
+        self.pos += 1
+        contents = self.bracketed()
+        if contents is None:
+            self.pos = start
+            return None
+        return [{"t": "Note", "c": [{"t": "Para", "c": trim(contents)}]}]
+
+    def bracketed(self) -> Optional[Inlines]:
+        """Reads inlines between balanced brackets."""
+        end = matching_bracket(self.text, self.pos)
+        if end is None:
+            return None
+        reader = InlineReader(self.text[self.pos + 1:end])
+        reader.quote_context = self.quote_context
+        contents = reader.inlines()
+        self.pos = end + 1
+        return contents
+
+    def link(self) -> Optional[Inlines]:
+        start = self.pos
+        text = self.bracketed()
+        target = self.target() if text is not None else None
+        if target is None:
+            self.pos = start
+            return None
+        attr = self.attributes() or ["", [], []]
+        return [{"t": "Link", "c": [attr, text, target]}]
+
+    def image(self) -> Optional[Inlines]:
+        if self.peek(1) != "[":
+            return None
+        start = self.pos
+        self.pos += 1
+        link = self.link()
+        if link is None:
+            self.pos = start
+            return None
+        return [{"t": "Image", "c": link[0]["c"]}]
+
+    def target(self) -> Optional[List[str]]:
+        match = re.compile(
+            r"""\(\s*(<[^>]*>|(?:[^\s()]|\([^\s()]*\))*)"""
+            r"""(?:\s+("[^"]*"|'[^']*'))?\s*\)"""
+        ).match(self.text, self.pos)
+        if not match:
+            return None
+        self.pos = match.end()
+        url = match.group(1)
+        if url.startswith("<"):
+            url = url[1:-1]
+        title = match.group(2)[1:-1] if match.group(2) else ""
+        return [url.replace(" ", "%20"), title]
+
+    def autolink(self) -> Optional[Inlines]:
+        match = re.compile(r"<([A-Za-z][A-Za-z0-9+.-]+:[^\s<>]*)>").match(
+            self.text, self.pos)
+        if match:
+            self.pos = match.end()
+            url = match.group(1)
+            return [{"t": "Link", "c": [
+                ["", ["uri"], []], [str_(url)], [url, ""]
+            ]}]
+        match = re.compile(r"<([^\s<>@]+@[^\s<>@]+\.[^\s<>@]+)>").match(
+            self.text, self.pos)
+        if match:
+            self.pos = match.end()
+            email = match.group(1)
+            return [{"t": "Link", "c": [
+                ["", ["email"], []], [str_(email)], ["mailto:" + email, ""]
+            ]}]
+        return None
+
+    # Smart punctuation
+
+    def quoted(self) -> Optional[Inlines]:
+        c = self.peek()
+        single = c == "'"
+
+        if single:
+            after_string = self.last_str_end == self.pos
+            if (
+                self.quote_context == "single"
+                or after_string
+                or self.peek(1) in (" ", "\t", "\n", "")
+            ):
+                self.pos += 1
+                return [str_("\u2019")]
+        else:
+            if self.quote_context == "double":
+                return None
+            if self.peek(1) in (" ", "\t", "\n", ""):
+                return None
+
+        start = self.pos
+        self.pos += 1
+        context = self.quote_context
+        self.quote_context = "single" if single else "double"
+
+        contents: Inlines = []
+        closed = False
+        while self.pos < len(self.text):
+            if self.quote_end(c):
+                closed = True
+                break
+            append(contents, self.inline())
+        self.quote_context = context
+
+        if closed and contents:
+            self.pos += 1
+            kind = "SingleQuote" if single else "DoubleQuote"
+            return [{"t": "Quoted", "c": [{"t": kind}, trim(contents)]}]
+
+        self.pos = start + 1
+        return [str_("\u2019" if single else "\u201c")]
+
+    def quote_end(self, c: str) -> bool:
+        if self.peek() != c:
+            return False
+        if c == "'":
+            return not self.peek(1).isalnum()
+        return True
+
+    def dash(self) -> Inlines:
+        if self.startswith("---"):
+            self.pos += 3
+            return [str_("\u2014")]
+        elif self.startswith("--"):
+            self.pos += 2
+            return [str_("\u2013")]
+        return self.symbol()
+
+    def ellipsis(self) -> Optional[Inlines]:
+        if self.startswith("..."):
+            self.pos += 3
+            return [str_("\u2026")]
+        return None
+
+
+def str_(s: str) -> dict:
+    return {"t": "Str", "c": s}
+
+
+def emph(contents: Inlines) -> dict:
+    return {"t": "Emph", "c": contents}
+
+
+def strong(contents: Inlines) -> dict:
+    return {"t": "Strong", "c": contents}
+
+
+def join(a: Inlines, b: Inlines) -> Inlines:
+    result = list(a)
+    append(result, b)
+    return result
+
+
+# Merges Pandoc's builder does when concatenating inlines
+mergeable = {"Emph", "Strong", "Strikeout", "Superscript", "Subscript"}
+breaks = {
+    ("Space", "Space"): "Space",
+    ("Space", "SoftBreak"): "SoftBreak",
+    ("SoftBreak", "Space"): "SoftBreak",
+    ("SoftBreak", "SoftBreak"): "SoftBreak",
+    ("Space", "LineBreak"): "LineBreak",
+    ("LineBreak", "Space"): "LineBreak",
+    ("SoftBreak", "LineBreak"): "LineBreak",
+    ("LineBreak", "SoftBreak"): "LineBreak",
+}
+
+
+def append(result: Inlines, inlines: Inlines) -> None:
+    for i, inline in enumerate(inlines):
+        if not result:
+            result.append(inline)
+            continue
+
+        last = result[-1]
+        kinds = (last["t"], inline["t"])
+        if kinds in breaks:
+            result[-1] = {"t": breaks[kinds]}
+        elif kinds == ("Str", "Str"):
+            result[-1] = str_(last["c"] + inline["c"])
+        elif kinds[0] == kinds[1] and kinds[0] in mergeable:
+            result[-1] = {"t": kinds[0], "c": join(last["c"], inline["c"])}
+        else:
+            result.append(inline)
+
+
+def trim(inlines: Inlines) -> Inlines:
+    spaces = ("Space", "SoftBreak", "LineBreak")
+    start, end = 0, len(inlines)
+    while start < end and inlines[start]["t"] in spaces:
+        start += 1
+    while end > start and inlines[end - 1]["t"] in spaces:
+        end -= 1
+    return inlines[start:end]
+
+
+def matching_bracket(text: str, start: int) -> Optional[int]:
+    depth = 0
+    i = start
+    while i < len(text):
+        c = text[i]
+        if c == "\\":
+            i += 2
+            continue
+        elif c == "`":
+            ticks = re.match(r"`+", text[i:]).group(0)  # type: ignore
+            end = text.find(ticks, i + len(ticks))
+            if end != -1:
+                i = end + len(ticks)
+                continue
+        elif c == "[":
+            depth += 1
+        elif c == "]":
+            depth -= 1
+            if depth == 0:
+                return i
+        i += 1
+    return None
+
+
+def parse_attributes(text: str) -> Optional[Attr]:
+    """Parses attributes like `{#identifier .class key=value}`."""
+    if not (text.startswith("{") and text.endswith("}")):
+        return None
+
+    identifier = ""
+    classes: List[str] = []
+    attributes: List[List[str]] = []
+
+    body = text[1:-1]
+    pos = 0
+    while pos < len(body):
+        if not body[pos:].strip():
+            break
+        match = attribute.match(body, pos)
+        if not match:
+            return None
+        pos = match.end()
+        if match.group(1):
+            identifier = match.group(1)
+        elif match.group(2):
+            classes.append(match.group(2))
+        elif match.group(3):
+            classes.append("unnumbered")
+        else:
+            value = match.group(5)
+            if value[0] in "\"'":
+                value = value[1:-1]
+            attributes.append([match.group(4), value])
+
+    return [identifier, classes, attributes]
+
+
+def identifier(inlines: Inlines) -> str:
+    """Pandoc's algorithm for automatic header identifiers."""
+    text = stringify(inlines).lower()
+    text = "".join(c for c in text if c.isalnum() or c in "_-. ")
+    text = "-".join(text.split())
+    # Identifiers start with a letter
+    start = 0
+    while start < len(text) and not text[start].isalpha():
+        start += 1
+    return text[start:]
+
+
+def stringify(inlines: Inlines) -> str:
+    result = []
+    for inline in inlines:
+        kind = inline["t"]
+        if kind == "Str":
+            result.append(inline["c"])
+        elif kind in ("Space", "SoftBreak", "LineBreak"):
+            result.append(" ")
+        elif kind == "Code":
+            result.append(inline["c"][1])
+        elif kind == "Note":
+            continue
+        elif kind == "Quoted":
+            quote = '"' if inline["c"][0]["t"] == "DoubleQuote" else "'"
+            result.append(quote + stringify(inline["c"][1]) + quote)
+        elif kind in ("Link", "Image"):
+            result.append(stringify(inline["c"][1]))
+        elif isinstance(inline.get("c"), list):
+            result.append(stringify(inline["c"]))
+    return "".join(result)
+
+
+# --- YAML --------------------------------------------------------------------
+
+
+def yaml_lines(lines: List[str]) -> List[Tuple[int, str]]:
+    """Strips comments and blank lines, and measures indentation."""
+    result = []
+    for line in lines:
+        stripped = re.sub(r"(^|\s)#.*$", "", line).rstrip()
+        if stripped.strip():
+            result.append((len(stripped) - len(stripped.lstrip()),
+                           stripped.strip()))
+    return result
+
+
+def parse_yaml(lines: List[Tuple[int, str]], i: int, indent: int):
+    """Parses block-style YAML maps and lists, with scalar values."""
+    if i >= len(lines) or lines[i][0] < indent:
+        return None, i
+
+    indent = lines[i][0]
+    if lines[i][1].startswith("- ") or lines[i][1] == "-":
+        items = []
+        while i < len(lines) and lines[i][0] == indent \
+                and (lines[i][1].startswith("- ") or lines[i][1] == "-"):
+            rest = lines[i][1][1:].strip()
+            if rest:
+                items.append(yaml_scalar(rest))
+                i += 1
+            else:
+                value, i = parse_yaml(lines, i + 1, indent + 1)
+                items.append(value)
+        return items, i
+
+    mapping: dict = {}
+    while i < len(lines) and lines[i][0] == indent:
+        key, _, rest = lines[i][1].partition(":")
+        key = yaml_scalar(key.strip())
+        rest = rest.strip()
+        if rest:
+            mapping[str(key)] = yaml_scalar(rest)
+            i += 1
+        else:
+            value, i = parse_yaml(lines, i + 1, indent + 1)
+            mapping[str(key)] = value
+    return mapping, i
+
+
+def yaml_scalar(text: str):
+    if text in ("true", "True", "TRUE"):
+        return True
+    elif text in ("false", "False", "FALSE"):
+        return False
+    elif text in ("null", "Null", "NULL", "~"):
+        return None
+    elif len(text) >= 2 and text[0] == text[-1] == '"':
+        return text[1:-1].encode("latin-1", "backslashreplace")\
+            .decode("unicode_escape")
+    elif len(text) >= 2 and text[0] == text[-1] == "'":
+        return text[1:-1].replace("''", "'")
+    return text
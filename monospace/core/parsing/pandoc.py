@@ -0,0 +1,97 @@
+"""Conversions through Pandoc
+
+Starting pandoc takes longer than converting most documents, so all
+conversions go through a single long-lived pandoc process running a
+small Lua script, fed over its standard input. Pandoc versions without
+`pandoc lua` (before 3.0) fall back to one process per conversion.
+
+Pandoc is only looked for when first needed, and is never downloaded.
+"""
+
+import atexit
+import subprocess
+from typing import IO, Optional
+
+worker: Optional["Worker"] = None
+worker_supported: Optional[bool] = None
+
+
+def path() -> str:
+    import pypandoc  # type: ignore
+    try:
+        return pypandoc.get_pandoc_path()
+    except OSError:
+        raise OSError(
+            "Pandoc could not be found. Install it (https://pandoc.org), "
+            "or download it with: "
+            "python -c 'import pypandoc; pypandoc.download_pandoc()'"
+        )
+
+
+def version() -> str:
+    import pypandoc  # type: ignore
+    path()
+    return pypandoc.get_pandoc_version()
+
+
+def backend() -> str:
+    """Returns what conversions go through, "worker" or "command", so that
+    results of one are not mistaken for results of the other."""
+    global worker_supported
+
+    if worker_supported is None:
+        worker_supported = int(version().split(".")[0]) >= 3
+    return "worker" if worker_supported else "command"
+
+
+def convert(source: str, format: str, to: str) -> str:
+    global worker
+
+    if backend() == "command":
+        import pypandoc  # type: ignore
+        return pypandoc.convert_text(source, format=format, to=to)
+
+    if worker is None:
+        worker = Worker(path())
+        atexit.register(worker.close)
+
+    return worker.convert(source, format, to)
+
+
+class Worker(object):
+    def __init__(self, pandoc_path: str) -> None:
+        import pkgutil
+        # The script is run from its text, wherever the package is
+        script = pkgutil.get_data(__name__, "pandoc_worker.lua")
+        assert script is not None
+        self.process = subprocess.Popen(
+            [pandoc_path, "lua", "-e", script.decode("UTF-8")],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE
+        )
+        assert self.process.stdin and self.process.stdout
+        self.stdin: IO[bytes] = self.process.stdin
+        self.stdout: IO[bytes] = self.process.stdout
+
+    def convert(self, source: str, format: str, to: str) -> str:
+        data = source.encode("UTF-8")
+        header = "%s %s %d\n" % (format, to, len(data))
+
+        self.stdin.write(header.encode("UTF-8"))
+        self.stdin.write(data)
+        self.stdin.flush()
+
+        response = self.stdout.readline().split()
+        if len(response) != 2:
+            raise RuntimeError("Pandoc worker exited unexpectedly")
+
+        status, length = response
+        result = self.stdout.read(int(length)).decode("UTF-8")
+        if status != b"ok":
+            raise RuntimeError("Pandoc failed: %s" % result)
+        return result
+
+    def close(self) -> None:
+        self.stdin.close()
+        self.process.wait()
+        self.stdout.close()
@@ -0,0 +1,41 @@
+-- Converts documents sent over standard input until it is closed.
+--
+-- Requests are a header line "<from> <to> <length>" followed by
+-- <length> bytes of source. Responses are a header line
+-- "<ok|error> <length>" followed by <length> bytes of output,
+-- or of the error message.
+
+-- Expands tabs to spaces like the pandoc command does before reading,
+-- with tab stops every 4 characters
+local function expand_tabs(source)
+    return (source:gsub("[^\n]*", function(line)
+        if not line:find("\t", 1, true) then return line end
+        local column = 0
+        return (line:gsub(utf8.charpattern, function(char)
+            if char == "\t" then
+                local spaces = 4 - column % 4
+                column = column + spaces
+                return string.rep(" ", spaces)
+            end
+            column = column + 1
+        end))
+    end))
+end
+
+while true do
+    local header = io.read("l")
+    if header == nil then break end
+
+    local from, to, length = header:match("^(%S+) (%S+) (%d+)$")
+    length = tonumber(length)
+    -- Reading 0 bytes would block until the next request
+    local source = length > 0 and io.read(length) or ""
+
+    local ok, result = pcall(function()
+        return pandoc.write(pandoc.read(expand_tabs(source), from), to)
+    end)
+    result = tostring(result)
+
+    io.write(ok and "ok" or "error", " ", #result, "\n", result)
+    io.stdout:flush()
+end
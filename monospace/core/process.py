@@ -1,4 +1,6 @@
-from typing import Optional, Any, Dict, List
+import marshal
+import tempfile
+from typing import Optional, Any, Dict, Iterable, Iterator, List
 
 from .domain import Settings
 from ..util import intersperse
@@ -10,19 +12,60 @@ from .symbols.characters import double_quotes, single_quotes
 def process(ast: dict, source_file):
     meta = process_meta(ast["meta"])
     settings = Settings.from_meta(meta, source_file)
-    processor = Processor(ast, settings)
+    processor = Processor(settings)
+    processor.find_references(ast["blocks"])
+    processor.add_mockup_references()
 
     cross_references = processor.cross_references
-    document_elements = processor.processed
+    document_elements = processor.process_elements(ast["blocks"])
 
     return settings, cross_references, document_elements
 
 
+def process_chunks(chunks: Iterable[dict], source_file):
+    """Like `process`, for a document parsed in chunks (see `parse_chunks`).
+
+    Elements are yielded one at a time, as they are processed. Chunks are
+    needed twice: once to find all cross-references, then to be processed.
+    They are kept in a temporary file in between, not in memory.
+    """
+    spool = tempfile.TemporaryFile()
+    processor = None
+    count = 0
+
+    for chunk in chunks:
+        if processor is None:
+            meta = process_meta(chunk["meta"])
+            settings = Settings.from_meta(meta, source_file)
+            processor = Processor(settings)
+        processor.find_references(chunk["blocks"])
+        # Much faster than marshal.dump and marshal.load with files
+        data = marshal.dumps(chunk["blocks"])
+        spool.write(len(data).to_bytes(8, "little"))
+        spool.write(data)
+        count += 1
+
+    assert processor is not None, "No chunks to process"
+    processor.add_mockup_references()
+
+    def document_elements() -> Iterator[d.Element]:
+        with spool:
+            spool.seek(0)
+            for _ in range(count):
+                size = int.from_bytes(spool.read(8), "little")
+                blocks = marshal.loads(spool.read(size))
+                yield from processor.process_elements(blocks)
+
+    return settings, processor.cross_references, document_elements()
+
+
 class Processor(object):
-    def __init__(self, ast: dict, settings: Settings) -> None:
+    def __init__(self, settings: Settings) -> None:
         self.settings = settings
         self.note_count = -1
-        self.cross_references = self.find_references(ast["blocks"])
+        self.cross_references: Dict[str, str] = {}
+
+    def add_mockup_references(self):
         # FIXME: This is just for the mockup
         self.cross_references.update({
             "how-to-pay": "How to pay",
@@ -41,10 +84,9 @@ class Processor(object):
             "summary-of-key-rules": "Summary of key rules",
             "foreword": "Foreword",
         })
-        self.processed = self.process_elements(ast["blocks"])
 
-    def find_references(self, elements: list) -> Dict[str, str]:
-        references: Dict[str, str] = {}
+    def find_references(self, elements: list):
+        references = self.cross_references
         for element in elements:
             if element["t"] == "Header":
                 identifier = Metadata(element["c"][1]).identifier
@@ -53,7 +95,6 @@ class Processor(object):
                     "A header with this title already exists: %s" % title
                 references[identifier] = title
         self.note_count = -1
-        return references
 
     def process_elements(self, elements) -> List[d.Element]:
         processed = [
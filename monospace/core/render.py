@@ -39,73 +39,351 @@ it is delegated to the main renderer, because the side blocks
 need to be aligned left or right depending on which page they are on.
 """
 
-from typing import Dict, List, Optional, Type, Iterator
+from typing import Dict, List, Optional, Tuple, Type, Iterator
 from dataclasses import replace
+from functools import lru_cache
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
 import os
 
+from . import cache
 from .domain import document as d
 from .domain import blocks as b
 from .domain import Settings
 from .symbols import characters
-from .rendering import paragraph as p, code, images
+from .rendering import paragraph as p
 from .formatting import Formatter, styles, AnsiFormatter,\
-                        PostScriptFormatter, FormatTag, Format as F
+                        PostScriptFormatter, PdfFormatter, FormatTag,\
+                        Format as F, coalesce
+
+
+# Blocks rendered from top-level elements, see `Renderer.render_cached`
+blocks_cache = cache.Cache("blocks", max_size=256 * cache.MB)
+# Lines of converted images, and the hashes of image files
+images_cache = cache.Cache("images", max_size=128 * cache.MB)
 
 
 def render(
     elements: Iterator[d.Element],
     settings: Settings,
     cross_references: Dict[str, str],
-    formatter: Optional[Type[Formatter]] = None
+    formatter: Optional[Type[Formatter]] = None,
+    jobs: int = 1
 ) -> Iterator[b.Block]:
-    renderer = Renderer(settings, cross_references, formatter)
+    """Renders elements into blocks.
+
+    With more than one job, chapters are rendered in parallel by as many
+    processes, and their blocks are yielded back in order. All elements
+    are then read before the first block is rendered. Books of a single
+    chapter are rendered in this process instead, while the others
+    highlight its code blocks.
+    """
+    if jobs > 1:
+        return render_parallel(
+            elements, settings, cross_references, formatter, jobs
+        )
+    renderer = Renderer(settings, cross_references, formatter, cached=True)
     return renderer.render_elements(elements)
 
 
+def render_parallel(
+    elements, settings, cross_references, formatter, jobs
+) -> Iterator[b.Block]:
+    groups = list(chapters(elements))
+
+    if sum(1 for group in groups if group) < 2:
+        with ProcessPoolExecutor(jobs - 1) as executor:
+            renderer = Renderer(
+                settings, cross_references, formatter,
+                cached=True, highlighter=executor
+            )
+            yield from renderer.render_elements(
+                element for group in groups for element in group
+            )
+        return
+
+    # Processes don't share the state set up before rendering
+    small_caps = dict(characters.small_caps)
+
+    # Chapters are handed to workers as they start rather than with each
+    # task: forked processes get them for free, while pickling elements
+    # takes about as long as rendering them
+    with ProcessPoolExecutor(
+        jobs,
+        initializer=init_worker,
+        initargs=(
+            groups, settings, cross_references, formatter,
+            small_caps, cache.enabled, cache.directory
+        )
+    ) as executor:
+        futures = [
+            executor.submit(render_chapter_blocks, chapter)
+            for chapter in range(len(groups))
+        ]
+        for future in futures:
+            yield from future.result()
+
+
+# State of worker processes, see `render_parallel`
+worker_chapters: List[List[d.Element]] = []
+worker_renderer: Optional["Renderer"] = None
+
+
+def init_worker(
+    groups, settings, cross_references, formatter,
+    small_caps, cache_enabled, cache_directory
+):
+    global worker_chapters, worker_renderer
+    characters.small_caps.update(small_caps)
+    cache.configure(enable=cache_enabled, root=cache_directory)
+    worker_chapters = groups
+    worker_renderer = Renderer(
+        settings, cross_references, formatter, cached=True
+    )
+
+
+def render_chapter_blocks(chapter: int) -> List[b.Block]:
+    assert worker_renderer is not None
+    return list(
+        worker_renderer.render_cached(worker_chapters[chapter], chapter)
+    )
+
+
+def highlight_code_block(
+    code_block: d.CodeBlock, settings: Settings, formatter
+) -> List[str]:
+    """Highlights a code block in a worker process, with the settings of
+    the renderer it is in."""
+    from .rendering import code
+    renderer = Renderer(settings, {}, formatter)
+    return code.highlight_code_block(
+        code_block, renderer.format, renderer.code_width(), settings.light
+    )
+
+
+def chapters(elements: Iterator[d.Element]) -> Iterator[List[d.Element]]:
+    """Groups elements by chapter. The first group holds the elements
+    before the first chapter, and can be empty."""
+    group: List[d.Element] = []
+    for element in elements:
+        if isinstance(element, d.Chapter):
+            yield group
+            group = []
+        group.append(element)
+    yield group
+
+
+@lru_cache(maxsize=None)
+def code_version() -> str:
+    """Hashes the code rendering depends on: the sources of this package,
+    and the versions of the libraries used for hyphenation, highlighting
+    and image processing."""
+    import pygments  # type: ignore
+    import PIL  # type: ignore
+    from .rendering import hyphenation
+
+    root = os.path.dirname(__file__)
+    sources = []
+    for directory, _, filenames in sorted(os.walk(root)):
+        for filename in sorted(filenames):
+            if filename.endswith(".py"):
+                with open(os.path.join(directory, filename), "rb") as f:
+                    sources.append(f.read())
+    return cache.make_key(
+        *sources, pygments.__version__, hyphenation.pyphen_version(),
+        PIL.__version__
+    )
+
+
+def file_digest(path: str) -> str:
+    """Hashes the content of a file. Hashes are cached for as long as
+    the file keeps the same size and modification time, so that images
+    copied or checked out again are still found in the cache."""
+    stat = os.stat(path)
+    key = cache.make_key(
+        os.path.abspath(path), stat.st_size, stat.st_mtime_ns
+    )
+    digest = images_cache.get(key)
+    if digest is None:
+        with open(path, "rb") as f:
+            digest = cache.make_key(f.read())
+        images_cache.set(key, digest)
+    return digest
+
+
+def images_in(element) -> Iterator[d.Image]:
+    if isinstance(element, d.Image):
+        yield element
+    elif isinstance(element, (d.OrderedList, d.UnorderedList)):
+        for elements in element.list_elements:
+            for child in elements:
+                yield from images_in(child)
+    elif isinstance(element, d.Aside):
+        for child in element.elements:
+            yield from images_in(child)
+
+
+def code_blocks_in(
+    element, settings: Settings
+) -> Iterator[Tuple[d.CodeBlock, Settings]]:
+    """Yields the code blocks in an element, with the settings of the
+    sub-renderer that renders each of them, see `Renderer.render_list`
+    and `Renderer.render_aside`."""
+    if isinstance(element, d.CodeBlock):
+        yield element, settings
+    elif isinstance(element, (d.OrderedList, d.UnorderedList)):
+        settings = replace(
+            settings, main_width=settings.main_width - settings.tab_size
+        )
+        for elements in element.list_elements:
+            for child in elements:
+                yield from code_blocks_in(child, settings)
+    elif isinstance(element, d.Aside):
+        settings = replace(
+            settings, main_width=settings.main_width - 2 * settings.tab_size
+        )
+        for child in element.elements:
+            yield from code_blocks_in(child, settings)
+
+
 class Renderer(object):
-    def __init__(self, settings, cross_references, formatter=None):
+    def __init__(
+        self, settings, cross_references, formatter=None, cached=False,
+        highlighter: Optional[Executor] = None
+    ):
         self.settings: Settings = settings
         self.cross_references: Dict[str, str] = cross_references
         self.formatter = formatter
+        # Only the top-level renderer caches, sub-renderers render parts
+        # of elements that are cached as a whole
+        self.cached = cached
+        # Code blocks of a chapter are highlighted by the executor ahead
+        # of time, while the other elements are rendered. Sub-renderers
+        # share the highlighted blocks, keyed by the width of their renderer
+        self.highlighter = highlighter
+        self.highlighted: Dict[Tuple[str, str, int], Future] = {}
 
     def render_elements(self, elements) -> Iterator[b.Block]:
+        if self.cached:
+            for chapter, chapter_elements in enumerate(chapters(elements)):
+                yield from self.render_cached(chapter_elements, chapter)
+            return
         for element in elements:
-            if isinstance(element, d.Chapter):
-                yield self.render_chapter(element)
-            elif isinstance(element, d.SubChapter):
-                yield self.render_subchapter(element)
-            elif isinstance(element, d.Section):
-                yield self.render_section(element)
-            elif isinstance(element, d.Paragraph):
-                yield self.render_paragraph(element)
-            elif isinstance(element, d.OrderedList):
-                yield from self.render_list(element, ordered=True)
-            elif isinstance(element, d.UnorderedList):
-                yield from self.render_list(element, ordered=False)
-            elif isinstance(element, d.Aside):
-                yield self.render_aside(element)
-            elif isinstance(element, d.CodeBlock):
-                yield self.render_code_block(element)
-            elif isinstance(element, d.Image):
-                yield self.render_image(element)
-            elif isinstance(element, d.Quote):
-                yield self.render_quote(element)
-            elif isinstance(element, d.PageBreak):
-                yield b.Block()
-
-            # Unimplemented:
-            elif (
-                isinstance(element, d.SubChapter)
-                or isinstance(element, d.Unprocessed)
-            ):
-                if isinstance(element, d.Unprocessed):
-                    kind = element.kind
-                else:
-                    kind = element.__class__.__name__
-
-                yield self.render_paragraph(
-                    d.Paragraph(text=d.Text(["<UNRENDERED: %s>" % kind]))
-                )
+            yield from self.render_element(element)
+
+    def render_cached(self, elements, chapter: int) -> Iterator[b.Block]:
+        """Renders the elements of a chapter, reusing the blocks
+        of a previous build.
+
+        Blocks are cached per chapter: one entry maps the key of each
+        element of the chapter to its blocks, because reading and writing
+        many small files takes longer than rendering paragraphs. After an
+        edit, only the changed elements are rendered again, and only the
+        entries of their chapters are written again.
+        """
+        entry_key = self.chapter_key(chapter)
+        cached = blocks_cache.get(entry_key, {})
+        rendered: Dict[str, List[b.Block]] = {}
+
+        keys = [self.cache_key(element) for element in elements]
+        if self.highlighter is not None:
+            for element, key in zip(elements, keys):
+                if key in cached:
+                    continue
+                for code_block, settings in code_blocks_in(
+                    element, self.settings
+                ):
+                    self.highlight_ahead(code_block, settings)
+
+        for element, key in zip(elements, keys):
+            blocks = cached.get(key) if key else None
+            if blocks is None:
+                blocks = list(self.render_element(element))
+            if key:
+                rendered[key] = blocks
+            yield from blocks
+
+        self.highlighted.clear()
+        if rendered.keys() != cached.keys():
+            blocks_cache.set(entry_key, rendered)
+
+    def highlight_ahead(self, code_block: d.CodeBlock, settings: Settings):
+        assert self.highlighter is not None
+        key = (code_block.language, code_block.code, settings.main_width)
+        if key not in self.highlighted:
+            self.highlighted[key] = self.highlighter.submit(
+                highlight_code_block, code_block, settings, self.formatter
+            )
+
+    def chapter_key(self, chapter: int) -> str:
+        return cache.make_key(
+            code_version(),
+            self.formatter.__name__ if self.formatter else None,
+            self.settings.main_width,
+            self.settings.side_width,
+            self.settings.tab_size,
+            self.settings.light,
+            self.settings.language,
+            self.settings.ansi_colors,
+            os.path.abspath(self.settings.source_file),
+            chapter,
+        )
+
+    def cache_key(self, element) -> Optional[str]:
+        """Hashes an element, within the entry of its chapter.
+
+        Images are read from disk: their files' size and modification
+        time are part of the key. Returns None if an image is missing,
+        to let rendering report it.
+        """
+        files = []
+        cwd = os.path.dirname(self.settings.source_file)
+        for image in images_in(element):
+            path = os.path.join(cwd, image.uri)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                return None
+            files.append((path, stat.st_size, stat.st_mtime_ns))
+
+        return cache.make_key(files, element)
+
+    def render_element(self, element) -> Iterator[b.Block]:
+        if isinstance(element, d.Chapter):
+            yield self.render_chapter(element)
+        elif isinstance(element, d.SubChapter):
+            yield self.render_subchapter(element)
+        elif isinstance(element, d.Section):
+            yield self.render_section(element)
+        elif isinstance(element, d.Paragraph):
+            yield self.render_paragraph(element)
+        elif isinstance(element, d.OrderedList):
+            yield from self.render_list(element, ordered=True)
+        elif isinstance(element, d.UnorderedList):
+            yield from self.render_list(element, ordered=False)
+        elif isinstance(element, d.Aside):
+            yield self.render_aside(element)
+        elif isinstance(element, d.CodeBlock):
+            yield self.render_code_block(element)
+        elif isinstance(element, d.Image):
+            yield self.render_image(element)
+        elif isinstance(element, d.Quote):
+            yield self.render_quote(element)
+        elif isinstance(element, d.PageBreak):
+            yield b.Block()
+
+        # Unimplemented:
+        elif (
+            isinstance(element, d.SubChapter)
+            or isinstance(element, d.Unprocessed)
+        ):
+            if isinstance(element, d.Unprocessed):
+                kind = element.kind
+            else:
+                kind = element.__class__.__name__
+
+            yield self.render_paragraph(
+                d.Paragraph(text=d.Text(["<UNRENDERED: %s>" % kind]))
+            )
 
     def render_list(self, ordered_list, ordered=False):
         # Create sub-renderer that will create thinner blocks
@@ -128,7 +406,7 @@ class Renderer(object):
                     # ...Unless you print them in a terminal and
                     # the number is <= 20? o_O
                     offset = 1
-                if self.formatter == PostScriptFormatter:
+                if self.formatter in (PostScriptFormatter, PdfFormatter):
                     offset = 1  # ps template has fixed offsets
 
             result = bullet + spaces[offset:]
@@ -160,6 +438,7 @@ class Renderer(object):
             text_elements=title,
             alignment=p.Alignment.left,
             width=self.settings.main_width,
+            language=self.settings.language,
             format_func=self.format
         )
         fence = ["━" * self.settings.main_width]
@@ -180,6 +459,7 @@ class Renderer(object):
             text_elements=title,
             alignment=p.Alignment.left,
             width=self.settings.side_width,
+            language=self.settings.language,
             format_func=self.format
         )
 
@@ -191,6 +471,7 @@ class Renderer(object):
                 text_elements=subtitle,
                 alignment=p.Alignment.left,
                 width=self.settings.side_width,
+                language=self.settings.language,
                 format_func=self.format
             )
             space = self.format([" " * self.settings.side_width])
@@ -206,6 +487,7 @@ class Renderer(object):
             text_elements=title,
             alignment=p.Alignment.left,
             width=self.settings.main_width,
+            language=self.settings.language,
             format_func=self.format,
             text_filter=styles.small_caps
         )
@@ -233,6 +515,7 @@ class Renderer(object):
                     text_elements=side,
                     alignment=p.Alignment.left,
                     width=self.settings.side_width,
+                    language=self.settings.language,
                     format_func=gray_format
                 ))
                 new_elements.append(sup)
@@ -246,6 +529,7 @@ class Renderer(object):
             text_elements=elements,
             alignment=p.Alignment.justify,
             width=self.settings.main_width,
+            language=self.settings.language,
             format_func=self.format
         )
 
@@ -309,6 +593,7 @@ class Renderer(object):
                 text_elements=author,
                 alignment=p.Alignment.right,
                 width=content_width,
+                language=self.settings.language,
                 format_func=self.format
             )
 
@@ -318,6 +603,7 @@ class Renderer(object):
             text_elements=[d.Italic(elements)],
             alignment=p.Alignment.center,
             width=content_width,
+            language=self.settings.language,
             format_func=self.format
         )
 
@@ -331,19 +617,31 @@ class Renderer(object):
             sides=notes
         )
 
+    def code_width(self) -> int:
+        # We want a tab size on each side,
+        # plus a 2 characters for background
+        return self.settings.main_width - self.settings.tab_size * 2 - 4
+
     def render_code_block(self, code_block):
+        # Pygments is only imported for books with code
+        from .rendering import code
+
         ft = self.format
         ts = self.settings.tab_size
         mw = self.settings.main_width
 
-        highlighted = code.highlight_code_block(
-            code_block=code_block,
-            format_func=self.format,
-            # We want a tab size on each side,
-            # plus a 2 characters for background
-            width=(mw - ts * 2 - 4),
-            light=self.settings.light
+        future = self.highlighted.get(
+            (code_block.language, code_block.code, mw)
         )
+        if future is not None:
+            highlighted = list(future.result())
+        else:
+            highlighted = code.highlight_code_block(
+                code_block=code_block,
+                format_func=self.format,
+                width=self.code_width(),
+                light=self.settings.light
+            )
         for i in range(len(highlighted)):
             highlighted[i] = ft(["  "]) + highlighted[i] + ft(["  "])
 
@@ -371,6 +669,9 @@ class Renderer(object):
         real_uri = os.path.join(cwd, image.uri)
 
         if extension in ("png", "jpg", "jpeg"):
+            # Pillow and NumPy are only imported for books with images
+            from .rendering import images
+
             width = self.settings.main_width - 2 * self.settings.tab_size
             mode = images.Mode.Pixels
             if image.mode is not None:
@@ -379,13 +680,26 @@ class Renderer(object):
             if image.palette is not None:
                 palette = images.Palette[image.palette]
 
-            image_lines = images.ansify(
-                real_uri,
-                format_func=self.format,
-                width=width,
-                mode=mode,
-                palette=palette,
+            key = cache.make_key(
+                code_version(),
+                file_digest(real_uri),
+                self.formatter.__name__ if self.formatter else None,
+                self.settings.light,
+                self.settings.ansi_colors,
+                width,
+                mode,
+                palette,
             )
+            image_lines = images_cache.get(key)
+            if image_lines is None:
+                image_lines = list(images.ansify(
+                    real_uri,
+                    format_func=self.format,
+                    width=width,
+                    mode=mode,
+                    palette=palette,
+                ))
+                images_cache.set(key, image_lines)
 
             # TODO: Caption
             return b.Block(main=self.indent(
@@ -415,7 +729,7 @@ class Renderer(object):
             ))
 
     def get_subrenderer(self, main_width=None):
-        return Renderer(
+        renderer = Renderer(
             settings=replace(
                 self.settings,
                 main_width=(
@@ -427,6 +741,8 @@ class Renderer(object):
             cross_references=self.cross_references,
             formatter=self.formatter
         )
+        renderer.highlighted = self.highlighted
+        return renderer
 
     def indent(
         self,
@@ -484,7 +800,7 @@ class Renderer(object):
         return result
 
     def format(self, elems):
-        return self.formatter.format_tags(elems, self.settings)
+        return self.formatter.format_tags(coalesce(elems), self.settings)
 
 
 light_gray = FormatTag(kind=F.ForegroundColor, data={"color": "#aaaaaa"})
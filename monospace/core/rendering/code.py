@@ -1,5 +1,6 @@
 import re
-from typing import List, Union, Callable
+from functools import lru_cache
+from typing import Any, Dict, List, Tuple, Union, Callable
 from pygments.lexers import get_lexer_by_name  # type: ignore
 from pygments.styles import get_style_by_name  # type: ignore
 from pygments.token import Token  # type: ignore
@@ -9,16 +10,35 @@ from ..domain import document as d
 from ..formatting import FormatTag, Format as F
 
 
+Line = List[Union[FormatTag, str]]
+
+
 def highlight_code_block(
     code_block: d.CodeBlock,
     format_func: Callable,
     width: int,
     light: bool = False
 ) -> List[str]:
+    wrapped = highlight(code_block.code, code_block.language, width, light)
+    formatted_lines = [format_func(l) for l in wrapped]
+    return ["".join(l) for l in formatted_lines]
+
+
+@lru_cache(maxsize=None)
+def get_lexer(language: str):
+    """Returns the lexer of a language, or None for unknown languages."""
     try:
-        lexer = get_lexer_by_name(code_block.language)
+        return get_lexer_by_name(language)
     except ClassNotFound:
-        lexer = None
+        return None
+
+
+@lru_cache(maxsize=None)
+def get_style_map(
+    light: bool
+) -> Dict[Any, Tuple[List[FormatTag], List[FormatTag]]]:
+    """Maps Pygments token types to the tags opening and closing
+    their style."""
 
     # Pygments styles are in this format:
     # ['fg hex', bold, nobold, italic, noitalic, ul, noul, 'bg hex',
@@ -29,21 +49,35 @@ def highlight_code_block(
     # TODO: Make this a setting + meta
     style = get_style_by_name("manni" if light else "monokai")
 
-    words: List[List[Union[FormatTag, str]]] = [[]]
+    style_map = {}
+    for token_type, values in style._styles.items():
+        tags = []
+        if values[0]:
+            tags.append(FormatTag(
+                kind=F.ForegroundColor,
+                data={"color": "#" + values[0]}
+            ))
+        style_map[token_type] = (tags, [tag.close_tag for tag in tags])
+    return style_map
+
+
+@lru_cache(maxsize=1024)
+def highlight(code: str, language: str, width: int, light: bool) -> List[Line]:
+    """Returns the lines of tags and strings of highlighted code,
+    wrapped and padded to the width.
+
+    Highlighted lines are kept for the snippets seen last, and must not
+    be modified.
+    """
+    lexer = get_lexer(language)
+
+    words: List[Line] = [[]]
 
     if lexer:
         # Map pygments styles for each token to a list of FormatTag
-        style_map = {}
-        for token_type, values in style._styles.items():
-            tags = []
-            if values[0]:
-                tags.append(FormatTag(
-                    kind=F.ForegroundColor,
-                    data={"color": "#" + values[0]}
-                ))
-            style_map[token_type] = tags
-
-        tokens = lexer.get_tokens(code_block.code)
+        style_map = get_style_map(light)
+
+        tokens = lexer.get_tokens(code)
         last_line = words[-1]
         for token, word in tokens:
             if (token, word) == (Token.Text, "\n"):
@@ -51,20 +85,20 @@ def highlight_code_block(
                 last_line = words[-1]
                 continue
 
-            tags = style_map[token]
+            tags, close_tags = style_map[token]
             last_line.extend(tags)
             last_line.append(word)
-            last_line.extend([tag.close_tag for tag in tags])
+            last_line.extend(close_tags)
 
         # Remove trailing empty line
         if not last_line:
             words.pop()
     else:
-        lines = code_block.code.splitlines()
+        lines = code.splitlines()
         # Keep the whitespace, this is source code!
         words = [re.split(r"(\s+)", line) for line in lines]  # type: ignore
 
-    wrapped: List[List[Union[FormatTag, str]]] = []
+    wrapped: List[Line] = []
     current_length = 0
 
     def rjust_last():
@@ -93,5 +127,4 @@ def highlight_code_block(
             current_length += len(word)
 
     rjust_last()
-    formatted_lines = [format_func(l) for l in wrapped]
-    return ["".join(l) for l in formatted_lines]
+    return wrapped
@@ -0,0 +1,148 @@
+"""Hyphenation positions of words, memoized
+
+Looking for the hyphenation points of a word takes much longer than looking
+them up, and books use the same words over and over. Positions are kept
+per language in an in-memory LRU, which is saved to the on-disk cache
+between builds, and can be computed at once for a whole vocabulary.
+
+Hyphenation positions don't depend on the width available, so one entry
+per word serves both line breakers.
+"""
+
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+from .. import cache
+
+default_language = "en_US"
+# Entries kept in memory (and saved) per language
+max_words = 200000
+
+positions_cache = cache.Cache("hyphenation", max_size=64 * cache.MB)
+
+hyphenators: Dict[str, "Hyphenator"] = {}
+
+
+def get(language: str = default_language) -> "Hyphenator":
+    """Returns the hyphenator of a language, shared by all renders.
+
+    Languages are given as in Pandoc's `lang` metadata ("en-US"),
+    or as in Pyphen ("en_US"). Languages without a dictionary
+    are not hyphenated.
+    """
+    import pyphen  # type: ignore
+
+    name = pyphen.language_fallback(language or default_language)
+    if name not in hyphenators:
+        hyphenators[name] = Hyphenator(name)
+    return hyphenators[name]
+
+
+def pyphen_version() -> str:
+    """Returns the version of Pyphen, read from its package metadata
+    for releases without `pyphen.__version__`."""
+    import pyphen  # type: ignore
+
+    if hasattr(pyphen, "__version__"):
+        return pyphen.__version__
+    try:
+        from importlib.metadata import version  # type: ignore
+    except ImportError:  # Python 3.7
+        from pkg_resources import get_distribution  # type: ignore
+        return get_distribution("pyphen").version
+    return version("pyphen")
+
+
+def save():
+    """Saves the positions of new words of all languages to the disk."""
+    for hyphenator in hyphenators.values():
+        hyphenator.save()
+
+
+def vocabulary(ast: dict) -> Set[str]:
+    """Returns all words ("Str" elements) of a Pandoc AST."""
+    words = set()
+    stack = [ast["blocks"]]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, list):
+            stack.extend(node)
+        elif isinstance(node, dict):
+            if node.get("t") == "Str":
+                words.add(node["c"])
+            else:
+                stack.append(node.get("c"))
+    return words
+
+
+class Hyphenator(object):
+    def __init__(self, language: Optional[str]):
+        import pyphen  # type: ignore
+
+        self.language = language
+        self.dictionary = pyphen.Pyphen(lang=language) if language else None
+        # Shorter words have no hyphenation points
+        self.min_length = 4
+        if self.dictionary is not None:
+            self.min_length = self.dictionary.left + self.dictionary.right
+
+        self.key = cache.make_key(language, pyphen_version(), max_words)
+        self.words: "OrderedDict[str, Tuple[int, ...]]" = \
+            positions_cache.get(self.key) or OrderedDict()
+        self.modified = False
+
+    def positions(self, word: str) -> Tuple[int, ...]:
+        """Returns the positions where a word can be hyphenated."""
+        words = self.words
+        if word in words:
+            words.move_to_end(word)
+            return words[word]
+
+        if len(word) < self.min_length:
+            return ()
+
+        positions = self.compute(word)
+        words[word] = positions
+        self.modified = True
+        if len(words) > max_words:
+            words.popitem(last=False)
+        return positions
+
+    def compute(self, word: str) -> Tuple[int, ...]:
+        if self.dictionary is None:
+            return ()
+        # Non-standard hyphenation (where letters change) is not supported
+        return tuple(
+            int(position) for position in self.dictionary.positions(word)
+            if not position.data
+        )
+
+    def wrap(self, word: str, width: int, hyphen: str = "-"):
+        """Returns the longest first part of `word` fitting in `width` with
+        the hyphen, and the rest of the word. Returns None if the word
+        can't be hyphenated this way, like `pyphen.Pyphen.wrap`."""
+        width -= len(hyphen)
+        for position in reversed(self.positions(word)):
+            if position <= width:
+                return word[:position] + hyphen, word[position:]
+        return None
+
+    def preload(self, words: Iterable[str]):
+        """Computes the positions of all new words in one pass."""
+        if self.dictionary is None:
+            return
+        new = [
+            word for word in set(words)
+            if len(word) >= self.min_length and word not in self.words
+        ]
+        for word in new:
+            self.words[word] = self.compute(word)
+        if new:
+            self.modified = True
+        while len(self.words) > max_words:
+            self.words.popitem(last=False)
+
+    def save(self):
+        if self.modified:
+            positions_cache.set(self.key, self.words)
+            self.modified = False
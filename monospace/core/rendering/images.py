@@ -1,14 +1,18 @@
+import numpy  # type: ignore
 from enum import Enum
-from math import sqrt
-from typing import List, Sequence
-from heapq import nsmallest
+from typing import List
 from PIL import Image  # type: ignore
 from typing import Callable, Optional
-from cursebox.palette import generate_xterm_256, distance  # type: ignore
+from cursebox.palette import generate_xterm_256  # type: ignore
 
 from ..formatting import Format as F, FormatTag
+from .quantize import Quantizer
 
-Mode = Enum("Mode", ["Blocks", "Dithered", "Pixels", "Super"])
+Mode = Enum("Mode", [
+    "Blocks", "Dithered", "Pixels", "Super",
+    # Half-blocks, with pixels dithered to the palette
+    "FloydSteinberg", "Bayer",
+])
 Palette = Enum("Palette", ["Monochrome", "ANSI", "Xterm", "RGB"])
 
 XTERM_256 = generate_xterm_256()
@@ -17,6 +21,32 @@ palettes = {
     Palette.ANSI: {n: XTERM_256[n] for n in range(16)},
     Palette.Xterm: XTERM_256,
 }
+quantizers = {
+    name: Quantizer(list(palette.values()))
+    for name, palette in palettes.items()
+}
+
+# Quadrant blocks for the corners darker (0) or lighter (1) than the
+# average, in order: top left, top right, bottom left, bottom right
+quadrants = {
+    0b0001: "▛",
+    0b0010: "▜",
+    0b0011: "▀",
+    0b0100: "▙",
+    0b0101: "▌",
+    0b0110: "▚",
+    0b0111: "▘",
+    0b1000: "▟",
+    0b1001: "▞",
+    0b1010: "▐",
+    0b1011: "▝",
+    0b1100: "▄",
+    0b1101: "▖",
+    0b1110: "▗",
+    # Only one color, which is either the foreground or the background
+    0b0000: "█",
+    0b1111: " ",
+}
 
 
 def ansify(
@@ -33,196 +63,215 @@ def ansify(
         if mode == Mode.Super:
             width *= 2
         ratio = original.height / original.width
-        image = original.resize(
-            (width, int(width * ratio)),
-            resample=Image.LANCZOS
-        )
+        size = (width, int(width * ratio))
+        # JPEGs can be decoded directly at a fraction of their size, kept
+        # at least twice as big as needed, like `Image.thumbnail` does
+        original.draft("RGB", (size[0] * 2, size[1] * 2))
+        image = original.resize(size, resample=Image.LANCZOS)
     else:
         image = original
 
-    pixels = image.convert("RGBA").load()
+    # Rows of RGBA pixels, as integers wide enough to be summed
+    pixels = numpy.asarray(image.convert("RGBA"), dtype=numpy.int64)
+
+    if palette != Palette.RGB and mode == Mode.FloydSteinberg:
+        pixels = floyd_steinberg(pixels, palette)
+        palette = Palette.RGB
+    elif palette != Palette.RGB and mode == Mode.Bayer:
+        pixels = bayer(pixels, palette)
+        palette = Palette.RGB
 
     if mode == Mode.Super:
         render = superify
-    elif mode == Mode.Pixels:
+    elif mode in (Mode.Pixels, Mode.FloydSteinberg, Mode.Bayer):
         render = pixelify
     elif mode == Mode.Dithered and palette != Palette.RGB:
         render = ditherify
     else:
         render = blockify
 
-    return render(image, pixels, palette, format_func)
-
-
-def superify(image, pixels, palette, format_func):
-    for y in range(0, image.height - (image.height % 4), 4):
-        line = []
-        for x in range(0, image.width - (image.width % 2), 2):
-            # We take 2x4 pixels ⣿
-            original = [
-                [pixels[x + i, y + j] for i in range(2)]
-                for j in range(4)
-            ]
-            # We average the first and last two rows together
-            # to get 2x2 pixels (four corners)
-            corners = [
-                average_color(original[i * 2][j], original[i * 2 + 1][j])
-                for i in range(2)
-                for j in range(2)
-            ]
-            levels = [brightness(corner) for corner in corners]
-            average_level = average(levels)
-
-            # Split corners in 2 groups, depending if they are
-            # lighter or darker than the average brightness
-            group_a: List[Sequence[int]] = []
-            group_b: List[Sequence[int]] = []
-            groups = {}
-            for i in range(len(corners)):
-                color = corners[i]
-                if levels[i] < average_level:
-                    group, letter = group_a, "a"
-                else:
-                    group, letter = group_b, "b"
-                group.append(color)
-                groups[color] = letter
-
-            # Calculate the color for each group
-            # (average of all colors in that group)
-            color_a = average_color(*group_a)
-            color_b = average_color(*group_b)
-
-            if not color_a:
-                block = " "
-                color_a = (0, 0, 0)
-            elif not color_b:
-                block = "█"
-                color_b = (0, 0, 0)
-            else:
-                pattern = "".join(
-                    groups[corners[i]]
-                    for i in range(len(corners))
-                )
-                # We have two colors: there's at least one on each
-                # side of the averge distance, by nature of an average
-                mapping = {
-                    "aaab": "▛",
-                    "aaba": "▜",
-                    "aabb": "▀",
-                    "abaa": "▙",
-                    "abab": "▌",
-                    "abba": "▚",
-                    "abbb": "▘",
-                    "baaa": "▟",
-                    "baab": "▞",
-                    "baba": "▐",
-                    "babb": "▝",
-                    "bbaa": "▄",
-                    "bbab": "▖",
-                    "bbba": "▗",
-                }
-                block = mapping[pattern]
-
-            if palette != Palette.RGB:
-                color_a = n_closest_color(1, color_a, palette)[0]
-                color_b = n_closest_color(1, color_b, palette)[0]
-
-            t_a = FormatTag(
-                kind=F.ForegroundColor,
-                data={"color": rgb_to_hex(*color_a)}
-            )
-            t_b = FormatTag(
-                kind=F.BackgroundColor,
-                data={"color": rgb_to_hex(*color_b)}
-            )
-
-            line.extend([t_a, t_b, block, t_a.close_tag, t_b.close_tag])
+    return render(pixels, palette, format_func)
 
-        yield format_func(line)
 
+def superify(pixels, palette, format_func):
+    height, width = pixels.shape[0] // 4, pixels.shape[1] // 2
+    # We take 2x4 pixels ⣿ (rows, and columns, of the same cell together)
+    cells = pixels[:height * 4, :width * 2].reshape(height, 2, 2, width, 2, 4)
+    # We average the first and last two rows together
+    # to get 2x2 pixels (four corners)
+    corners = (cells[:, :, 0] + cells[:, :, 1]) // 2
+    corners = corners.transpose(0, 2, 1, 3, 4).reshape(height, width, 4, 4)
 
-def pixelify(image, pixels, palette, format_func):
-    for y in range(0, image.height - (image.height % 2), 2):
-        line = []
-        for x in range(image.width):
-            t1 = color_tag(pixels, x, y, palette, background=True)
-            t2 = color_tag(pixels, x, y + 1, palette)
-            line.extend([t1, t2, "▄", t2.close_tag, t1.close_tag])
-        yield format_func(line)
-
+    levels = corners[..., :3].sum(axis=-1) / 3
+    average_level = (
+        levels[..., 0] + levels[..., 1] + levels[..., 2] + levels[..., 3]
+    ) / 4
 
-def ditherify(image, pixels, palette, format_func):
-    for y in range(0, image.height - (image.height % 2), 2):
-        line = []
-        for x in range(image.width):
-            c0 = average_color(pixels[x, y], pixels[x, y + 1])
-            c1, c2 = n_closest_color(2, c0, palette)
-
-            d01 = sqrt(distance(c0, c1))
-            d12 = sqrt(distance(c1, c2))
-            d02 = sqrt(distance(c0, c2))
-
-            if d02 > d01 + d12 or d12 == 0:
-                c2 = c1
-                block = "█"
-            else:
-                factor = d01 / d12
-                if factor >= 1:
-                    factor = 0.99
-                block = " ░▒▓▓"[int(factor * 5)]
-
-            hex1, hex2 = rgb_to_hex(*c1), rgb_to_hex(*c2)
-            t1 = FormatTag(kind=F.ForegroundColor, data={"color": hex2})
-            t2 = FormatTag(kind=F.BackgroundColor, data={"color": hex1})
-            line.extend([t1, t2, block, t2.close_tag, t1.close_tag])
-        yield format_func(line)
+    # Split corners in 2 groups, depending if they are
+    # lighter or darker than the average brightness
+    lighter = levels >= average_level[..., None]
+    pattern = (lighter * [8, 4, 2, 1]).sum(axis=-1)
 
+    # Calculate the color for each group
+    # (average of all colors in that group)
+    color_a = average_group(corners, ~lighter)
+    color_b = average_group(corners, lighter)
 
-def blockify(image, pixels, palette, format_func):
-    for y in range(0, image.height - (image.height % 2), 2):
-        line = []
-        for x in range(image.width):
-            c = average_color(pixels[x, y], pixels[x, y + 1])
-            if palette != Palette.RGB:
-                c = n_closest_color(1, c, palette)[0]
-            h = rgb_to_hex(*c)
-            t = FormatTag(kind=F.ForegroundColor, data={"color": h})
-            line.extend([t, "█", t.close_tag])
+    if palette != Palette.RGB:
+        color_a = closest_colors(color_a, palette)
+        color_b = closest_colors(color_b, palette)
+
+    for row, hex_a, hex_b in zip(
+        pattern.tolist(), hex_colors(color_a), hex_colors(color_b)
+    ):
+        line: List = []
+        for n, a, b in zip(row, hex_a, hex_b):
+            t_a = FormatTag(kind=F.ForegroundColor, data={"color": a})
+            t_b = FormatTag(kind=F.BackgroundColor, data={"color": b})
+            line.extend([t_a, t_b, quadrants[n], t_a.close_tag, t_b.close_tag])
         yield format_func(line)
 
 
-def n_closest_color(n, color, palette_name):
-    palette = palettes[palette_name]
-    n_closest = nsmallest(
-        n, palette,
-        key=lambda k: distance(color, palette[k])
-    )
-    return [palette[closest] for closest in n_closest]
+def pixelify(pixels, palette, format_func):
+    top, bottom = pixel_rows(pixels)
+    if palette != Palette.RGB:
+        top = closest_colors(top, palette)
+        bottom = closest_colors(bottom, palette)
+
+    for hex_top, hex_bottom in zip(hex_colors(top), hex_colors(bottom)):
+        line: List = []
+        for h1, h2 in zip(hex_top, hex_bottom):
+            t1 = FormatTag(kind=F.BackgroundColor, data={"color": h1})
+            t2 = FormatTag(kind=F.ForegroundColor, data={"color": h2})
+            line.extend([t1, t2, "▄", t2.close_tag, t1.close_tag])
+        yield format_func(line)
 
 
-def color_tag(pixels, x, y, palette, background=False):
-    r, g, b, _ = pixels[x, y]
-    if palette != Palette.RGB:
-        r, g, b = n_closest_color(1, (r, g, b), palette)[0]
-    hex_color = rgb_to_hex(r, g, b)
-    return FormatTag(
-        kind=F.BackgroundColor if background else F.ForegroundColor,
-        data={"color": hex_color}
-    )
+def ditherify(pixels, palette, format_func):
+    top, bottom = pixel_rows(pixels)
+    c0 = (top + bottom) // 2
+    c1, c2 = closest_colors(c0, palette, n=2)
 
+    d01 = numpy.sqrt(distances(c0, c1))
+    d12 = numpy.sqrt(distances(c1, c2))
+    d02 = numpy.sqrt(distances(c0, c2))
 
-def average(values):
-    return sum(values) / len(values)
+    solid = (d02 > d01 + d12) | (d12 == 0)
+    c2 = numpy.where(solid[..., None], c1, c2)
+    factor = numpy.minimum(d01 / numpy.where(solid, 1, d12), 0.99)
+    shades = numpy.where(solid, 5, (factor * 5).astype(int))
 
+    rows = zip(shades.tolist(), hex_colors(c1), hex_colors(c2))
+    for row, hex1, hex2 in rows:
+        line: List = []
+        for shade, h1, h2 in zip(row, hex1, hex2):
+            t1 = FormatTag(kind=F.ForegroundColor, data={"color": h2})
+            t2 = FormatTag(kind=F.BackgroundColor, data={"color": h1})
+            line.extend([t1, t2, " ░▒▓▓█"[shade], t2.close_tag, t1.close_tag])
+        yield format_func(line)
 
-def rgb_to_hex(r, g, b, *args):
-    return '#%02x%02x%02x' % (r, g, b)
 
+def blockify(pixels, palette, format_func):
+    top, bottom = pixel_rows(pixels)
+    colors = (top + bottom) // 2
+    if palette != Palette.RGB:
+        colors = closest_colors(colors, palette)
 
-def average_color(*colors):
-    rgbs = zip(*colors)
-    return tuple([int(average(comp)) for comp in rgbs])
+    for row in hex_colors(colors):
+        line: List = []
+        for h in row:
+            t = FormatTag(kind=F.ForegroundColor, data={"color": h})
+            line.extend([t, "█", t.close_tag])
+        yield format_func(line)
 
 
-def brightness(color):
-    return sum(color[:3]) / 3
+def floyd_steinberg(pixels, palette):
+    """Replaces each pixel with its closest palette color, spreading the
+    difference to the next pixels with Floyd–Steinberg error diffusion.
+
+    A pixel receives errors from its left neighbour and from the three
+    pixels above it, so it is ready as soon as the pixel above and to its
+    right is. Pixels that are two columns further left on each next row
+    are ready at the same time, and are computed together.
+    """
+    height, width = pixels.shape[:2]
+    values = pixels[..., :3].astype(float)
+    result = numpy.empty_like(pixels[..., :3])
+    rows = numpy.arange(height)
+
+    for step in range(width + 2 * (height - 1)):
+        y = rows[(rows * 2 <= step) & (step - rows * 2 < width)]
+        x = step - y * 2
+
+        value = numpy.clip(values[y, x], 0, 255)
+        color = quantizers[palette].closest(value.round().astype(int))[0]
+        result[y, x] = color
+        error = value - color
+
+        # Separately, as neighbours of different pixels can be the same
+        right = x + 1 < width
+        values[y[right], x[right] + 1] += error[right] * 7 / 16
+        below = y + 1 < height
+        y, x, error = y[below] + 1, x[below], error[below]
+        left = x > 0
+        values[y[left], x[left] - 1] += error[left] * 3 / 16
+        values[y, x] += error * 5 / 16
+        right = x + 1 < width
+        values[y[right], x[right] + 1] += error[right] / 16
+
+    return result
+
+
+# Thresholds from 0 to 1 (excluded) spread over 4x4 pixels
+bayer_matrix = numpy.array([
+    [0, 8, 2, 10],
+    [12, 4, 14, 6],
+    [3, 11, 1, 9],
+    [15, 7, 13, 5],
+]) / 16
+
+
+def bayer(pixels, palette):
+    """Replaces each pixel with the palette color closest to it once
+    offset by a Bayer matrix threshold, as large as the usual distance
+    between the colors of the palette."""
+    height, width = pixels.shape[:2]
+    thresholds = numpy.tile(bayer_matrix, (height // 4 + 1, width // 4 + 1))
+    spread = 255 / len(palettes[palette]) ** (1 / 3)
+    offsets = (thresholds[:height, :width, None] - 0.5) * spread
+    values = numpy.clip(pixels[..., :3] + offsets, 0, 255)
+    return quantizers[palette].closest(values.round().astype(int))[0]
+
+
+def pixel_rows(pixels):
+    """Returns the even and odd rows of pixels, each pair of rows
+    being drawn as one line of text."""
+    height = pixels.shape[0] - pixels.shape[0] % 2
+    return pixels[0:height:2], pixels[1:height:2]
+
+
+def average_group(colors, mask):
+    """Averages the colors of each cell selected by the mask,
+    black for cells where none are."""
+    count = mask.sum(axis=-1)
+    total = (colors * mask[..., None]).sum(axis=-2)
+    return total // numpy.maximum(count, 1)[..., None]
+
+
+def distances(colors_1, colors_2):
+    return ((colors_1[..., :3] - colors_2[..., :3]) ** 2).sum(axis=-1)
+
+
+def closest_colors(colors, palette_name, n=1):
+    """Returns the colors of the palette closest to each of the colors.
+
+    With `n` > 1, returns the `n` closest colors, closest first.
+    """
+    closest = quantizers[palette_name].closest(colors, n)
+    return closest[0] if n == 1 else closest
+
+
+def hex_colors(colors) -> List[List[str]]:
+    """Returns rows of "#rrggbb" strings for an array of colors."""
+    packed = (colors[..., 0] << 16) | (colors[..., 1] << 8) | colors[..., 2]
+    return [["#%06x" % color for color in row] for row in packed.tolist()]
@@ -1,60 +1,90 @@
-import pyphen   # type: ignore
 import random
+import zlib
 
 from copy import copy
 from enum import Enum
 from itertools import groupby
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import List, Union, Optional, Callable, Tuple
 
 from ..domain import document as d
 from ..formatting import FormatTag, Format
+from . import hyphenation
 
 
-random.seed(1337)
-
 Alignment = Enum("Alignment", ["left", "center", "right", "justify"])
+LineBreaking = Enum("LineBreaking", ["greedy", "optimal"])
+
+# Justified text looks best when all lines are about as full, which needs
+# the whole paragraph to be considered. Other alignments break greedily.
+default_line_breaking = {
+    Alignment.left: LineBreaking.greedy,
+    Alignment.center: LineBreaking.greedy,
+    Alignment.right: LineBreaking.greedy,
+    Alignment.justify: LineBreaking.optimal,
+}
+
+# Knuth-Plass demerits, as in TeX
+line_penalty = 10
+hyphen_penalty = 50
+consecutive_hyphens_demerits = 3000
+max_badness = 10000
+tolerance = 1000
+# Characters a space can comfortably grow by. Doubling a space is already
+# very visible with monospaced fonts.
+space_stretch = 0.5
 
 Element = Union[FormatTag, str]
 Line = List[Union[Element, d.Space]]
 
-# TODO: Language in settings for hyphen dictionary
-pyphen_dictionary = pyphen.Pyphen(lang="en_US")
-wrap = pyphen_dictionary.wrap
-
 
 def align(
     text_elements: List[Union[d.TextElement, str]],
     alignment: Alignment,
     width: int,
     format_func: Optional[Callable] = None,
-    text_filter: Callable[[str], str] = lambda s: s
+    text_filter: Callable[[str], str] = lambda s: s,
+    line_breaking: Optional[LineBreaking] = None,
+    language: str = hyphenation.default_language
 ) -> List[str]:
 
+    if line_breaking is None:
+        line_breaking = default_line_breaking[alignment]
+
     elements = flatten(text_elements)
     words = [Word(elems) for elems in split(elements, d.Space())]
-    lines = break_words(words, width)
+    hyphenator = hyphenation.get(language)
+    if line_breaking == LineBreaking.optimal:
+        lines = break_words_optimal(words, width, hyphenator)
+    else:
+        lines = break_words(words, width, hyphenator)
     insert_spaces(lines, alignment, width)
     add_padding(lines, alignment, width)
     return format_lines(lines, text_filter, format_func)
 
 
-def break_words(words, width):
+def break_words(words, width, hyphenator=None):
     # Break up elements in lines (with hyphenation)
     # and cross tags over the line when tags are still open.
 
+    if hyphenator is None:
+        hyphenator = hyphenation.get()
+
     lines: List[Line] = [[]]
     open_tags: List[str] = []
+    # Length of the current line, each word being followed by a space
+    length = 0
 
     for word in words:
         line = lines[-1]
 
-        available = room_left(line, width)
+        available = width - length
 
         if len(word) <= available:
             append_word(word, line, open_tags)
+            length += len(word) + 1
         else:
-            hyphenated = wrap(word.word(), available)
+            hyphenated = hyphenator.wrap(word.word(), available)
 
             if hyphenated:
                 index = len(hyphenated[0]) - 1
@@ -64,8 +94,176 @@ def break_words(words, width):
                     left += "-"
                 append_word(left, line, open_tags)
                 end_line(lines, open_tags, next_word=right)
+                word = right
             else:
                 end_line(lines, open_tags, next_word=word)
+            length = len(word) + 1 if word else 0
+
+    end_line(lines, open_tags)
+    lines.pop()
+
+    return lines
+
+
+@dataclass
+class Breakpoint:
+    # The next line starts with this word...
+    word: int
+    # ...without its first characters, when breaking inside the word
+    offset: int
+    # Characters before the break, spaces excluded
+    position: int
+    # Width of the hyphen added at the end of the line
+    hyphen: int
+
+
+@dataclass
+class Node:
+    breakpoint: Breakpoint
+    demerits: float
+    previous: Optional["Node"]
+    # Whether a line starting at this breakpoint fit at least once
+    fits: bool = False
+
+
+def break_words_optimal(words, width, hyphenator=None):
+    """Breaks words in lines minimizing the paragraph's total demerits,
+    following Knuth and Plass' algorithm.
+
+    A line with more room left than others between its words is "bad".
+    Hyphenating costs a penalty, more so on consecutive lines.
+
+    Like TeX, lines worse than a tolerance are first not considered at all.
+    If that leaves no way to break the paragraph, any line is allowed,
+    the loosest costing the most, even overfull ones when a word doesn't
+    fit anywhere.
+    """
+    if not words:
+        return []
+    if hyphenator is None:
+        hyphenator = hyphenation.get()
+
+    points = list(breakpoints(words, hyphenator))
+    node = optimal_breaks(points, width, tolerance) \
+        or optimal_breaks(points, width, None)
+
+    ends = []
+    while node is not None and node.previous is not None:
+        ends.append(node.breakpoint)
+        node = node.previous
+
+    return lines_from_breakpoints(words, ends[::-1])
+
+
+def optimal_breaks(points, width, tolerance) -> Optional[Node]:
+    """Returns the last node of the best path through the breakpoints.
+
+    Active nodes are sorted by position, so lines starting from the first
+    ones are the longest: they are removed once overfull. Lines starting
+    from the last ones are the loosest: they are not looked at once over
+    the tolerance. This keeps the cost linear in the number of words.
+    """
+    active = [Node(points[0], 0, None)]
+    last = points[-1]
+    best = None
+
+    for point in points[1:]:
+        hyphenated = point.offset > 0
+        # Room left on a line from `start` is
+        # `end + start.position - (last_word - start.word)`
+        end = width - point.position - point.hyphen
+        last_word = point.word - (0 if hyphenated else 1)
+        best = None
+        overfull = 0
+
+        for node in active:
+            start = node.breakpoint
+            spaces = last_word - start.word
+            room = end + start.position - spaces
+
+            if room < 0:
+                overfull += 1
+                if node.fits or tolerance is not None:
+                    continue
+                # Nothing fits after this node (e.g. a very long word):
+                # allow this overfull line rather than failing
+                demerits = (line_penalty + max_badness) ** 2 * -room
+            else:
+                node.fits = True
+                if point is last or room == 0:
+                    badness = 0.0
+                elif spaces == 0 and tolerance is not None:
+                    badness = max_badness
+                else:
+                    # Inlined for speed, this is the innermost loop.
+                    # Not capped: when any line is allowed, the emptier
+                    # ones must still cost more
+                    ratio = room / ((spaces or 1) * space_stretch)
+                    badness = 100 * ratio * ratio * ratio
+                if tolerance is not None and badness > tolerance:
+                    break
+                demerits = (line_penalty + badness) ** 2
+
+            if hyphenated:
+                demerits += hyphen_penalty ** 2
+                if start.offset > 0:
+                    demerits += consecutive_hyphens_demerits
+
+            demerits += node.demerits
+            if best is None or demerits < best.demerits:
+                best = Node(point, demerits, node)
+
+        del active[:overfull]
+        if best is not None:
+            active.append(best)
+        elif not active:
+            return None
+
+    return best
+
+
+def breakpoints(words, hyphenator):
+    yield Breakpoint(0, 0, 0, 0)
+
+    positions = hyphenator.positions
+    position = 0
+    for i, word in enumerate(words):
+        if i > 0:
+            yield Breakpoint(i, 0, position, 0)
+        text = word.word()
+        for offset in positions(text):
+            # Don't add a hyphen if the word is a compound word
+            hyphen = 0 if text[offset - 1] == "-" else 1
+            yield Breakpoint(i, offset, position + offset, hyphen)
+        position += len(text)
+
+    yield Breakpoint(len(words), 0, position, 0)
+
+
+def lines_from_breakpoints(words, ends):
+    lines: List[Line] = [[]]
+    open_tags: List[str] = []
+    offsets: dict = {}
+    for end in ends:
+        offsets.setdefault(end.word, []).append(end.offset)
+
+    for i, word in enumerate(words):
+        breaks = offsets.get(i, [])
+        if breaks and breaks[0] == 0:
+            end_line(lines, open_tags)
+
+        consumed = 0
+        for offset in breaks:
+            if offset == 0:
+                continue
+            left, word = word.split_at(offset - consumed)
+            consumed = offset
+            if not left.word().endswith("-"):
+                left += "-"
+            append_word(left, lines[-1], open_tags)
+            end_line(lines, open_tags)
+
+        append_word(word, lines[-1], open_tags)
 
     end_line(lines, open_tags)
     lines.pop()
@@ -75,6 +273,16 @@ def break_words(words, width):
 
 def insert_spaces(lines, alignment, width):
     # Depending on alignment, insert appropriate amount of spaces between words
+
+    # Spaces are spread randomly, but the same paragraph must always come
+    # out the same, whatever was rendered before it (or in parallel to it):
+    # draw from a generator seeded with the paragraph's text and width.
+    if alignment == Alignment.justify:
+        text = "".join(
+            elem for line in lines for elem in line if isinstance(elem, str)
+        )
+        rng = random.Random(zlib.crc32(text.encode("UTF-8")) ^ width)
+
     for i, line in enumerate(lines):
         # For the last line, we will let it be left-aligned
         if alignment == Alignment.justify and i < len(lines) - 1:
@@ -89,13 +297,17 @@ def insert_spaces(lines, alignment, width):
                 and i != len(line) - 1
             ]
 
+            # Lines with a single word, or too long, can't be justified
+            if not indices_candidates or spaces_to_add < 0:
+                spaces_to_add = 0
+
             # If we have more spaces to add than candidates,
             # we need to double the population space.
             population: List[int] = copy(indices_candidates)
             while spaces_to_add > len(population):
                 population.extend(indices_candidates)
 
-            indices = random.sample(population, spaces_to_add)
+            indices = rng.sample(population, spaces_to_add)
             for index in indices:
                 assert isinstance(line[index], d.Space)
                 line[index].count += 1
@@ -150,9 +362,16 @@ def format_lines(lines, text_filter, format_func):
 @dataclass
 class Word:
     elems: List[Element]
+    # The word's text without tags, kept up to date by `+=`
+    text: str = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        self.text = "".join(
+            elem for elem in self.elems if isinstance(elem, str)
+        )
 
     def __len__(self):
-        return len(self.word())
+        return len(self.text)
 
     def __iadd__(self, s: str):
         last_str_index = next(
@@ -160,10 +379,11 @@ class Word:
             if isinstance(elem, str)
         )
         self.elems[last_str_index] += s
+        self.text += s
         return self
 
     def word(self) -> str:
-        return "".join(elem for elem in self.elems if isinstance(elem, str))
+        return self.text
 
     def split_at(self, index) -> Tuple["Word", "Word"]:
         left: List[Element] = []
@@ -225,10 +445,6 @@ def line_length(line: Line, with_spaces=False) -> int:
     return length_words
 
 
-def room_left(line: Line, width: int) -> int:
-    return width - line_length(line, with_spaces=True)
-
-
 def append_word(word, line, open_tags):
     for element in word.elems:
         if isinstance(element, FormatTag):
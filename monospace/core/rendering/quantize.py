@@ -0,0 +1,120 @@
+"""Closest palette colors of whole images, through lookup cubes
+
+Finding the palette color closest to a pixel means measuring its distance
+to every color of the palette, 256 of them for Xterm. Instead, the RGB
+cube is divided into cells of 8x8x8 colors, and each cell lists the few
+palette colors that can be among the closest to any color inside it:
+pixels are only measured against the colors of their cell.
+
+A color is left out of a cell when even the nearest point of the cell
+is further from it than the farthest point of the cell is from `n` other
+colors. Results are exactly those of measuring all colors, ties included.
+
+Lookup cubes are computed once per palette and number of closest colors
+asked for, and cached on disk.
+"""
+
+import numpy  # type: ignore
+from typing import Dict, List, Sequence, Tuple
+
+from .. import cache
+
+# Cells are 2 ** shift colors wide on each channel
+shift = 3
+cells = 256 >> shift
+
+cubes_cache = cache.Cache("palettes", max_size=16 * cache.MB)
+
+
+class Quantizer(object):
+    def __init__(self, colors: Sequence[Tuple[int, int, int]]):
+        self.colors = numpy.array(colors, dtype=numpy.int64)
+        # Cells are padded with this index, of a color too far to be chosen
+        self.padding = len(colors)
+        self.padded = numpy.vstack([self.colors, [[1 << 20] * 3]])
+        self.padded_colors = self.padded.tolist()
+        self.cubes: Dict[int, numpy.ndarray] = {}
+
+    def closest(self, colors, n: int = 1) -> List[numpy.ndarray]:
+        """Returns the `n` closest palette colors of each color of an array,
+        closest first. Colors as close as others come in palette order.
+
+        Colors can have more than 3 channels, like RGBA pixels: only the
+        first 3 are compared.
+        """
+        indices = self.closest_indices(colors, n)
+        return [self.colors[indices[..., i]] for i in range(n)]
+
+    def closest_indices(self, colors, n: int = 1) -> numpy.ndarray:
+        """Returns the indices in the palette of the `n` closest colors
+        of each color of an array, along a new last axis."""
+        rgb = colors[..., :3]
+        cube = self.cube(n)
+        candidates = cube[
+            rgb[..., 0] >> shift, rgb[..., 1] >> shift, rgb[..., 2] >> shift
+        ]
+        distance = (
+            (self.padded[candidates] - rgb[..., None, :]) ** 2
+        ).sum(axis=-1)
+
+        if n == 1:
+            order = distance.argmin(axis=-1)[..., None]
+        else:
+            order = distance.argsort(axis=-1, kind="stable")[..., :n]
+        return numpy.take_along_axis(candidates, order, axis=-1)
+
+    def closest_index(self, color: Tuple[int, int, int]) -> int:
+        """Returns the index in the palette of the color closest to a
+        single color, faster than with arrays of one color."""
+        r, g, b = color
+        candidates = self.cube(1)[r >> shift, g >> shift, b >> shift]
+        padded = self.padded_colors
+
+        def distance(index):
+            pr, pg, pb = padded[index]
+            return (pr - r) ** 2 + (pg - g) ** 2 + (pb - b) ** 2
+
+        return min(candidates.tolist(), key=distance)
+
+    def cube(self, n: int) -> numpy.ndarray:
+        if n not in self.cubes:
+            key = cache.make_key(
+                self.colors.tobytes(), n, shift, numpy.__version__
+            )
+            cube = cubes_cache.get(key)
+            if cube is None:
+                cube = self.make_cube(n)
+                cubes_cache.set(key, cube)
+            self.cubes[n] = cube
+        return self.cubes[n]
+
+    def make_cube(self, n: int) -> numpy.ndarray:
+        """Returns the indices of the candidate colors of each cell,
+        in palette order, padded to the same number for all cells."""
+        low = numpy.arange(cells)[:, None] << shift
+        high = low + (1 << shift) - 1
+
+        # Squared distances from each cell to each color, on each channel
+        nearest = []
+        farthest = []
+        for channel in self.colors.T:
+            outside = numpy.maximum(low - channel, 0) \
+                + numpy.maximum(channel - high, 0)
+            nearest.append(outside ** 2)
+            farthest.append(numpy.maximum(channel - low, high - channel) ** 2)
+
+        slices = []
+        for r in range(cells):
+            # Shape (green, blue, colors), one red slice at a time
+            near = nearest[0][r] + nearest[1][:, None] + nearest[2][None]
+            far = farthest[0][r] + farthest[1][:, None] + farthest[2][None]
+            bound = numpy.partition(far, n - 1, axis=-1)[..., n - 1]
+            slices.append(near <= bound[..., None])
+        candidates = numpy.stack(slices)
+
+        # Candidates first, in palette order, then padding
+        width = candidates.sum(axis=-1).max()
+        order = numpy.argsort(~candidates, axis=-1, kind="stable")
+        order = order[..., :width]
+        kept = numpy.take_along_axis(candidates, order, axis=-1)
+        return numpy.where(kept, order, self.padding).astype(numpy.int16)
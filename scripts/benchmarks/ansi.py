@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""Times the ANSI formatting of rows of an image
+
+Rows of half-blocks are made from the image in RGB and with the Xterm
+palette, then formatted for terminals of 2 ** 24, 256 and 16 colors.
+Prints the time per row on the first pass, when escape sequences are
+made for each new color, and on the next passes.
+
+Usage: scripts/benchmarks/ansi.py [IMAGE [WIDTH]]
+"""
+
+import os
+import sys
+import timeit
+from dataclasses import replace
+
+import numpy  # type: ignore
+from PIL import Image  # type: ignore
+
+root = os.path.join(os.path.dirname(__file__), "..", "..")
+sys.path.insert(0, root)
+
+from monospace.core import cache  # noqa
+from monospace.core.domain import Settings  # noqa
+from monospace.core.formatting import AnsiFormatter, ansi, coalesce  # noqa
+from monospace.core.rendering import images  # noqa
+
+image_path = os.path.join(root, "resources", "lenna.png")
+width = 62
+runs = 5
+
+
+def rows(palette):
+    image = Image.open(image_path)
+    height = int(width * image.height / image.width)
+    pixels = numpy.asarray(
+        image.resize((width, height)).convert("RGBA"), dtype=numpy.int64
+    )
+    lines = images.pixelify(pixels, palette, format_func=lambda line: line)
+    return [coalesce(line) for line in lines]
+
+
+def benchmark(lines, settings):
+    def first():
+        ansi.sequences.clear()
+        for line in lines:
+            AnsiFormatter.format_tags(line, settings)
+
+    def next():
+        for line in lines:
+            AnsiFormatter.format_tags(line, settings)
+
+    first_pass = min(timeit.repeat(first, number=1, repeat=runs))
+    next_passes = min(timeit.repeat(next, number=1, repeat=runs))
+    return first_pass / len(lines) * 1e6, next_passes / len(lines) * 1e6
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        image_path = sys.argv[1]
+    if len(sys.argv) > 2:
+        width = int(sys.argv[2])
+
+    cache.configure(enable=False)
+    settings = Settings.from_meta({}, "")
+
+    print("%-8s  %8s  %12s  %12s" % (
+        "palette", "colors", "first µs/row", "next µs/row"))
+    for palette in (images.Palette.RGB, images.Palette.Xterm):
+        lines = rows(palette)
+        for colors in (2 ** 24, 256, 16):
+            first, next = benchmark(
+                lines, replace(settings, ansi_colors=colors)
+            )
+            print("%-8s  %8d  %12.1f  %12.1f" % (
+                palette.name, colors, first, next))
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""Times greedy line breaking of a 10,000 words paragraph
+
+Prints the time taken by `break_words` alone, and by `align` (flattening,
+breaking, spacing and padding) for left aligned text, at several widths.
+
+Usage: scripts/benchmarks/break_words.py [WIDTH...]
+"""
+
+import os
+import sys
+import timeit
+
+root = os.path.join(os.path.dirname(__file__), "..", "..")
+sys.path.insert(0, root)
+
+from monospace.util import intersperse  # noqa
+from monospace.core.domain import document as d  # noqa
+from monospace.core.rendering.paragraph import (  # noqa
+    align, Alignment, LineBreaking, Word, break_words, flatten, split
+)
+
+size = 10000
+runs = 5
+
+
+def paragraph():
+    with open(os.path.join(root, "resources", "README.source.md")) as f:
+        words = f.read().split()
+    words = (words * (size // len(words) + 1))[:size]
+    return intersperse(words, d.Space())
+
+
+def benchmark(width, text):
+    words = [Word(elems) for elems in split(flatten(text), d.Space())]
+
+    def run_break_words():
+        break_words(words, width)
+
+    def run_align():
+        align(text, Alignment.left, width, line_breaking=LineBreaking.greedy)
+
+    breaking = min(timeit.repeat(run_break_words, number=1, repeat=runs))
+    aligning = min(timeit.repeat(run_align, number=1, repeat=runs))
+    print("%5d  %14.1f  %8.1f" % (width, breaking * 1000, aligning * 1000))
+
+
+if __name__ == "__main__":
+    text = paragraph()
+    print("%d words" % size)
+    print("%5s  %14s  %8s" % ("width", "break_words ms", "align ms"))
+    for width in map(int, sys.argv[1:] or [20, 40, 70]):
+        benchmark(width, text)
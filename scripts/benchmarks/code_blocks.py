@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""Times the highlighting of a document of 500 code blocks
+
+Code blocks are 15 lines long, taken from the sources of this package and
+from the PostScript template, some of them twice as books often repeat a
+snippet. Prints the time to highlight all of them once, then once more,
+and the time to render the whole document, a single chapter, with as many
+processes as jobs: the others highlight code blocks ahead of rendering.
+
+Usage: scripts/benchmarks/code_blocks.py [BLOCKS [JOBS]]
+"""
+
+import os
+import sys
+import time
+
+root = os.path.join(os.path.dirname(__file__), "..", "..")
+sys.path.insert(0, root)
+
+from monospace.core import cache  # noqa
+from monospace.core.domain import document as d, Settings  # noqa
+from monospace.core.formatting import AnsiFormatter  # noqa
+from monospace.core.render import render  # noqa
+from monospace.core.rendering.code import highlight_code_block  # noqa
+
+blocks = 500
+jobs = 1
+lines_per_block = 15
+
+
+def snippets():
+    sources = []
+    package = os.path.join(root, "monospace")
+    for directory, _, filenames in sorted(os.walk(package)):
+        for filename in sorted(filenames):
+            path = os.path.join(directory, filename)
+            if filename.endswith(".py"):
+                sources.append(("python", path))
+            elif filename.endswith(".ps"):
+                sources.append(("postscript", path))
+
+    for language, path in sources:
+        with open(path) as f:
+            lines = f.read().splitlines()
+        for i in range(0, len(lines), lines_per_block):
+            yield d.CodeBlock(
+                language=language,
+                code="\n".join(lines[i:i + lines_per_block])
+            )
+
+
+def document(size):
+    code_blocks = list(snippets())
+    # One in five snippets is repeated
+    code_blocks += code_blocks[::5]
+    code_blocks = (code_blocks * (size // len(code_blocks) + 1))[:size]
+    return [d.Chapter(d.Text(["Code"]), identifier="code"), *code_blocks]
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        blocks = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        jobs = int(sys.argv[2])
+
+    cache.configure(enable=False)
+    settings = Settings.from_meta({}, "book.md")
+    elements = document(blocks)
+    code_blocks = elements[1:]
+
+    def format_func(line):
+        return AnsiFormatter.format_tags(line, settings)
+
+    print("%d code blocks" % len(code_blocks))
+    for run in ("First", "Second"):
+        start = time.time()
+        for code_block in code_blocks:
+            highlight_code_block(code_block, format_func, width=60)
+        print("%s highlighting: %.3fs" % (run, time.time() - start))
+
+    start = time.time()
+    list(render(elements, settings, {}, formatter=AnsiFormatter, jobs=jobs))
+    print("Rendering, %d jobs: %.3fs" % (jobs, time.time() - start))
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""Compares greedy and optimal (Knuth-Plass) line breaking
+
+For justified paragraphs of increasing size, prints the time `align` takes
+per word and how good the result looks: the stretch of the loosest line
+(spaces added per gap between words), the number of loose lines (more
+than one space added every two gaps) and of hyphenated lines.
+
+Usage: scripts/benchmarks/line_breaking.py [WIDTH...]
+"""
+
+import os
+import re
+import sys
+import timeit
+
+root = os.path.join(os.path.dirname(__file__), "..", "..")
+sys.path.insert(0, root)
+
+from monospace.util import intersperse  # noqa
+from monospace.core.domain import document as d  # noqa
+from monospace.core.rendering.paragraph import (  # noqa
+    align, Alignment, LineBreaking
+)
+
+sizes = [100, 1000, 10000]
+gap = re.compile(r"(?<=\S) +(?=\S)")
+
+
+def corpus():
+    with open(os.path.join(root, "resources", "README.source.md")) as f:
+        words = [word for word in f.read().split() if word.isalpha()]
+    while True:
+        yield from words
+
+
+def measure(lines):
+    stretches = []
+    for line in lines[:-1]:
+        gaps = [len(g) for g in gap.findall(line)]
+        if gaps:
+            stretches.append((sum(gaps) - len(gaps)) / len(gaps))
+    loose = sum(stretch > 0.5 for stretch in stretches)
+    hyphens = sum(line.rstrip().endswith("-") for line in lines)
+    return max(stretches), loose, hyphens
+
+
+def benchmark(width):
+    print("Width %d" % width)
+    print("%8s  %-8s  %10s  %8s  %8s  %8s" % (
+        "words", "breaking", "per word", "loosest", "loose", "hyphens"))
+
+    words = corpus()
+    for size in sizes:
+        paragraph = intersperse([next(words) for _ in range(size)], d.Space())
+        runs = max(1, 2000 // size)
+
+        for line_breaking in LineBreaking:
+            def run():
+                return align(
+                    paragraph, Alignment.justify, width,
+                    line_breaking=line_breaking
+                )
+
+            seconds = timeit.timeit(run, number=runs) / runs
+            loosest, loose, hyphens = measure(run())
+            print("%8d  %-8s  %8.1fµs  %8.2f  %8d  %8d" % (
+                size, line_breaking.name, seconds / size * 1e6,
+                loosest, loose, hyphens))
+    print()
+
+
+if __name__ == "__main__":
+    for width in map(int, sys.argv[1:] or [40, 70]):
+        benchmark(width)
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""Typesets a synthetic book and checks the peak memory used
+
+Books are typeset as a stream: elements, blocks and pages are dropped as
+soon as they are written, so peak memory should not depend on the length
+of the book. Exits with an error if the peak resident set size is over
+the ceiling, 64 MB by default.
+
+The book is typeset as ANSI, then as PostScript, whose fonts are written
+before the pages but only with the glyphs the pages use, each in its own
+process. FORMAT typesets only one of them.
+
+Usage: scripts/benchmarks/memory.py [PAGES [CEILING_MB [PARSER [FORMAT]]]]
+"""
+
+import os
+import sys
+import time
+import random
+import resource
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+root = os.path.join(os.path.dirname(__file__), "..", "..")
+sys.path.insert(0, root)
+
+from monospace.cli.util import do_typeset  # noqa
+from monospace.core.formatting import (  # noqa
+    AnsiFormatter, PostScriptFormatter
+)
+
+pages = 5000
+ceiling = 64
+parser = "python"
+# About how many words fit on a page with the default dimensions
+words_per_page = 400
+formatters = {"ansi": AnsiFormatter, "ps": PostScriptFormatter}
+
+
+def book(path, pages):
+    with open(os.path.join(root, "resources", "README.source.md")) as f:
+        words = [word for word in f.read().split() if word.isalpha()]
+
+    random.seed(0)
+    chapters = pages // 20
+    paragraphs = pages * words_per_page // 100 // chapters
+
+    with open(path, "w") as f:
+        f.write("---\nlight-theme: false\n...\n\n")
+        for chapter in range(chapters):
+            f.write("# Chapter %d\n\n" % chapter)
+            for paragraph in range(paragraphs):
+                if paragraph % 10 == 0:
+                    f.write("## Part %d.%d\n\n" % (chapter, paragraph))
+                text = " ".join(random.choice(words) for _ in range(100))
+                f.write(text.capitalize() + ".\n\n")
+
+
+def typeset(source, directory, formatter, parser):
+    """Typesets the book, returns how many lines were written, in how
+    many seconds, and the peak resident set size in MB."""
+    start = time.time()
+    output = os.path.join(directory, "book")
+    do_typeset(source, formatter, output, parser=parser)
+    seconds = time.time() - start
+
+    with open("%s.%s" % (output, formatter.file_extension)) as f:
+        lines = sum(1 for _ in f)
+
+    # Kilobytes on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_mb = peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+    return lines, seconds, peak_mb
+
+
+if __name__ == "__main__":
+    names = list(formatters)
+    if len(sys.argv) > 1:
+        pages = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        ceiling = int(sys.argv[2])
+    if len(sys.argv) > 3:
+        parser = sys.argv[3]
+    if len(sys.argv) > 4:
+        names = [sys.argv[4]]
+
+    over = []
+    with tempfile.TemporaryDirectory() as directory:
+        source = os.path.join(directory, "book.md")
+        book(source, pages)
+        size = os.path.getsize(source) / 1024 / 1024
+        print("%d pages, %.1f MB of markdown" % (pages, size))
+
+        for name in names:
+            # A new process for each format, peaks are per process
+            with ProcessPoolExecutor(max_workers=1) as executor:
+                lines, seconds, peak_mb = executor.submit(
+                    typeset, source, directory, formatters[name], parser
+                ).result()
+            print("%s: %d lines typeset in %.1fs" % (name, lines, seconds))
+            print("%s: peak RSS: %.0f MB (ceiling %d MB)" % (
+                name, peak_mb, ceiling
+            ))
+            if peak_mb > ceiling:
+                over.append(name)
+
+    if over:
+        sys.exit("Peak memory over the ceiling: %s" % ", ".join(over))
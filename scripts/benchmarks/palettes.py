@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""Times the conversion of an image in every mode and palette
+
+For each palette, prints the time to find the closest colors of all the
+pixels of the image by measuring every palette color, and through the
+palette's lookup cube (how long building that cube takes is printed too),
+and how many pixels per second each dithering converts.
+Then prints the time `ansify` takes in each mode, with each palette, and
+how many pixels of the resized image it converts per second.
+
+Usage: scripts/benchmarks/palettes.py [IMAGE [WIDTH]]
+"""
+
+import os
+import sys
+import timeit
+
+import numpy  # type: ignore
+from PIL import Image  # type: ignore
+
+root = os.path.join(os.path.dirname(__file__), "..", "..")
+sys.path.insert(0, root)
+
+from monospace.core import cache  # noqa
+from monospace.core.domain import Settings  # noqa
+from monospace.core.formatting import AnsiFormatter  # noqa
+from monospace.core.rendering import images  # noqa
+from monospace.core.rendering.quantize import Quantizer  # noqa
+
+image_path = os.path.join(root, "resources", "lenna.png")
+width = 62
+runs = 5
+
+
+def best(function):
+    return min(timeit.repeat(function, number=1, repeat=runs)) * 1000
+
+
+def every_color(pixels, palette, n):
+    distance = ((pixels[..., None, :3] - palette) ** 2).sum(axis=-1)
+    return distance.argsort(axis=-1, kind="stable")[..., :n]
+
+
+def closest_colors(pixels):
+    print("Closest colors of %d pixels" % (pixels.size // 4))
+    print("%-10s  %2s  %10s  %10s  %10s" % (
+        "palette", "n", "every ms", "cube ms", "build ms"))
+    for name, colors in images.palettes.items():
+        palette = numpy.array(list(colors.values()))
+        for n in (1, 2):
+            quantizer = Quantizer(list(colors.values()))
+            building = best(lambda: quantizer.make_cube(n))
+            quantizer.cube(n)
+            print("%-10s  %2d  %10.2f  %10.2f  %10.1f" % (
+                name.name, n,
+                best(lambda: every_color(pixels, palette, n)),
+                best(lambda: quantizer.closest(pixels, n)),
+                building))
+    print()
+
+
+def dithering(pixels):
+    print("Dithering of %d pixels" % (pixels.size // 4))
+    print("%-10s  %-14s  %8s  %8s" % ("palette", "dithering", "ms", "Mpx/s"))
+    for palette in images.palettes:
+        for function in (images.floyd_steinberg, images.bayer):
+            ms = best(lambda: function(pixels, palette))
+            print("%-10s  %-14s  %8.1f  %8.2f" % (
+                palette.name, function.__name__, ms,
+                pixels.size // 4 / ms / 1000))
+    print()
+
+
+def modes(path, ratio):
+    settings = Settings.from_meta({}, "")
+
+    def format_func(line):
+        return AnsiFormatter.format_tags(line, settings)
+
+    print("ansify, width %d" % width)
+    print("%-10s  %-14s  %8s  %8s" % ("palette", "mode", "ms", "Mpx/s"))
+    for palette in images.Palette:
+        for mode in images.Mode:
+            def run():
+                list(images.ansify(path, format_func, mode, palette, width))
+            pixels = width * int(width * ratio)
+            if mode == images.Mode.Super:
+                pixels *= 4
+            ms = best(run)
+            print("%-10s  %-14s  %8.1f  %8.2f" % (
+                palette.name, mode.name, ms, pixels / ms / 1000))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        image_path = sys.argv[1]
+    if len(sys.argv) > 2:
+        width = int(sys.argv[2])
+
+    cache.configure(enable=False)
+    image = Image.open(image_path)
+    ratio = image.height / image.width
+    resized = image.resize((width * 2, int(width * 2 * ratio)))
+    pixels = numpy.asarray(resized.convert("RGBA"), dtype=numpy.int64)
+    closest_colors(pixels)
+    dithering(pixels)
+    modes(image_path, ratio)
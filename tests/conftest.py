@@ -0,0 +1,13 @@
+import pytest
+
+from monospace.core import cache
+
+
+@pytest.fixture(autouse=True)
+def cache_configuration(monkeypatch, tmp_path):
+    """Keeps caches in the test's temporary directory, and restores the
+    cache root and switch after tests that change them."""
+    root = str(tmp_path / "cache")
+    monkeypatch.setenv("MONOSPACE_CACHE_DIR", root)
+    monkeypatch.setattr(cache, "directory", root)
+    monkeypatch.setattr(cache, "enabled", cache.enabled)
@@ -0,0 +1,56 @@
+import os
+import marshal
+
+from monospace.core import cache
+
+
+def test_make_key():
+    assert cache.make_key("ab", "c") != cache.make_key("a", "bc")
+    assert cache.make_key("a", 1) == cache.make_key(b"a", 1)
+
+
+def test_cache_roundtrip(tmpdir):
+    cache.configure(root=str(tmpdir))
+    ast_cache = cache.Cache("test", max_size=cache.MB, serializer=marshal)
+    key = cache.make_key("source")
+
+    assert ast_cache.get(key) is None
+    ast_cache.set(key, {"blocks": [{"t": "Str", "c": "Hello"}]})
+    assert ast_cache.get(key) == {"blocks": [{"t": "Str", "c": "Hello"}]}
+
+    cache.configure(enable=False)
+    assert ast_cache.get(key) is None
+
+
+def test_cache_stale_entries(tmpdir):
+    cache.configure(root=str(tmpdir))
+    objects_cache = cache.Cache("test", max_size=cache.MB)
+    key = cache.make_key("source")
+    os.makedirs(objects_cache.path)
+
+    # A class that has been moved or removed since it was pickled
+    with open(os.path.join(objects_cache.path, key), "wb") as f:
+        f.write(b"cmonospace.moved\nThing\n)\x81.")
+    assert objects_cache.get(key) is None
+
+    objects_cache.set(key, "rebuilt")
+    assert objects_cache.get(key) == "rebuilt"
+
+
+def test_cache_eviction(tmpdir):
+    cache.configure(root=str(tmpdir))
+    lru_cache = cache.Cache("test", max_size=1000)
+    keys = [cache.make_key(i) for i in range(4)]
+
+    for i, key in enumerate(keys[:3]):
+        lru_cache.set(key, "x" * 300)
+        # Make sure modification times are far enough apart
+        os.utime(os.path.join(lru_cache.path, key), (i, i))
+
+    # Reading the first entry makes the second one the least recently used
+    assert lru_cache.get(keys[0]) is not None
+    lru_cache.set(keys[3], "x" * 300)
+
+    assert lru_cache.get(keys[1]) is None
+    assert lru_cache.get(keys[0]) is not None
+    assert lru_cache.get(keys[3]) is not None
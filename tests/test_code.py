@@ -0,0 +1,19 @@
+from monospace.core.formatting import FormatTag
+from monospace.core.rendering.code import highlight
+
+
+def test_highlight():
+    code = "def f(x):\n    return x"
+    lines = highlight(code, "python", 20, False)
+
+    assert highlight(code, "python", 20, False) is lines
+    assert len(lines) == 2
+    for line in lines:
+        text = "".join(e for e in line if not isinstance(e, FormatTag))
+        assert len(text) == 20
+    assert any(isinstance(e, FormatTag) for e in lines[0])
+
+
+def test_highlight_unknown_language():
+    lines = highlight("a  b", "nonexistent", 6, False)
+    assert lines == [["a", "  ", "b", "  "]]
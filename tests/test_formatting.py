@@ -0,0 +1,338 @@
+import io
+import os
+import re
+import gzip
+import time
+import pytest
+import importlib.util
+from dataclasses import replace
+
+from monospace.core.domain import Settings
+from monospace.core.formatting import (
+    AnsiFormatter, PdfFormatter, PostScriptFormatter, FormatTag, Format as F,
+    coalesce
+)
+from monospace.core.formatting.pdf import encode, merge_files
+from monospace.core.formatting.postscript import font, font_files, split_file
+from monospace.core.formatting.type42 import Type42Font
+
+red = FormatTag(kind=F.ForegroundColor, data={"color": "#ff0000"})
+blue = FormatTag(kind=F.ForegroundColor, data={"color": "#0000ff"})
+black = FormatTag(kind=F.BackgroundColor, data={"color": "#000000"})
+bold = FormatTag(kind=F.Bold)
+
+
+def test_coalesce():
+    line = [
+        black, red, "a", red.close_tag, black.close_tag,
+        black, red, "b", red.close_tag, black.close_tag,
+        black, blue, "c", blue.close_tag, black.close_tag,
+    ]
+    assert coalesce(line) == [
+        black, red, "a", "b", red.close_tag,
+        blue, "c", blue.close_tag, black.close_tag,
+    ]
+
+
+def test_coalesce_nesting():
+    # Only the outermost tags can stay open, closing tags in the right order
+    line = [bold, red, "a", red.close_tag, bold.close_tag, red, "b"]
+    assert coalesce(line) == [
+        bold, red, "a", red.close_tag, bold.close_tag, red, "b"
+    ]
+    line = [red, bold, "a", bold.close_tag, red.close_tag, red, "b"]
+    assert coalesce(line) == [red, bold, "a", bold.close_tag, "b"]
+
+
+def test_coalesce_other_lines():
+    # Tags closed from a previous line are kept
+    line = ["a", red.close_tag, red, "b", red.close_tag]
+    assert coalesce(line) == line
+
+
+def test_ansi_colors():
+    settings = Settings.from_meta({}, "")
+    line = [red, "a", red.close_tag]
+
+    assert AnsiFormatter.format_tags(line, settings) == \
+        "\033[38;2;255;0;0ma\033[39m"
+    settings = replace(settings, ansi_colors=256)
+    assert AnsiFormatter.format_tags(line, settings) == "\033[38;5;9ma\033[39m"
+    settings = replace(settings, ansi_colors=16)
+    assert AnsiFormatter.format_tags(line, settings) == "\033[91ma\033[39m"
+
+
+def test_write_file(tmpdir):
+    settings = Settings.from_meta({}, "")
+    pages = [["a", "b"], ["c"]]
+
+    text = io.StringIO()
+    written = AnsiFormatter.write_file(text, pages, settings)
+    assert written.size == len(text.getvalue())
+
+    path = str(tmpdir.join("book"))
+    AnsiFormatter.write_file(path, pages, settings)
+    with open(path + ".ansi") as f:
+        assert f.read() == text.getvalue()
+
+    AnsiFormatter.write_file(path, pages, settings, compression="gzip")
+    with gzip.open(path + ".ansi.gz", "rt") as f:
+        assert f.read() == text.getvalue()
+
+
+def test_write_file_writers():
+    settings = Settings.from_meta({}, "")
+    pages = [["a", "b"], ["c"]]
+    text = io.StringIO()
+    AnsiFormatter.write_file(text, pages, settings)
+
+    class Writer:
+        """Has nothing but a `write` method."""
+        def __init__(self):
+            self.parts = []
+
+        def write(self, part):
+            self.parts.append(part)
+
+    writer = Writer()
+    AnsiFormatter.write_file(writer, pages, settings)
+    assert "".join(writer.parts) == text.getvalue()
+
+    writer.mode = "wb"
+    writer.parts = []
+    AnsiFormatter.write_file(writer, pages, settings)
+    assert b"".join(writer.parts).decode("UTF-8") == text.getvalue()
+
+    with pytest.raises(TypeError):
+        AnsiFormatter.write_file(Writer(), pages, settings, "gzip")
+
+
+def test_write_file_seconds():
+    settings = Settings.from_meta({}, "")
+
+    def pages():
+        # Pages are laid out as they are written
+        for page in [["a"], ["b"]]:
+            time.sleep(0.05)
+            yield page
+
+    for formatter in (AnsiFormatter, PdfFormatter):
+        written = formatter.write_file(io.BytesIO(), pages(), settings)
+        assert written.seconds >= 0.1, formatter
+
+
+@pytest.mark.skipif(
+    importlib.util.find_spec("zstandard") is None,
+    reason="Needs zstandard"
+)
+def test_write_file_zstandard(tmpdir):
+    import zstandard  # type: ignore
+    settings = Settings.from_meta({}, "")
+    pages = [["a", "b"], ["c"]]
+    text = io.StringIO()
+    AnsiFormatter.write_file(text, pages, settings)
+
+    def decompress(data):
+        reader = zstandard.ZstdDecompressor().stream_reader(io.BytesIO(data))
+        return reader.read().decode("UTF-8")
+
+    path = str(tmpdir.join("book"))
+    AnsiFormatter.write_file(path, pages, settings, compression="zstd")
+    with open(path + ".ansi.zst", "rb") as f:
+        assert decompress(f.read()) == text.getvalue()
+
+    # Streams given by the caller are left open
+    stream = io.BytesIO()
+    AnsiFormatter.write_file(stream, pages, settings, compression="zstd")
+    assert decompress(stream.getvalue()) == text.getvalue()
+
+
+@pytest.mark.skipif(
+    importlib.util.find_spec("zstandard") is not None,
+    reason="Needs zstandard to be missing"
+)
+def test_write_file_without_zstandard(tmpdir):
+    settings = Settings.from_meta({}, "")
+    path = str(tmpdir.join("book"))
+    with pytest.raises(RuntimeError):
+        AnsiFormatter.write_file(path, [["a"]], settings, compression="zstd")
+    assert not os.path.exists(path + ".ansi.zst")
+
+
+def test_postscript_font_subsets():
+    settings = Settings.from_meta({}, "")
+    line = ["a(", bold, "b", bold.close_tag]
+    pages = [[PostScriptFormatter.format_tags(line, settings)]]
+
+    text = io.StringIO()
+    PostScriptFormatter.write_file(text, pages, settings)
+    document = text.getvalue()
+    assert len(document) < len(PostScriptFormatter.begin_file(settings)) / 4
+
+    regular, _, bold_font, _ = [
+        Type42Font("%!PS-TrueTypeFont" + source)
+        for source in document.split("%!PS-TrueTypeFont")[1:]
+    ]
+    assert set(regular.glyphs) == {".notdef", "a", "parenleft"}
+    assert set(bold_font.glyphs) == {".notdef", "b"}
+
+    # Glyphs keep their index, and their outline
+    subset = regular.glyph_offsets()
+    offsets = font("fR").glyph_offsets()
+    index = font("fR").glyphs["a"]
+    assert regular.glyphs["a"] == index
+    assert subset[index + 1] - subset[index] == \
+        offsets[index + 1] - offsets[index]
+
+
+def test_postscript_compact():
+    settings = Settings.from_meta({}, "")
+    line = [
+        red, "a", red.close_tag, red, "b", bold, bold.close_tag, "\n(",
+        red.close_tag,
+    ]
+    formatted = PostScriptFormatter.format_tags(line, settings)
+    page = PostScriptFormatter.format_page([formatted, formatted], settings)
+
+    # Colors are set once, strings shown together, even across lines
+    assert page.count("16#ff0000 sethexcolor") == 1
+    assert "(ab\n\\() u" in page
+    assert not re.search(r"(^|\s)\(\) u", page)
+    assert "fB" not in page
+
+    # Colors set on many pages are set by procedures
+    text = io.StringIO()
+    PostScriptFormatter.write_file(text, [[formatted]] * 3, settings)
+    document = text.getvalue()
+    assert "/F0 { 1 0 0 setrgbcolor } bind def" in document
+    body = document.split("%%EndSetup")[1]
+    assert len(re.findall(r"\bF0\b", body)) == 3
+
+
+def test_postscript_color_procedures_skip_strings():
+    settings = Settings.from_meta({}, "")
+    line = [red, "a", red.close_tag, " 16#ff0000 sethexcolor"]
+    formatted = PostScriptFormatter.format_tags(line, settings)
+
+    text = io.StringIO()
+    PostScriptFormatter.write_file(text, [[formatted]] * 3, settings)
+    body = text.getvalue().split("%%EndSetup")[1]
+    # Text that looks like an operator is left as it is
+    assert body.count("F0 ") == 3
+    assert body.count("( 16#ff0000 sethexcolor) u") == 3
+
+
+def test_pdf():
+    settings = Settings.from_meta({}, "")
+    line = ["a", black, bold, "b", bold.close_tag, black.close_tag]
+    formatted = PdfFormatter.format_tags(line, settings)
+    pages = [[formatted, formatted], [formatted]]
+
+    pdf = io.BytesIO()
+    written = PdfFormatter.write_file(pdf, pages, settings)
+    document = pdf.getvalue()
+    assert written.size == len(document)
+    assert document.startswith(b"%PDF-1.4")
+
+    assert_offsets(document)
+    assert document.count(b"/Type /Page ") == 2
+    # Fonts are shared by pages, with only the glyphs used
+    assert document.count(b"/FontFile2") == 2
+    assert b"/Count 2" in document
+
+
+def test_pdf_glyph_codes():
+    # Each document has its own glyphs, filled as pages are encoded
+    glyphs = {selection: {} for selection in font_files}
+    content = encode(r"/fR 10 Tf (a\() Tj /fB 10 Tf (a) Tj", glyphs)
+
+    index = font("fR").glyphs["a"]
+    assert content.startswith("/fR 10 Tf <%04X" % index)
+    assert set(glyphs["fR"]) == {"a", "("}
+    assert glyphs["fB"] == {"a": font("fB").glyphs["a"]}
+    assert glyphs["fI"] == {}
+
+
+def test_pdf_colors_across_pieces():
+    settings = Settings.from_meta({}, "")
+    pieces = [
+        PdfFormatter.format_tags([red, black], settings),
+        PdfFormatter.format_tags(["a"], settings),
+    ]
+    glyphs = {selection: {} for selection in font_files}
+    content = encode(" ".join(pieces), glyphs)
+
+    # A box behind the text, then back to the foreground of the first piece
+    assert "/bx" in content
+    assert "EMC 1 0 0 rg /fR 10 Tf <" in content
+
+
+def test_pdf_glyph_widths():
+    # Like glyphshow, a circled number takes two cells and a combining
+    # mark none, with the boxes of backgrounds behind all of them
+    settings = Settings.from_meta({}, "")
+    line = [black, "\u2460e\u0301", black.close_tag]
+    pages = [[PdfFormatter.format_tags(line, settings)]]
+    glyphs = {selection: {} for selection in font_files}
+    content = encode(pages[0][0], glyphs)
+    assert "/bx 10 Tf <010101> Tj [1500] TJ" in content
+
+    pdf = io.BytesIO()
+    PdfFormatter.write_file(pdf, pages, settings)
+    glyphs = font("fR").glyphs
+    widths = "/W [%d [0] %d [1000]]" % (
+        glyphs["acutecomb"], glyphs["uni2460"]
+    )
+    assert widths.encode() in pdf.getvalue()
+
+
+def assert_offsets(document):
+    """Checks that each object is where the table of offsets says."""
+    start = int(re.search(rb"startxref\n(\d+)", document).group(1))
+    entries = re.findall(rb"(\d{10}) \d{5} ([nf])", document[start:])
+    for number, (offset, kind) in enumerate(entries):
+        if kind == b"n":
+            assert document[int(offset):].startswith(b"%d 0 obj" % number)
+
+
+def test_split_postscript(tmpdir):
+    settings = Settings.from_meta({}, "")
+    pages = [
+        [PostScriptFormatter.format_tags([str(i)], settings)]
+        for i in range(5)
+    ]
+    path = str(tmpdir.join("book"))
+    PostScriptFormatter.write_file(path, pages, settings)
+
+    parts = split_file(path + ".ps", 2, str(tmpdir))
+    with open(path + ".ps") as f:
+        prologue = f.read().split("%%EndSetup\n")[0]
+    texts = []
+    for part in parts:
+        with open(part) as f:
+            text = f.read()
+        assert text.startswith(prologue)
+        assert text.endswith("showpage\n%%EOF\n")
+        texts.append(text)
+    assert [text.count("showpage") for text in texts] == [3, 2]
+    assert "(3) u" in texts[1]
+
+
+def test_merge_pdf(tmpdir):
+    settings = Settings.from_meta({}, "")
+    paths = []
+    for pages in ([["a"], ["b"]], [["c"]]):
+        paths.append(str(tmpdir.join("%d" % len(paths))))
+        PdfFormatter.write_file(paths[-1], pages, settings)
+
+    merged = io.BytesIO()
+    merge_files([path + ".pdf" for path in paths], merged)
+    document = merged.getvalue()
+    assert_offsets(document)
+    # One page tree, with all the pages
+    tree, kids = re.findall(
+        rb"(\d+) 0 obj\n<< /Type /Pages /Kids \[([^\]]*)\] /Count 3", document
+    )[0]
+    for page in re.findall(rb"(\d+) 0 R", kids):
+        body = document.split(b"\n%s 0 obj\n" % page)[1]
+        assert body.startswith(b"<< /Type /Page /Parent %s 0 R" % tree)
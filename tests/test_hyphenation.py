@@ -0,0 +1,47 @@
+import pyphen  # type: ignore
+
+from monospace.core import cache
+from monospace.core.rendering import hyphenation
+
+words = ["sportsman", "newspaper", "hyphenation", "a", "the", "well-known"]
+
+
+def test_wrap_like_pyphen():
+    hyphenator = hyphenation.Hyphenator("en_US")
+    dictionary = pyphen.Pyphen(lang="en_US")
+    for word in words:
+        for width in range(len(word) + 2):
+            assert hyphenator.wrap(word, width) == dictionary.wrap(word, width)
+
+
+def test_languages():
+    assert hyphenation.get("en-US") is hyphenation.get("en_US")
+    assert hyphenation.get("xx").wrap("sportsman", 6) is None
+
+
+def test_pyphen_version(monkeypatch):
+    version = hyphenation.pyphen_version()
+    # Pyphen 0.9 has no __version__
+    monkeypatch.delattr(pyphen, "__version__", raising=False)
+    assert hyphenation.pyphen_version() == version
+
+
+def test_persistence(tmpdir):
+    cache.configure(root=str(tmpdir))
+    hyphenator = hyphenation.Hyphenator("en_US")
+    hyphenator.preload(words)
+    hyphenator.save()
+    assert not hyphenator.modified
+
+    reloaded = hyphenation.Hyphenator("en_US")
+    assert "newspaper" in reloaded.words
+    assert reloaded.positions("newspaper") == (4, 6)
+
+
+def test_vocabulary():
+    ast = {"blocks": [{"t": "Para", "c": [
+        {"t": "Str", "c": "Hello"},
+        {"t": "Space"},
+        {"t": "Emph", "c": [{"t": "Str", "c": "world"}]},
+    ]}]}
+    assert hyphenation.vocabulary(ast) == {"Hello", "world"}
@@ -0,0 +1,71 @@
+import numpy  # type: ignore
+from PIL import Image  # type: ignore
+
+from monospace.core.rendering import images
+from monospace.core.rendering.quantize import Quantizer
+
+black, gray, white = (0, 0, 0), (100, 100, 100), (255, 255, 255)
+
+
+def ansify(tmpdir, pixels, mode, palette=images.Palette.RGB):
+    image = Image.new("RGB", (len(pixels[0]), len(pixels)))
+    image.putdata([pixel for row in pixels for pixel in row])
+    path = str(tmpdir.join("image.png"))
+    image.save(path)
+    return list(images.ansify(
+        path, format_func=lambda line: line, mode=mode, palette=palette
+    ))
+
+
+def test_super(tmpdir):
+    # Only the top left corner is lighter
+    pixels = [
+        [white, black],
+        [white, black],
+        [black, black],
+        [black, black],
+    ]
+    line, = ansify(tmpdir, pixels, images.Mode.Super)
+    foreground, background, block = line[:3]
+
+    assert block == "▟"
+    assert foreground.data["color"] == "#000000"
+    assert background.data["color"] == "#ffffff"
+
+
+def test_palette(tmpdir):
+    pixels = [[gray, white], [gray, white]]
+    line, = ansify(
+        tmpdir, pixels, images.Mode.Blocks, images.Palette.Monochrome
+    )
+    tags = [elem for elem in line if not isinstance(elem, str)]
+
+    assert [tag.data["color"] for tag in tags if tag.open] == [
+        "#000000", "#ffffff"
+    ]
+
+
+def test_quantizer():
+    numpy.random.seed(0)
+    colors = numpy.random.randint(0, 256, size=(5000, 3))
+    palette = numpy.array(list(images.XTERM_256.values()))
+    quantizer = Quantizer(list(images.XTERM_256.values()))
+
+    distance = ((colors[:, None] - palette) ** 2).sum(axis=-1)
+    order = distance.argsort(axis=-1, kind="stable")
+    first, second = quantizer.closest(colors, n=2)
+
+    assert (first == palette[order[:, 0]]).all()
+    assert (second == palette[order[:, 1]]).all()
+    assert (quantizer.closest(colors)[0] == first).all()
+
+
+def test_dithering():
+    # Half of the pixels of a mid gray are white, with only two colors
+    pixels = numpy.full((16, 16, 4), 128)
+    for dither in (images.floyd_steinberg, images.bayer):
+        colors = dither(pixels, images.Palette.Monochrome)
+        white = (colors == 255).all(axis=-1).mean()
+        black = (colors == 0).all(axis=-1).mean()
+        assert white + black == 1
+        assert 0.4 < white < 0.6
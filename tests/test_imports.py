@@ -0,0 +1,30 @@
+import subprocess
+import sys
+
+# Modules only needed for some books or formats, imported on first use
+heavy_modules = [
+    "jinja2", "numpy", "pkg_resources", "pygments", "pygments.lexers",
+    "pypandoc", "pyphen", "PIL", "PIL.Image",
+]
+
+
+def imported_modules(statement):
+    """Returns the names of all modules imported by a statement,
+    run in a new interpreter."""
+    result = subprocess.run(
+        [
+            sys.executable, "-c",
+            statement + "; import sys; print('\\n'.join(sys.modules))"
+        ],
+        stdout=subprocess.PIPE, universal_newlines=True, check=True
+    )
+    return set(result.stdout.splitlines())
+
+
+def test_heavy_modules_imported_on_first_use():
+    modules = imported_modules(
+        "import monospace.cli;"
+        "from monospace.core.formatting import AnsiFormatter"
+    )
+
+    assert [module for module in heavy_modules if module in modules] == []
@@ -0,0 +1,68 @@
+import os
+import glob
+import json
+import pytest
+
+from monospace.core.parsing import markdown, pandoc
+
+resources = os.path.join(os.path.dirname(__file__), "..", "resources")
+
+
+def pandoc_version():
+    try:
+        return int(pandoc.version().split(".")[0])
+    except OSError:
+        return 0
+
+
+@pytest.mark.skipif(pandoc_version() < 3, reason="Needs Pandoc 3")
+@pytest.mark.parametrize(
+    "source_filename",
+    sorted(glob.glob(os.path.join(resources, "*.md"))),
+    ids=os.path.basename
+)
+def test_same_ast_as_pandoc(source_filename):
+    with open(source_filename, encoding="UTF-8") as f:
+        source = f.read()
+
+    expected = json.loads(pandoc.convert(source, "markdown", "json"))
+    ast = markdown.parse(source)
+
+    assert ast["meta"] == expected["meta"]
+    assert ast["blocks"] == expected["blocks"]
+
+
+@pytest.mark.skipif(pandoc_version() < 3, reason="Needs Pandoc 3")
+def test_tabs_like_pandoc_command():
+    import pypandoc  # type: ignore
+    source = "```\ntab\tinside\n\tcode\n\u00e9\tx\n```\n\n\tindented\n"
+
+    expected = json.loads(
+        pypandoc.convert_text(source, "json", format="markdown")
+    )
+    assert json.loads(pandoc.convert(source, "markdown", "json")) == expected
+    assert markdown.parse(source)["blocks"] == expected["blocks"]
+
+
+def test_lists():
+    ast = markdown.parse("- a\n- b\n\n1. c\n\n2. d\n")
+    assert ast["blocks"] == [
+        {"t": "BulletList", "c": [
+            [{"t": "Plain", "c": [{"t": "Str", "c": "a"}]}],
+            [{"t": "Plain", "c": [{"t": "Str", "c": "b"}]}],
+        ]},
+        {"t": "OrderedList", "c": [
+            [1, {"t": "Decimal"}, {"t": "Period"}],
+            [
+                [{"t": "Para", "c": [{"t": "Str", "c": "c"}]}],
+                [{"t": "Para", "c": [{"t": "Str", "c": "d"}]}],
+            ]
+        ]},
+    ]
+
+
+def test_header_identifiers():
+    ast = markdown.parse("# 1. Hello *World*\n\n# Hello World\n\n# {#custom}")
+    assert [block["c"][1][0] for block in ast["blocks"]] == [
+        "hello-world", "hello-world-1", "custom"
+    ]
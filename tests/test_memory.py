@@ -0,0 +1,34 @@
+import os
+import re
+import subprocess
+import sys
+
+script = os.path.join(
+    os.path.dirname(__file__), "..", "scripts", "benchmarks", "memory.py"
+)
+
+# MB that the peak resident set size may grow by, from a short book to a
+# book three times longer, as libraries and caches warm up. Keeping the
+# whole book in memory adds about 20 MB per 100 pages.
+growth = 8
+
+
+def peaks(pages, cache):
+    """Typesets a synthetic book of some pages with the memory benchmark,
+    under its default ceiling, returns the peak RSS of each format in MB."""
+    result = subprocess.run(
+        [sys.executable, script, str(pages)], stdout=subprocess.PIPE,
+        universal_newlines=True, check=True,
+        env=dict(os.environ, MONOSPACE_CACHE_DIR=cache)
+    )
+    found = re.findall(r"(\w+): peak RSS: (\d+) MB", result.stdout)
+    return {name: int(peak) for name, peak in found}
+
+
+def test_memory_bounded(tmpdir):
+    short = peaks(100, str(tmpdir))
+    long = peaks(300, str(tmpdir))
+
+    assert set(short) == set(long) == {"ansi", "ps"}
+    for name in short:
+        assert long[name] - short[name] < growth, name
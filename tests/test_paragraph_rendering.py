@@ -1,6 +1,8 @@
 from monospace.util import intersperse
 from monospace.core.domain import document as d, Settings
-from monospace.core.rendering.paragraph import align, Alignment, flatten
+from monospace.core.rendering.paragraph import (
+    align, Alignment, LineBreaking, flatten
+)
 from monospace.core.formatting import HtmlFormatter, FormatTag, Format as F
 
 
@@ -85,6 +87,73 @@ def test_plain_paragraph_rendering():
     assert align(words, Alignment.center, width) == expected_center
 
 
+def test_optimal_line_breaking():
+    text = "Companions understood is as especially pianoforte connection introduced. Nay newspaper can sportsman are admitting gentleman belonging his. Is oppose no he summer lovers twenty in. Not his difficulty boisterous surrounded bed."  # noqa
+    words = intersperse(text.split(), d.Space())
+    width = 30
+
+    # Greedy breaking leaves "newspaper" and "admitting" for the next lines
+    expected = [
+        "Companions understood is as   ",
+        "especially pianoforte connec- ",
+        "tion introduced. Nay newspa-  ",
+        "per can sportsman are admit-  ",
+        "ting gentleman belonging his. ",
+        "Is oppose no he summer lovers ",
+        "twenty in. Not his difficulty ",
+        "boisterous surrounded bed.    ",
+    ]
+
+    lines = align(words, Alignment.left, width, line_breaking=LineBreaking.optimal)  # noqa
+    assert lines == expected
+
+
+def test_optimal_line_breaking_overfull():
+    text = ["Antidisestablishmentarianism", d.Space(), "is", d.Space(), "long"]
+
+    # "tidis-" can't be broken further, and is too long
+    expected = [
+        "An-  ", "tidis-", "es-  ", "tab- ", "lish-",
+        "men- ", "tari-", "anism", "is   ", "long ",
+    ]
+
+    lines = align(text, Alignment.left, 5, line_breaking=LineBreaking.optimal)
+    assert lines == expected
+
+
+def test_optimal_line_breaking_loose():
+    # Small capitals are not hyphenated
+    text = "Configuration for ꜱᴜʙʟɪᴍᴇʟɪɴᴛᴇʀ: if you have ꜱᴜʙʟɪᴍᴇʟɪɴᴛᴇʀ-ᴄᴏɴᴛʀɪʙ-ᴍʏᴘʏ and ꜱᴜʙʟɪᴍᴇʟɪɴᴛᴇʀ-ꜰʟᴀᴋᴇ₈ installed, it will configure them to point to the virtual environment's executables."  # noqa
+    words = intersperse(text.split(), d.Space())
+
+    # No breaking is within the tolerance, but a line of only "Configura-"
+    # is still worse than a loose first line
+    lines = align(words, Alignment.justify, 66)
+    assert lines[0].split() == [
+        "Configuration", "for", "ꜱᴜʙʟɪᴍᴇʟɪɴᴛᴇʀ:", "if", "you", "have"
+    ]
+
+
+def test_justification_is_deterministic():
+    def paragraph(words):
+        return intersperse(words.split(), s())
+
+    first = paragraph(
+        "Fat new smallness few supposing suspicion two. Course sir people "
+        "worthy horses add entire suffer. How one dull get busy dare far."
+    )
+    second = paragraph(
+        "At principle perfectly by sweetness do. As mr started arrival "
+        "subject by believe. Strictly numerous outlived kindness whatever."
+    )
+
+    alone = align(first, Alignment.justify, 30)
+    align(second, Alignment.justify, 30)
+
+    assert align(first, Alignment.justify, 30) == alone
+    assert all(len(line) == 30 for line in alone)
+
+
 def test_styled_paragraph_rendering():
     text = [
         "Yet", s(), "bed", s(),
@@ -0,0 +1,99 @@
+import json
+import pytest
+
+from monospace.core import cache
+from monospace.core.parse import headers, parse, parse_chunks, split_chapters
+from monospace.core.parsing import pandoc
+
+
+def has_pandoc():
+    try:
+        pandoc.version()
+        return True
+    except OSError:
+        return False
+
+
+def test_split_chapters():
+    source = "\n".join([
+        "---",
+        "# A YAML comment",
+        "...",
+        "",
+        "# Chapter 1",
+        "",
+        "```bash",
+        "# A shell comment",
+        "```",
+        "",
+        ":::: Aside",
+        "# Not a chapter",
+        "::::",
+        "",
+        "Chapter 2",
+        "=========",
+        "",
+        "## Sub-chapter",
+        "",
+        "# Chapter 3",
+        "",
+    ])
+
+    chunks = split_chapters(source)
+
+    assert "".join(chunks) == source
+    assert [chunk.splitlines()[0] for chunk in chunks] == [
+        "---", "# Chapter 1", "Chapter 2", "# Chapter 3"
+    ]
+
+
+def test_split_chapters_with_definitions():
+    source = "# Chapter 1\n\nSee [this][1].\n\n# Chapter 2\n\n[1]: foo.md\n"
+    assert split_chapters(source) == [source]
+
+
+def test_split_chapters_with_links():
+    # Inline links are not links to headers by their title
+    source = "# Chapter 1\n\nSee [Chapter 2](#chapter-2).\n\n# Chapter 2\n"
+    assert len(split_chapters(source)) == 2
+
+
+@pytest.mark.skipif(not has_pandoc(), reason="Needs Pandoc")
+@pytest.mark.parametrize("source", [
+    "# Chapter One\n\nSee [Chapter\nTwo].\n\n# Chapter Two\n\nText.\n",
+    "# Chapter One\n\n(@) First.\n\n# Chapter Two\n\n(@) Second.\n",
+], ids=["header reference", "example list"])
+def test_parse_like_whole_source(tmpdir, source):
+    cache.configure(root=str(tmpdir))
+    book = tmpdir.join("book.md")
+    book.write(source)
+
+    expected = json.loads(pandoc.convert(source, "markdown", "json"))
+    assert parse(str(book))["blocks"] == expected["blocks"]
+
+
+def test_parse_chunks(tmpdir):
+    source = tmpdir.join("book.md")
+    source.write("\n".join([
+        "---",
+        "title: Book",
+        "...",
+        "",
+        "# Chapter 1",
+        "",
+        "## Intro",
+        "",
+        "# Chapter 2",
+        "",
+        "## Intro",
+        "",
+    ]))
+
+    chunks = list(parse_chunks(str(source), parser="python"))
+    assert len(chunks) == 3
+    assert "title" in chunks[0]["meta"]
+
+    identifiers = [header["c"][1][0] for header in headers(
+        [block for chunk in chunks for block in chunk["blocks"]]
+    )]
+    assert identifiers == ["chapter-1", "intro", "chapter-2", "intro-1"]
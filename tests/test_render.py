@@ -0,0 +1,182 @@
+import os
+import re
+import shutil
+from concurrent.futures import Executor, Future
+
+from monospace.core import cache
+from monospace.core.domain import document as d, Settings
+from monospace.core.formatting import AnsiFormatter, PdfFormatter,\
+                                      PostScriptFormatter
+from monospace.core.formatting.pdf import encode
+from monospace.core.formatting.postscript import font_files
+from monospace.core.render import Renderer, render
+from monospace.core.rendering import images
+
+
+def test_render_cached(tmpdir, monkeypatch):
+    cache.configure(root=str(tmpdir))
+    settings = Settings.from_meta({}, "book.md")
+    elements = [
+        d.Paragraph(d.Text(["Hello"])),
+        d.Chapter(d.Text(["Chapter"]), identifier="chapter"),
+        d.Paragraph(d.Text(["World"])),
+    ]
+
+    blocks = list(render(elements, settings, {}, formatter=AnsiFormatter))
+
+    rendered = []
+    render_element = Renderer.render_element
+
+    def counting_render_element(self, element):
+        rendered.append(element)
+        return render_element(self, element)
+
+    monkeypatch.setattr(Renderer, "render_element", counting_render_element)
+
+    assert list(render(elements, settings, {}, AnsiFormatter)) == blocks
+    assert rendered == []
+
+    # Only the edited paragraph is rendered again
+    elements[2] = d.Paragraph(d.Text(["Edited"]))
+    list(render(elements, settings, {}, formatter=AnsiFormatter))
+    assert rendered == [elements[2]]
+
+
+def test_render_parallel():
+    cache.configure(enable=False)
+    settings = Settings.from_meta({}, "book.md")
+    elements = [
+        d.Chapter(d.Text(["Chapter %d" % i]), identifier="chapter-%d" % i)
+        if i % 3 == 0 else d.Paragraph(d.Text(["Paragraph %d" % i]))
+        for i in range(12)
+    ]
+
+    sequential = list(render(elements, settings, {}, AnsiFormatter))
+    parallel = list(render(elements, settings, {}, AnsiFormatter, jobs=2))
+
+    assert parallel == sequential
+
+
+def test_render_highlighted_ahead():
+    cache.configure(enable=False)
+    settings = Settings.from_meta({}, "book.md")
+    # A single chapter, whose code blocks are highlighted by other processes
+    elements = [
+        d.CodeBlock(language="python", code="x = %d" % i)
+        if i % 2 else d.Paragraph(d.Text(["Paragraph %d" % i]))
+        for i in range(8)
+    ]
+
+    sequential = list(render(elements, settings, {}, AnsiFormatter))
+    parallel = list(render(elements, settings, {}, AnsiFormatter, jobs=2))
+
+    assert parallel == sequential
+
+
+class InlineExecutor(Executor):
+    """Runs tasks as they are submitted, keeping their arguments."""
+
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, fn, *args, **kwargs):
+        self.submitted.append(args)
+        future = Future()
+        future.set_result(fn(*args, **kwargs))
+        return future
+
+
+def test_render_nested_highlighted_ahead():
+    cache.configure(enable=False)
+    settings = Settings.from_meta({}, "book.md")
+    # Code blocks in lists and asides are narrower than the others
+    code = d.CodeBlock(language="python", code="x = 1")
+    elements = [
+        code,
+        d.UnorderedList([[d.Paragraph(d.Text(["Item"])), code]]),
+        d.Aside([d.OrderedList([[code]])]),
+    ]
+
+    sequential = list(render(elements, settings, {}, AnsiFormatter))
+    executor = InlineExecutor()
+    renderer = Renderer(
+        settings, {}, AnsiFormatter, cached=True, highlighter=executor
+    )
+    ahead = list(renderer.render_elements(elements))
+
+    assert ahead == sequential
+    assert [args[1].main_width for args in executor.submitted] == [
+        settings.main_width,
+        settings.main_width - settings.tab_size,
+        settings.main_width - 3 * settings.tab_size,
+    ]
+
+
+def test_render_pdf_code_background():
+    cache.configure(enable=False)
+    settings = Settings.from_meta({}, "book.md")
+    renderer = Renderer(settings, {}, formatter=PdfFormatter)
+
+    lines = [
+        line
+        for block in renderer.render_element(
+            d.CodeBlock(language="python", code="x = 1")
+        )
+        for line in block.main
+    ]
+    page = PdfFormatter.format_page(lines, settings)
+    content = encode(page, {selection: {} for selection in font_files})
+
+    # The background is opened by the indentation, before the code
+    assert "/bx" in content
+    assert " bg" not in content
+
+
+def test_render_pdf_ordered_list():
+    cache.configure(enable=False)
+    settings = Settings.from_meta({}, "book.md")
+    ordered_list = d.OrderedList([
+        [d.Paragraph(d.Text(["word " * 40]))],
+        [d.Paragraph(d.Text(["word " * 40]))],
+    ])
+
+    def text(formatter):
+        """Returns the strings shown by each line, without operators."""
+        renderer = Renderer(settings, {}, formatter=formatter)
+        return [
+            "".join(re.findall(r"\((.*?)\)", line))
+            for block in renderer.render_element(ordered_list)
+            for line in block.main
+        ]
+
+    postscript = text(PostScriptFormatter)
+    assert postscript[0].startswith("⓪   word")
+    assert text(PdfFormatter) == postscript
+
+
+def test_render_image_cached(tmpdir, monkeypatch):
+    cache.configure(root=str(tmpdir.join("cache")))
+    settings = Settings.from_meta({}, str(tmpdir.join("book.md")))
+    resources = os.path.join(os.path.dirname(__file__), "..", "resources")
+    lenna = os.path.join(resources, "lenna.png")
+    shutil.copy(lenna, str(tmpdir.join("a.png")))
+    renderer = Renderer(settings, {}, formatter=AnsiFormatter)
+
+    block = renderer.render_image(d.Image("a.png"))
+
+    converted = []
+    ansify = images.ansify
+
+    def counting_ansify(uri, *args, **kwargs):
+        converted.append(os.path.basename(uri))
+        return ansify(uri, *args, **kwargs)
+
+    monkeypatch.setattr(images, "ansify", counting_ansify)
+
+    # Images are found by content, even under another name
+    shutil.copy(str(tmpdir.join("a.png")), str(tmpdir.join("b.png")))
+    assert renderer.render_image(d.Image("b.png")) == block
+    assert converted == []
+
+    renderer.render_image(d.Image("b.png", mode="Blocks"))
+    assert converted == ["b.png"]